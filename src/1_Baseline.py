@@ -2,12 +2,84 @@ from frontend import (PageConfig,
                     Header,
                     OrdersReader,
                     DateInputs,
+                    HistoryInputs,
                     MessageDisplay,
-                    ResultDisplay
+                    ResultDisplay,
+                    SessionInfo
                     )
 
 from backend import DataProcessor, DateUtils
+from cache import StageCache, content_hash
+from frame_store import shared_frame_store
+from history_store import HistoryStore
+from jobs import shared_runner
 
+import streamlit as st
+
+
+def baseline_pipeline(instrumentation, stage_cache, frame_store, upload_orders_history, file_hash, history_store, usar_historico_salvo,
+                      start_date, end_date, delivery_date, incluir_mes_seguinte, max_erros=None):
+    # Roda no JobRunner, fora da thread do streamlit: só DataProcessor, caches e histórico salvo
+    data_processor = DataProcessor()
+    log_callback = instrumentation.log
+
+    if upload_orders_history is not None:
+        # O histórico validado fica uma única vez no processo, compartilhado com as outras sessões;
+        # as etapas seguintes ficam no cache da sessão, pelo hash e pelos parâmetros de que dependem,
+        # então mudar o mês seguinte ou a data de entrega só recalcula as etapas posteriores.
+        # Só as linhas da janela são acumuladas na leitura; acrescentado ao histórico salvo, o arquivo
+        # entra inteiro. max_erros para a leitura assim que houver tantas linhas inválidas
+        janela_leitura = (None, None) if usar_historico_salvo else (start_date, end_date)
+        df, result, errors = frame_store.get_or_load(
+            "historico", (file_hash, *janela_leitura, max_erros),
+            lambda: instrumentation.run(
+                "process_history_orders", data_processor.process_history_orders, upload_orders_history, log_callback,
+                start_date=janela_leitura[0], end_date=janela_leitura[1], max_errors=max_erros
+            )
+        )
+        if errors:
+            return result, errors, None
+        if usar_historico_salvo:
+            # O upload é acrescentado às semanas do histórico salvo, sem regravar as demais
+            stage_cache.get_or_compute("gravacao", (file_hash,), lambda: history_store.append(df, log_callback))
+            fonte, chave_fonte = history_store, history_store.fingerprint()
+        else:
+            fonte, chave_fonte = df, file_hash
+    else:
+        result, errors = True, []
+        fonte, chave_fonte = history_store, history_store.fingerprint()
+
+    janela = (chave_fonte, start_date, end_date)
+
+    df_filtered = stage_cache.get_or_compute(
+        "enriquecido", janela,
+        lambda: instrumentation.run(
+            "order_data_enricher", data_processor.order_data_enricher,
+            instrumentation.run("filter_dataframe", data_processor.filter_dataframe, fonte, start_date, end_date)
+        )
+    )
+    pracas_permitidas = stage_cache.get_or_compute(
+        "pracas_permitidas", janela,
+        lambda: instrumentation.run("allowed_squares", data_processor.allowed_squares, end_date, df_filtered.copy())
+    )
+
+    dias_previsao = DateUtils.generate_dates_until_end_of_month(delivery_date, incluir_mes_seguinte)
+
+    medianas = stage_cache.get_or_compute(
+        "medianas", janela,
+        lambda: instrumentation.run(
+            "calculate_central_tendency", data_processor.calculate_central_tendency,
+            df_filtered, ["var_lw", "qtd_pedido"], "median"
+        )
+    )
+
+    baseline = instrumentation.run("clip_growth_and_merge", data_processor.clip_growth_and_merge, medianas)
+
+    baseline = instrumentation.run("create_baseline_forecast", data_processor.create_baseline_forecast, dias_previsao, baseline)
+
+    final_baseline = instrumentation.run("baseline_output", data_processor.baseline_output, baseline, pracas_permitidas)
+
+    return result, errors, final_baseline
 
 
 def main():
@@ -15,48 +87,65 @@ def main():
     page_config = PageConfig()
     header = Header()
     header.display_header()
-    orders_reader = OrdersReader()
+    orders_reader = OrdersReader(file_types=["xlsx", "csv", "parquet"])
     start_date = DateInputs.data_inicial()
     end_date = DateInputs.data_final()
     delivery_date = DateInputs.data_entrega_demanda()
     incluir_mes_seguinte = DateInputs.mes_seguinte()
+    try:
+        history_store, historico_indisponivel = HistoryStore(), None
+    except ValueError as e:
+        history_store, historico_indisponivel = None, str(e)
+    usar_historico_salvo = HistoryInputs.usar_historico_salvo(historico_indisponivel)
+    max_erros = HistoryInputs.max_erros()
     message_display = MessageDisplay()
     result_display = ResultDisplay()
-    data_processor = DataProcessor()
-    date_utils = DateUtils()
+    runner = shared_runner()
+    session_id = SessionInfo.session_id("baseline")
  
     
     upload_orders_history = orders_reader.upload_file("Carregue o arquivo excel com o histórico de Pedidos aqui! (`historico_pedidos.xlsx`)")
 
+    stage_cache = st.session_state.setdefault("stage_cache", StageCache())
 
-    errors = []
+    # O job é identificado pelas entradas: a mesma combinação, desta ou de outra sessão,
+    # reaproveita o job em andamento ou já concluído; entradas novas cancelam o anterior
     if upload_orders_history:
-        message_display.display_processing_message()
-
-        def log_callback(message):
-             message_display.update_processing_message(message)
-
-        df, result, errors = data_processor.process_history_orders(upload_orders_history, log_callback)
-
-        df_filtered = data_processor.filter_dataframe(df, start_date, end_date)
-        df_filtered = data_processor.order_data_enricher(df_filtered)
-        pracas_permitidas = data_processor.allowed_squares(end_date, df_filtered)
-
-        dias_previsao = date_utils.generate_dates_until_end_of_month(delivery_date, incluir_mes_seguinte)
-
-        lista_medianas = data_processor.calculate_central_tendency(df_filtered, ["var_lw", "qtd_pedido"],"median")
-
-        baseline = data_processor.clip_growth_and_merge(lista_medianas)
-
-        baseline = data_processor.create_baseline_forecast(dias_previsao,baseline)
-
-        final_baseline = data_processor.baseline_output(baseline, pracas_permitidas)
-
-        result_display.display_baseline_results(result, errors, df=final_baseline)
+        file_hash = content_hash(upload_orders_history)
+        chave = ("baseline", file_hash, usar_historico_salvo, start_date, end_date, delivery_date, incluir_mes_seguinte, max_erros)
+    elif usar_historico_salvo and not history_store.is_empty():
+        file_hash = None
+        chave = ("baseline", history_store.fingerprint(), True, start_date, end_date, delivery_date, incluir_mes_seguinte)
+    else:
+        runner.cancel(session_id)
+        return
+
+    job = runner.submit(
+        session_id, chave, baseline_pipeline, stage_cache, shared_frame_store(), upload_orders_history or None, file_hash, history_store,
+        usar_historico_salvo, start_date, end_date, delivery_date, incluir_mes_seguinte, max_erros
+    )
+    if not job.done() and message_display.cancel_button():
+        runner.cancel(session_id)
+        st.info("Processamento cancelado.")
+        return
+
+    message_display.display_processing_message()
+    message_display.display_stage_timings()
+    resultado = message_display.follow_job(job)
+    if resultado is None:
+        return
+
+    result, errors, final_baseline = resultado
+    result_display.display_baseline_results(result, errors, df=final_baseline)
+
+    message_display.display_shared_cache_stats(shared_frame_store().stats())
+
+    if job.instrumentation.spans:
+        message_display.display_timings_export(job.instrumentation)
 
     if errors:
             message_display.display_wrong_message()
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,10 +1,15 @@
 import pandas as pd
 import numpy as np
 from contrato import Orders
-from collections import defaultdict
+from validation import OrdersValidator, ValidationErrors
+from loaders import get_loader
+from history_store import HistoryStore
+from schema import apply_schema
+from baseline_matrix import BaselineMatrix
+from reconciliation import ReconciliationError, reconcile
 from datetime import datetime, timedelta, date
-from typing import Literal
-import streamlit as st
+
+EMPTY_WINDOW = "Nenhum pedido no histórico entre a data inicial e a data final escolhidas."
 
 class DataProcessor:
     def __init__(self):
@@ -14,49 +19,92 @@ class DataProcessor:
         if log_callback:
             log_callback("Espere um momento...")
         try:
-            df = pd.read_excel(uploaded_file)
+            df = get_loader(uploaded_file).load(uploaded_file)
             if log_callback:
                 log_callback("Arquivo carregado com sucesso.")
             return df, None
         except Exception as e:
             return pd.DataFrame(), f"Erro inesperado ao carregar o arquivo: {str(e)}"
 
-    def process_history_orders(self, uploaded_file, log_callback=None):
-        df, error = self._load_file(uploaded_file, log_callback)
-        if error:
-            return df, error
-
-        errors = []
-        extra_cols = set(df.columns) - set(Orders.model_fields.keys())
-        if extra_cols:
-            return False, f"Colunas extras detectadas no Excel: {', '.join(extra_cols)}"
+    def _iter_file_chunks(self, uploaded_file, log_callback, chunksize=50_000):
+        # Lê o arquivo em blocos de linhas, informando o progresso pelo log_callback
+        loader = get_loader(uploaded_file)
+        total = loader.count_rows(uploaded_file)
+        lidas = 0
+        for chunk in loader.iter_chunks(uploaded_file, chunksize):
+            # Mantém o índice contínuo para que index + 2 continue apontando para a linha do Excel
+            chunk.index = pd.RangeIndex(lidas, lidas + len(chunk))
+            lidas += len(chunk)
+            if log_callback:
+                log_callback(f"Linhas lidas: {lidas}" + (f" de {total}" if total else ""))
+            yield chunk
 
+    def process_history_orders(self, uploaded_file, log_callback=None, strict=False, start_date=None, end_date=None, chunksize=50_000, max_errors=None):
         if log_callback:
-            log_callback("Validando linhas do arquivo...")
-        for index, row in df.iterrows():
-            try:
-                _ = Orders(**row.to_dict())
-            except Exception as e:
-                errors.append(f"Erro na linha {index + 2}: {e}")
+            log_callback("Espere um momento...")
+
+        # strict=True valida linha a linha pelo pydantic (lento, usado para conferir paridade).
+        # max_errors para a leitura assim que houver tantas linhas inválidas (1 = parar no primeiro erro)
+        validator = OrdersValidator(Orders)
+        errors = ValidationErrors()
+        blocos = []
+        try:
+            for chunk in self._iter_file_chunks(uploaded_file, log_callback, chunksize):
+                extra_cols = set(chunk.columns) - set(Orders.model_fields.keys())
+                if extra_cols:
+                    return pd.DataFrame(), False, ValidationErrors(messages=[f"Colunas extras detectadas no Excel: {', '.join(extra_cols)}"])
+
+                restantes = None if max_errors is None else max_errors - errors.rows
+                errors.extend(validator.validate_strict(chunk) if strict else validator.validate(chunk, restantes))
+                if max_errors is not None and (errors.rows >= max_errors or errors.messages):
+                    if log_callback:
+                        log_callback(f"Validação interrompida após {errors.rows} linhas com erro.")
+                    errors.truncated = True
+                    break
+
+                # Com erros o resultado não será usado; segue apenas validando os próximos blocos
+                if errors:
+                    continue
+                # As datas aceitas pela validação (inclusive timestamps unix) viram datetime64
+                chunk["data_entrega"] = OrdersValidator.parse_datetime(chunk["data_entrega"])
+                if start_date is not None and end_date is not None:
+                    # Linhas fora da janela de datas são descartadas antes de acumular o bloco
+                    chunk = self.filter_dataframe(chunk, start_date, end_date)
+                blocos.append(chunk)
+        except Exception as e:
+            return pd.DataFrame(), False, ValidationErrors(messages=[f"Erro inesperado ao carregar o arquivo: {str(e)}"])
+
+        df = pd.concat(blocos, ignore_index=True) if blocos else pd.DataFrame(columns=list(Orders.model_fields.keys()))
+        if not errors:
+            df = apply_schema(df)
 
         if log_callback:
             log_callback("Validação concluída.")
         return df, True, errors
     
     def process_top_forecasting_file(self, uploaded_file, log_callback=None):
-            df, error = self._load_file(uploaded_file, log_callback)
-            if error:
-                return df, error
-
-            if df.shape[0] != 22:
-                return False, f"O número de linhas no arquivo deve ser 22, mas o arquivo possui {df.shape[0]} linhas."
-   
-            return df, True, []
+        df, error = self._load_file(uploaded_file, log_callback)
+        if error:
+            return pd.DataFrame(), False, [error]
+
+        # A estrutura é conferida pelos blocos (nome da origem + cabeçalho MODAL), e não por um número
+        # fixo de linhas: a planilha pode ter quantas origens e modais forem necessários
+        try:
+            blocos = FixingTopForecastingFile(df).find_blocks()
+        except ValueError as e:
+            return pd.DataFrame(), False, [str(e)]
+        vazios = blocos.loc[blocos["fim"] - blocos["cabecalho"] <= 1, "ORIGEM"].tolist()
+        if vazios:
+            return pd.DataFrame(), False, [f"Blocos de previsão sem nenhum modal: {', '.join(vazios)}"]
+
+        if log_callback:
+            log_callback(f"Previsão top com {len(blocos)} origens: {', '.join(blocos['ORIGEM'])}.")
+        return df, True, []
     
     def process_adjusted_baseline(self, uploaded_file, log_callback=None):
         df, error = self._load_file(uploaded_file, log_callback)
         if error:
-            return df, error
+            return pd.DataFrame(), False, [error]
 
         errors = []
 
@@ -79,36 +127,44 @@ class DataProcessor:
 
         
     @staticmethod
-    def filter_dataframe(df: pd.DataFrame, start_date: datetime.date, end_date: datetime.date) -> pd.DataFrame:
+    def filter_dataframe(df: pd.DataFrame | HistoryStore, start_date: datetime.date, end_date: datetime.date) -> pd.DataFrame:
+        if isinstance(df, HistoryStore):
+            # Lê apenas as partições semanais da janela, com o filtro de datas aplicado na leitura
+            return df.read(start_date, end_date)
         df['data_entrega'] = pd.to_datetime(df['data_entrega'], format='%Y-%m-%d')
         filtered_df = df[(df['data_entrega'] >= pd.Timestamp(start_date)) & (df['data_entrega'] <= pd.Timestamp(end_date))].reset_index(drop=True)
         return filtered_df
     
     @staticmethod
-    def order_data_enricher(df: pd.DataFrame) -> pd.DataFrame:
+    def order_data_enricher(df: pd.DataFrame, max_week: int | None = None, lag: int = 7) -> pd.DataFrame:
         df["ano"] = df["data_entrega"].dt.year
         df["dds"] = df["data_entrega"].dt.weekday
         df["mes"] = df["data_entrega"].dt.month
         df["semana"] = df["data_entrega"].dt.isocalendar().week
         df["ano_semana"] = df["ano"] * 100 + df["semana"]
+        df = apply_schema(df)
         df = df.sort_values(by=['data_entrega','ano', 'mes', 'semana', 'modal', 'logistic_region', 'shift', 'turno_g'])
-        df['qtd_pedido_lw'] = df.groupby(['modal', 'big_region', 'logistic_region', 'shift', 'turno_g'], observed=False)['qtd_pedido'].shift(7)
+        df['qtd_pedido_lw'] = df.groupby(['modal', 'big_region', 'logistic_region', 'shift', 'turno_g'], observed=False)['qtd_pedido'].shift(lag)
         df["var_lw"] = (df["qtd_pedido"] / df["qtd_pedido_lw"] - 1).round(4).fillna(0)
-        max_week = int(df["ano_semana"].max())
+        # Em execuções particionadas, max_week vem do histórico inteiro e não só da partição
+        if max_week is None:
+            if df.empty:
+                raise ValueError(EMPTY_WINDOW)
+            max_week = int(df["ano_semana"].max())
         df = df.query(f"ano_semana < {max_week}").copy()
         df["qtd_pedido_lw"] = df["qtd_pedido_lw"].fillna(0)
         return df
 
     @staticmethod
-    def allowed_squares(end_date: date, df_filtrado):
+    def allowed_squares(end_date: date, df_filtrado, weeks: int = 6):
 
         df_filtrado['data_entrega'] = pd.to_datetime(df_filtrado['data_entrega']).dt.date
 
-        seis_semanas = timedelta(weeks=6)
+        janela = timedelta(weeks=weeks)
 
         allowed_squares = (
             df_filtrado[
-                (df_filtrado["data_entrega"] >= (end_date - seis_semanas)) &
+                (df_filtrado["data_entrega"] >= (end_date - janela)) &
                 (df_filtrado["data_entrega"] <= end_date)
             ]
             [["modal", "logistic_region"]].drop_duplicates()
@@ -117,81 +173,46 @@ class DataProcessor:
         return allowed_squares
     
     @staticmethod
-    def calculate_central_tendency(df: pd.DataFrame, cols_to_calc: list, type: Literal["median", "mean"] = "median") -> pd.DataFrame:
-    
-        lista_medidas = []
-        for col in cols_to_calc:
-            new_col_name = f"{type}_{col}"
-            # Supondo que df_filtrado seja um DataFrame pandas
-            data = df.to_dict('records')  # Converte o DataFrame para uma lista de dicionários
-
-            # Preencher valores NaN com 0
-            for entry in data:
-                entry[col] = 0 if pd.isna(entry[col]) else entry[col]
-
-            # Agrupar os dados
-            grouped_data = defaultdict(list)
-            for entry in data:
-                key = (entry['modal'], entry['big_region'], entry['logistic_region'], entry['shift'], entry['turno_g'], entry["dds"])
-                grouped_data[key].append(entry[col])
-
-            # Calcular a mediana para cada combinação
-            medida = {}
-            for key, values in grouped_data.items():
-                if type == "median":
-                    central_tendency = np.median(values)
-                    medida[key] = central_tendency
-                elif type == "mean":
-                    central_tendency = np.mean(values)
-                    medida[key] = central_tendency 
-
-            # Criar DataFrame a partir do dicionário de medidas
-            df_medidas = pd.DataFrame(
-                [{'modal': key[0], 'big_region': key[1], 'logistic_region': key[2], 'shift': key[3], 'turno_g': key[4], 'dds': key[5],new_col_name: central_tendency}
-                for key, central_tendency in medida.items()]
-            )
-            lista_medidas.append(df_medidas)
-
-        if type == "median":
-            return lista_medidas
-        elif type == "mean":
-            return pd.concat(lista_medidas, ignore_index=True)
-    
-    @staticmethod
-    def clip_growth_and_merge(lista_medianas: list) -> pd.DataFrame:
-        start_df = []
-        for lista in lista_medianas:
-            df = pd.DataFrame(lista)
-            if "median_var_lw" in df.columns:
-                df["median_var_lw"] = np.clip(df["median_var_lw"], -0.1, 1.3)
+    def calculate_central_tendency(df: pd.DataFrame, cols_to_calc: list, type: str | list = "median") -> pd.DataFrame:
+        # type aceita "median", "mean", quantis no formato "q90" (percentil 90) ou uma lista deles
+        estatisticas = [type] if isinstance(type, str) else list(type)
+        chaves = ['modal', 'big_region', 'logistic_region', 'shift', 'turno_g', 'dds']
+
+        # Uma única agregação agrupada na granularidade das seis chaves, com NaN tratado como 0
+        agrupado = (
+            df[cols_to_calc]
+            .fillna(0)
+            .groupby([df[chave] for chave in chaves], sort=False, dropna=False, observed=True)
+        )
 
-            start_df.append(df)
-        final_df = start_df[0].merge(start_df[1], on=["big_region", "logistic_region","modal" ,"shift", "turno_g", "dds"], how='left')
+        medidas = {}
+        for estatistica in estatisticas:
+            if estatistica in ("median", "mean"):
+                resultado = agrupado.agg(estatistica)
+            elif estatistica.startswith("q") and estatistica[1:].isdigit():
+                resultado = agrupado.quantile(int(estatistica[1:]) / 100)
+            else:
+                raise ValueError(f"Medida de tendência central não suportada: {estatistica}")
+            for col in cols_to_calc:
+                medidas[f"{estatistica}_{col}"] = resultado[col]
 
-        final_df["orders"] = (final_df["median_qtd_pedido"] * (1 + final_df["median_var_lw"])).round(0)
+        return pd.DataFrame(medidas).reset_index()
+
+    @staticmethod
+    def clip_growth_and_merge(medidas: pd.DataFrame, bounds: tuple = (-0.1, 1.3), statistic: str = "median") -> pd.DataFrame:
+        # statistic escolhe quais colunas de calculate_central_tendency entram no baseline
+        final_df = medidas.copy()
+        final_df[f"{statistic}_var_lw"] = np.clip(final_df[f"{statistic}_var_lw"], *bounds)
+
+        final_df["orders"] = (final_df[f"{statistic}_qtd_pedido"] * (1 + final_df[f"{statistic}_var_lw"])).round(0)
 
         return final_df
     
     
     @staticmethod
     def create_baseline_forecast(dias_previsao: list, baseline: pd.DataFrame):
-
-        baseline_por_praca = dias_previsao.merge(baseline, on="dds", how='right').sort_values(by="data_entrega").reset_index(drop=True)
-        baseline_por_praca["data_entrega"] = baseline_por_praca["data_entrega"].dt.date
-
-        baseline_por_praca = (
-            baseline_por_praca
-            .pivot_table(
-                index=["big_region", "logistic_region", "modal", "shift", "turno_g"],
-                columns="data_entrega",
-                values="orders",
-                aggfunc='sum',
-                fill_value=0
-            )
-            .reset_index()
-            .sort_values(by="logistic_region")
-        )
-        return baseline_por_praca
+        # Medianas por dds espalhadas pelas datas numa matriz chave x data, sem merge nem pivot
+        return BaselineMatrix.from_medians(baseline, dias_previsao).to_wide()
     
     @staticmethod
     def baseline_output(baseline_por_praca: pd.DataFrame, allowed_squares: pd.DataFrame) -> pd.DataFrame:
@@ -201,181 +222,218 @@ class DataProcessor:
         return baseline_por_praca
     
     @staticmethod
-    def melting_baseline_adjusted(baseline_adjusted: pd.DataFrame) -> pd.DataFrame:
-        df = pd.melt(baseline_adjusted, id_vars=['big_region','logistic_region','modal','shift','turno_g'],                     
-                    var_name='data_entrega', value_name='qtd_pedidos')
+    def melting_baseline_adjusted(baseline_adjusted: pd.DataFrame, log_callback=None) -> pd.DataFrame:
+        # A planilha larga vira a matriz chave x data, lida data a data como no pd.melt
+        df = BaselineMatrix.from_wide(baseline_adjusted).to_long(value_name='qtd_pedidos')
 
         df['qtd_pedidos'] = df['qtd_pedidos'].fillna(0).astype(int)
+        df = apply_schema(df)
 
-        df['data_entrega'] = pd.to_datetime(df['data_entrega'])
-
-        print(df.dtypes)
+        if log_callback:
+            log_callback(f"Baseline ajustado convertido para linhas: {df.shape[0]} linhas, {df.shape[1]} colunas.")
         return df
     
     @staticmethod
-    def process_region_data(baseline_pd, fct_brasil, quebras, group_col):
-        lista_resultados = []
-
-        regions_to_exclude = [region for region in quebras if region != "BRASIL_SEM_PRACA"]
-
-        for quebra in quebras:
-            if quebra == "BRASIL_SEM_PRACA":
-                filter_query = f"logistic_region not in {regions_to_exclude}"
-            else:
-                filter_query = f"logistic_region == '{quebra}'"
-
-            consolidar = (
-                baseline_pd
-                    .query(filter_query)
-                    .groupby(["data_entrega", "big_region", "logistic_region", "modal", group_col])
-                    ['qtd_pedidos'].sum().reset_index()
-            )
-
-
-            consolidar['fake_total_orders'] = consolidar.groupby(["data_entrega", "modal"])['qtd_pedidos'].transform('sum')
-            consolidar['share'] = consolidar['qtd_pedidos'] / consolidar['fake_total_orders']
-
-            base_final = consolidar.merge(fct_brasil.query(f"ORIGEM == '{quebra}'"), on=['data_entrega', 'modal'], how='left')
-            print(base_final.shape)
-            base_final = base_final.loc[~base_final['planned_orders'].isna()]
-            print(base_final.shape)
-            base_final['final_orders'] = base_final['share'] * base_final['planned_orders']
-            base_final = base_final.query("final_orders > 0")
-
-            base_final = base_final[["data_entrega", "big_region", "modal", "logistic_region", group_col, "final_orders"]]
-            base_final = base_final.rename(columns={
-                "data_entrega": "date", 
-                "big_region": "region", 
-                "modal": "business_model", 
-                "final_orders": "orders"
-            }).sort_values(by=["date", "business_model"]).reset_index(drop=True)
+    def consolidate_region_data(baseline_pd, fct_brasil, quebras, group_cols=("shift", "turno_g")):
+        # fct_brasil é o formato longo de FixingTopForecastingFile.process_all ou um TopForecastLookup já montado
+        # Cada linha recebe a origem da previsão: a própria praça, se tiver previsão, ou BRASIL_SEM_PRACA
+        pracas = [quebra for quebra in quebras if quebra != "BRASIL_SEM_PRACA"]
+        logistic_region = baseline_pd["logistic_region"].astype(object)
+        origem = logistic_region.where(logistic_region.isin(pracas), "BRASIL_SEM_PRACA")
+        ordem_origem = origem.map({quebra: i for i, quebra in enumerate(quebras)})
+        manter = ordem_origem.notna().to_numpy()
+
+        base = apply_schema(baseline_pd.loc[manter, ["data_entrega", "big_region", "logistic_region", "modal", "qtd_pedidos"]])
+        base["ordem_origem"] = ordem_origem[manter].astype("int8")
+
+        # As quebras (shift, turno_g) são empilhadas com as mesmas categorias para que uma única
+        # agregação atenda todas
+        categorias = sorted(set().union(*(baseline_pd.loc[manter, col].dropna().unique() for col in group_cols)))
+        empilhado = pd.concat(
+            [
+                base.assign(
+                    ordem_tipo=np.int8(i),
+                    shift=pd.Categorical(baseline_pd.loc[manter, group_col], categories=categorias)
+                )
+                for i, group_col in enumerate(group_cols)
+            ],
+            ignore_index=True,
+        )
 
-            tipo = "gerencial" if group_col == "shift" else "turno_g"
-            base_final["tipo"] = tipo
-            
-            lista_resultados.append(base_final)
+        # A ordem das chaves já é a ordem final: quebra, origem na ordem de quebras, data e modal
+        chaves = ["ordem_tipo", "ordem_origem", "data_entrega", "modal", "big_region", "logistic_region", "shift"]
+        consolidar = empilhado.groupby(chaves, observed=True)['qtd_pedidos'].sum().reset_index()
 
-        df_final = pd.concat(lista_resultados, ignore_index=True)
-        print(df_final.shape)
-        return df_final
-    
-    @staticmethod
-    def final_validation(base_final_shift, base_final_turno_g):
-        validacao_gerencial = (
-        base_final_shift
-            .groupby(["logistic_region", "date"])
-            ['orders'].sum().reset_index()
+        consolidar['fake_total_orders'] = (
+            consolidar.groupby(["ordem_tipo", "ordem_origem", "data_entrega", "modal"], observed=True)['qtd_pedidos'].transform('sum')
         )
-
-        validacao_turno_g = (
-        base_final_turno_g
-            .groupby(["logistic_region", "date"])
-            ['orders'].sum().reset_index()
+        consolidar['share'] = consolidar['qtd_pedidos'] / consolidar['fake_total_orders']
+
+        # planned_orders consultado por posição no array da previsão; sem previsão, a linha sai
+        lookup = fct_brasil if isinstance(fct_brasil, TopForecastLookup) else TopForecastLookup(fct_brasil)
+        origem = pd.Series(pd.Categorical.from_codes(consolidar["ordem_origem"].to_numpy(), categories=quebras))
+        planned_orders = lookup.get(origem, consolidar["modal"], consolidar["data_entrega"])
+        com_previsao = ~np.isnan(planned_orders)
+        base_final = consolidar.loc[com_previsao].reset_index(drop=True)
+        base_final['planned_orders'] = planned_orders[com_previsao]
+        base_final['final_orders'] = base_final['share'] * base_final['planned_orders']
+        base_final = base_final.loc[base_final["final_orders"] > 0]
+
+        tipos = ["gerencial" if group_col == "shift" else group_col for group_col in group_cols]
+        base_final["tipo"] = base_final["ordem_tipo"].map(dict(enumerate(tipos)))
+
+        df_final = (
+            base_final[["data_entrega", "big_region", "modal", "logistic_region", "shift", "final_orders", "tipo"]]
+            .rename(columns={
+                "data_entrega": "date",
+                "big_region": "region",
+                "modal": "business_model",
+                "final_orders": "orders"
+            })
+            .reset_index(drop=True)
         )
+        return df_final
 
-        validacao_final = validacao_gerencial.merge(validacao_turno_g, on=['logistic_region', 'date'], how='left')
-
-        validacao_final['diff'] = validacao_final['orders_x'].round(5) - validacao_final['orders_y'].round(5)
+    @staticmethod
+    def process_region_data(baseline_pd, fct_brasil, quebras, group_col):
+        df_final = DataProcessor.consolidate_region_data(baseline_pd, fct_brasil, quebras, group_cols=(group_col,))
+        return df_final.rename(columns={"shift": group_col})
 
-        teste_verdade = int(validacao_final["diff"].sum()) == 0
+    @staticmethod
+    def final_validation(base_final_shift, base_final_turno_g, log_callback=None, fct_brasil=None, quebras=None):
+        # Reconciliação por grupo em vez da soma de todas as diferenças (erros opostos se anulavam);
+        # com fct_brasil e quebras, os totais também são conferidos com o planned_orders da previsão top
+        planned = None
+        if fct_brasil is not None and quebras is not None:
+            planned = fct_brasil if isinstance(fct_brasil, TopForecastLookup) else TopForecastLookup(fct_brasil)
+        report = reconcile(base_final_shift, base_final_turno_g, planned, quebras)
 
-        print(f"Há coerência entre os pedidos de Gerencial e Turno G?: {teste_verdade}")
+        if log_callback:
+            log_callback(f"Há coerência entre os pedidos de Gerencial e Turno G?: {not report.failed}")
+            for linha in report.describe():
+                log_callback(linha)
+        if report.failed:
+            raise ReconciliationError(report)
 
         union_df = pd.concat([base_final_shift, base_final_turno_g])
-
         union_df["date"] = union_df["date"].dt.date
-        if teste_verdade:
-            return union_df
-        else:
-            raise ValueError("Inconsistência detectada entre os pedidos de Gerencial e Turno G")
-        
-class FixingTopForecastingFile:
-    def __init__(self, uploaded_data):
-        self.uploaded_data = uploaded_data
-
-
-    def list_forecastings_squares(self) -> list:
-        nan_rows = self.uploaded_data.index[self.uploaded_data.isna().all(axis=1)].tolist()
+        return union_df
 
-        # Dividir o DataFrame com base nas linhas de NaN
-        dfs = []
-        start_idx = 0
-
-        for idx in nan_rows:
-            if idx > start_idx:
-                # Adiciona o DataFrame da seção anterior
-                dfs.append(self.uploaded_data.iloc[start_idx:idx].reset_index(drop=True))
-                start_idx = idx + 1
+class FixingTopForecastingFile:
+    """Planilha da previsão top: um bloco por origem, cada um com um cabeçalho MODAL + datas e uma
+    linha por modal.
 
-        # Adiciona o último DataFrame
-        dfs.append(self.uploaded_data.iloc[start_idx:].reset_index(drop=True))
+    Os blocos são descobertos pelo conteúdo, numa única leitura: cada linha que começa com MODAL abre
+    um bloco, e o nome da origem é a linha logo acima quando ela só tem o primeiro valor. Um primeiro
+    bloco sem nome é default_origin. Linhas vazias são ignoradas.
+    """
 
-        return dfs
-    
-    def fixing_columns(self, dfs):
-        lista_previsoes = ["BRASIL_SEM_PRACA", "BRASIL", "SAO PAULO", "RIO - ZONA SUL"]
-
-        if len(lista_previsoes) != len(dfs):
-            raise ValueError("A lista de previsões deve ter o mesmo comprimento que a lista de DataFrames")
-
-        # Adicionar a coluna com o literal correspondente e garantir que seja a primeira coluna
-        for i, df in enumerate(dfs):
-            df.insert(0, 'Tipo', lista_previsoes[i])
-
-    def set_headers(self, dfs):
-        # Definir o cabeçalho para o primeiro DataFrame
-        dfs[0].columns = dfs[0].iloc[0]  # Define a primeira linha como cabeçalho
-        dfs[0] = dfs[0][1:]  # Remove a primeira linha que agora é o cabeçalho
-        dfs[0].reset_index(drop=True, inplace=True)  # Resetar o índice
-
-        # Definir o cabeçalho para os DataFrames restantes
-        for i in range(1, len(dfs)):
-            dfs[i].columns = dfs[i].iloc[1]  # Define a segunda linha como cabeçalho
-            dfs[i] = dfs[i][2:]  # Remove as duas primeiras linhas que agora são cabeçalhos
-            dfs[i].reset_index(drop=True, inplace=True)  # Resetar o índice
-
-    def transform_dates_to_rows(self, df):
-        # Supondo que as colunas que devem ser transformadas começam a partir da coluna 2
-        value_vars = df.columns[2:]  # Seleciona todas as colunas a partir da terceira
-        df_melted = pd.melt(df, id_vars=df.columns[:2], value_vars=value_vars,
-                            var_name='data_entrega', value_name='planned_orders')
-        return df_melted
-
-    def process_dataframe(self, df):
-        # Renomear a segunda coluna para 'origem'
-        df.rename(columns={df.columns[0]: 'ORIGEM'}, inplace=True)
-        
-        # Converter a coluna 'DATA' para datetime
-        df['data_entrega'] = pd.to_datetime(df['data_entrega'])
-        
-        return df
+    def __init__(self, uploaded_data, default_origin="BRASIL_SEM_PRACA"):
+        self.uploaded_data = uploaded_data
+        self.default_origin = default_origin
+
+    def find_blocks(self) -> pd.DataFrame:
+        """Uma linha por bloco: ORIGEM, linha do cabeçalho e a linha onde o bloco termina (exclusiva)."""
+        valores = self.uploaded_data.to_numpy(dtype=object)
+        preenchidas = self.uploaded_data.notna().to_numpy()
+        primeira = pd.Series(valores[:, 0]).astype(str).str.strip().str.upper().to_numpy()
+
+        cabecalhos = np.flatnonzero(preenchidas[:, 0] & (primeira == "MODAL"))
+        if not len(cabecalhos):
+            raise ValueError("Nenhum bloco de previsão encontrado: falta a linha de cabeçalho com MODAL")
+
+        # O nome da origem é uma linha só com o primeiro valor, logo acima do cabeçalho
+        acima = np.maximum(cabecalhos - 1, 0)
+        so_nome = preenchidas[:, 0] & ~preenchidas[:, 1:].any(axis=1)
+        tem_nome = (cabecalhos > 0) & so_nome[acima]
+        origens = [str(valores[linha, 0]).strip() if nome else None for linha, nome in zip(acima, tem_nome)]
+        if origens[0] is None:
+            origens[0] = self.default_origin
+        sem_nome = [int(linha) + 1 for linha, origem in zip(cabecalhos, origens) if origem is None]
+        if sem_nome:
+            raise ValueError(f"Blocos de previsão sem o nome da origem acima do cabeçalho (linhas {sem_nome})")
+
+        inicio_bloco = np.where(tem_nome, acima, cabecalhos)
+        return pd.DataFrame({
+            "ORIGEM": origens,
+            "cabecalho": cabecalhos,
+            "fim": np.append(inicio_bloco[1:], len(valores)),
+        })
 
     def process_all(self):
-        # Aplicar a função de fixing_columns
-        dfs = self.list_forecastings_squares()
-        self.fixing_columns(dfs)
-
-        # Definir os cabeçalhos
-        self.set_headers(dfs)
-
-        # Transformar as datas para linhas
-        dfs_transformed = [self.transform_dates_to_rows(df) for df in dfs]
-
-        # Processar e renomear colunas
-        dfs_processed = [self.process_dataframe(df) for df in dfs_transformed]
-
-        # Concatenar todos os DataFrames em um único DataFrame
-        df_final = pd.concat(dfs_processed, ignore_index=True)
-
-        # Converter valores de 'ORDERS' para float
-        df_final["planned_orders"] = df_final["planned_orders"].astype(float)
-
-        df_final = df_final.rename(columns={"MODAL": "modal"})
-
-        df_final["modal"] = df_final["modal"].str.replace("NAO CARROS", "NAO_CARROS")
-
-        return df_final
-
+        valores = self.uploaded_data.to_numpy(dtype=object)
+        preenchidas = self.uploaded_data.notna().to_numpy()
+        blocos = self.find_blocks()
+        cabecalhos = blocos["cabecalho"].to_numpy()
+
+        # Linhas de dados: depois do cabeçalho do bloco, antes do fim dele, com algum valor
+        linhas = np.arange(len(valores))
+        bloco = np.searchsorted(cabecalhos, linhas, side="right") - 1
+        dados = (bloco >= 0) & (linhas > cabecalhos[np.maximum(bloco, 0)]) & (linhas < blocos["fim"].to_numpy()[np.maximum(bloco, 0)])
+        dados &= preenchidas.any(axis=1)
+        linhas, bloco = linhas[dados], bloco[dados]
+
+        # Datas do cabeçalho de cada bloco; colunas sem data no cabeçalho ficam de fora
+        datas = pd.to_datetime(pd.Series(valores[cabecalhos, 1:].ravel()), errors="coerce").to_numpy().reshape(len(cabecalhos), -1)
+
+        # Bloco a bloco, data a data e modal a modal: a ordem do melt de cada bloco seguido do concat
+        n_colunas = valores.shape[1] - 1
+        linha, coluna = np.divmod(np.arange(len(linhas) * n_colunas), n_colunas)
+        ordem = np.lexsort((linha, coluna, bloco[linha]))
+        linha, coluna = linha[ordem], coluna[ordem]
+        data_entrega = datas[bloco[linha], coluna]
+        com_data = ~np.isnat(data_entrega)
+        linha, coluna, data_entrega = linha[com_data], coluna[com_data], data_entrega[com_data]
+
+        modais = pd.Series(valores[linhas, 0], dtype=object).str.replace("NAO CARROS", "NAO_CARROS").to_numpy()
+        return pd.DataFrame({
+            "ORIGEM": blocos["ORIGEM"].to_numpy(dtype=object)[bloco[linha]],
+            "modal": modais[linha],
+            "data_entrega": data_entrega,
+            "planned_orders": valores[linhas[linha], coluna + 1].astype(float),
+        })
+
+    def lookup(self) -> "TopForecastLookup":
+        return TopForecastLookup(self.process_all())
+
+
+def _positions(index: pd.Index, values) -> np.ndarray:
+    # Posição de cada valor em index (-1 se não estiver); categóricas são resolvidas pelas categorias
+    if isinstance(getattr(values, "dtype", None), pd.CategoricalDtype):
+        posicoes = np.append(index.get_indexer(values.cat.categories), -1)
+        return posicoes[values.cat.codes.to_numpy()]
+    return index.get_indexer(values)
+
+
+class TopForecastLookup:
+    """planned_orders da previsão top num array denso origem x modal x dia, consultado por posição
+    em vez de merge. frame mantém o formato longo de process_all."""
+
+    def __init__(self, fct_brasil: pd.DataFrame):
+        self.frame = fct_brasil
+        fct = fct_brasil.dropna(subset=["planned_orders", "data_entrega"])
+        self.origens = pd.Index(pd.unique(fct["ORIGEM"].astype(object)))
+        self.modais = pd.Index(pd.unique(fct["modal"].astype(object)))
+        datas = pd.DatetimeIndex(fct["data_entrega"])
+        self.inicio = datas.min() if len(datas) else pd.Timestamp(0)
+        dia = ((datas - self.inicio) // pd.Timedelta(days=1)).to_numpy(dtype="int64")
+        self.dias = int(dia.max()) + 1 if len(dia) else 0
+
+        posicao = (_positions(self.origens, fct["ORIGEM"]) * len(self.modais) + _positions(self.modais, fct["modal"])) * self.dias + dia
+        if len(np.unique(posicao)) != len(posicao):
+            repetidas = fct.loc[pd.Series(posicao).duplicated(keep=False).to_numpy(), ["ORIGEM", "modal", "data_entrega"]]
+            raise ValueError(f"Previsão top com origem, modal e data repetidos: {repetidas.drop_duplicates().head(5).to_dict('records')}")
+        self.valores = np.full(len(self.origens) * len(self.modais) * self.dias, np.nan)
+        self.valores[posicao] = fct["planned_orders"].to_numpy(dtype="float64")
+
+    def get(self, origem, modal, data_entrega) -> np.ndarray:
+        """planned_orders de cada (origem, modal, data); NaN onde a previsão não tem valor."""
+        origem = _positions(self.origens, origem)
+        modal = _positions(self.modais, modal)
+        dia = ((pd.DatetimeIndex(data_entrega) - self.inicio) // pd.Timedelta(days=1)).to_numpy(dtype="int64")
+        valido = (origem >= 0) & (modal >= 0) & (dia >= 0) & (dia < self.dias)
+        posicao = (origem * len(self.modais) + modal) * self.dias + dia
+        return np.where(valido, self.valores[np.where(valido, posicao, 0)] if len(self.valores) else np.nan, np.nan)
 
 
 class DateUtils:
@@ -0,0 +1,195 @@
+import warnings
+from datetime import date, timedelta
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from backend import DataProcessor
+
+MEDIAN_KEYS = ["modal", "big_region", "logistic_region", "shift", "turno_g", "dds"]
+BASELINE_KEYS = ["modal", "big_region", "logistic_region", "shift", "turno_g"]
+SQUARE_KEYS = ["logistic_region", "modal"]
+GROWTH_CLIP = (-0.1, 1.3)
+
+
+def weekly_cutoffs(first: date, last: date) -> list:
+    """Datas de corte semanais entre first e last (inclusive)."""
+    return [first + timedelta(weeks=i) for i in range((last - first).days // 7 + 1)]
+
+
+def _week_start(datas: pd.Series) -> pd.Series:
+    return (datas - pd.to_timedelta(datas.dt.weekday, unit="D")).dt.normalize()
+
+
+def weekly_matrix(enriched: pd.DataFrame, semanas: pd.DatetimeIndex) -> tuple:
+    """Matrizes semana x chave (as seis chaves das medianas) de qtd_pedido e var_lw.
+
+    Cada chave tem no máximo um valor por semana, já que o dds faz parte dela; semanas sem
+    pedido ficam NaN e não entram nas medianas, como as linhas ausentes no fluxo da página.
+    Também devolve, por célula, a posição da linha dentro do seu grupo de lag (as cinco chaves
+    sem dds) e, por semana e grupo, quantas linhas do grupo vêm antes da semana.
+    """
+    chaves = enriched.groupby(MEDIAN_KEYS, observed=True, sort=True)
+    codigos = chaves.ngroup().to_numpy()
+    grupos_lag = enriched.groupby(BASELINE_KEYS, observed=True, sort=True)
+    grupo = grupos_lag.ngroup().to_numpy()
+    linhas = semanas.get_indexer(_week_start(enriched["data_entrega"]))
+
+    matrizes = {}
+    for col in ["qtd_pedido", "var_lw"]:
+        matriz = np.full((len(semanas), chaves.ngroups), np.nan)
+        matriz[linhas, codigos] = enriched[col].fillna(0).to_numpy(dtype="float64")
+        matrizes[col] = matriz
+
+    posicao = np.full((len(semanas), chaves.ngroups), -1)
+    posicao[linhas, codigos] = grupos_lag.cumcount().to_numpy()
+    linhas_por_semana = np.zeros((len(semanas), grupos_lag.ngroups), dtype="int64")
+    np.add.at(linhas_por_semana, (linhas, grupo), 1)
+    anteriores = np.cumsum(linhas_por_semana, axis=0) - linhas_por_semana
+
+    grupo_da_chave = np.zeros(chaves.ngroups, dtype="int64")
+    grupo_da_chave[codigos] = grupo
+    lag = {"posicao": posicao, "anteriores": anteriores[:, grupo_da_chave]}
+    return matrizes, lag, chaves.size().index.to_frame(index=False)
+
+
+def rolling_medians(matrizes: dict, lag: dict, window_weeks: int) -> dict:
+    """Medianas de cada janela de window_weeks semanas, para todas as janelas de uma vez.
+
+    As janelas são visões deslizantes da mesma matriz, sem refiltrar nem reagrupar o histórico a
+    cada corte. No fluxo da página o lag de 7 linhas é calculado depois do filtro, então as 7
+    primeiras linhas de cada grupo na janela têm var_lw 0; a mesma troca é feita aqui antes da mediana.
+    """
+    medianas = {}
+    for col, matriz in matrizes.items():
+        janelas = sliding_window_view(matriz, window_weeks, axis=0)
+        if col == "var_lw":
+            posicao = sliding_window_view(lag["posicao"], window_weeks, axis=0)
+            primeira_da_janela = lag["anteriores"][: janelas.shape[0], :, None]
+            janelas = np.where((posicao >= 0) & (posicao < primeira_da_janela + 7), 0.0, janelas)
+        # Chaves sem nenhuma semana na janela dão NaN (e um aviso do numpy), e saem do baseline
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            medianas[col] = np.nanmedian(janelas, axis=-1)
+    return medianas
+
+
+def _exact_baseline(history: pd.DataFrame, inicio: date, corte: date) -> pd.DataFrame:
+    # Caminho lento: o mesmo fluxo da página Baseline, recalculado do zero para o corte
+    data_processor = DataProcessor()
+    df = data_processor.filter_dataframe(history.copy(), inicio, corte)
+    df = data_processor.order_data_enricher(df)
+    medianas = data_processor.calculate_central_tendency(df, ["var_lw", "qtd_pedido"], "median")
+    return data_processor.clip_growth_and_merge(medianas)
+
+
+def _allowed_squares(history: pd.DataFrame, cortes: list, window_weeks: int) -> pd.DataFrame:
+    # Praças com pedidos nas seis semanas até cada corte, como em DataProcessor.allowed_squares.
+    # Lá a checagem roda sobre o histórico enriquecido, que já perdeu a semana do corte e
+    # começa na janela de treino; aqui o mesmo intervalo sai de somas acumuladas por dia.
+    calendario = pd.date_range(
+        history["data_entrega"].min() - pd.Timedelta(days=1),
+        max(history["data_entrega"].max(), pd.Timestamp(max(cortes))),
+    )
+    acumulado = (
+        history.groupby(["data_entrega"] + SQUARE_KEYS, observed=True).size()
+        .unstack(SQUARE_KEYS)
+        .reindex(calendario)
+        .fillna(0)
+        .cumsum()
+    )
+    cortes_ts = pd.to_datetime(pd.Series(cortes))
+    semana_corte = cortes_ts - pd.to_timedelta(cortes_ts.dt.weekday, unit="D")
+    inicio = np.maximum(cortes_ts - pd.Timedelta(weeks=6), semana_corte - pd.Timedelta(weeks=window_weeks))
+    fim = semana_corte - pd.Timedelta(days=1)
+    ate_fim = acumulado.reindex(fim.clip(calendario[0], calendario[-1])).to_numpy()
+    antes_inicio = acumulado.reindex((inicio - pd.Timedelta(days=1)).clip(calendario[0], calendario[-1])).to_numpy()
+
+    presente = pd.DataFrame(ate_fim - antes_inicio > 0, index=pd.Index(cortes, name="corte"), columns=acumulado.columns)
+    permitidas = presente.stack(SQUARE_KEYS, future_stack=True)
+    return permitidas[permitidas].reset_index()[["corte"] + SQUARE_KEYS]
+
+
+def _baselines(history: pd.DataFrame, cutoffs: list, window_weeks: int, exact: bool) -> pd.DataFrame:
+    # Baseline de cada corte em formato longo: corte, seis chaves e orders
+    semanas_corte = pd.DatetimeIndex([pd.Timestamp(corte) - pd.Timedelta(days=pd.Timestamp(corte).weekday()) for corte in cutoffs])
+
+    if exact:
+        baselines = []
+        for corte, semana_corte in zip(cutoffs, semanas_corte):
+            inicio = (semana_corte - pd.Timedelta(weeks=window_weeks)).date()
+            baselines.append(_exact_baseline(history, inicio, corte)[MEDIAN_KEYS + ["orders"]].assign(corte=corte))
+        return pd.concat(baselines, ignore_index=True)
+
+    # O histórico é enriquecido uma única vez; o lag usa linhas anteriores à janela,
+    # e rolling_medians recoloca o 0 das primeiras linhas que a página teria
+    data_processor = DataProcessor()
+    enriched = data_processor.order_data_enricher(history.copy(), max_week=np.iinfo("int32").max)
+    semanas = pd.date_range(
+        min(_week_start(enriched["data_entrega"]).min(), semanas_corte.min() - pd.Timedelta(weeks=window_weeks)),
+        semanas_corte.max(),
+        freq="7D",
+    )
+    matrizes, lag, chaves = weekly_matrix(enriched, semanas)
+    medianas = rolling_medians(matrizes, lag, window_weeks)
+
+    # A janela i cobre as semanas i .. i + window_weeks - 1; a do corte termina na semana anterior a ele
+    janela = semanas.get_indexer(semanas_corte) - window_weeks
+    qtd = medianas["qtd_pedido"][janela]
+    var = np.clip(np.nan_to_num(medianas["var_lw"][janela]), *GROWTH_CLIP)
+    orders = np.round(qtd * (1 + var), 0)
+
+    linha_corte, codigo = np.nonzero(~np.isnan(orders))
+    baselines = chaves.iloc[codigo].reset_index(drop=True)
+    baselines["orders"] = orders[linha_corte, codigo]
+    baselines["corte"] = np.asarray(cutoffs, dtype=object)[linha_corte]
+    return baselines
+
+
+def rolling_backtest(history: pd.DataFrame, cutoffs: list, window_weeks: int = 8, horizon_days: int = 7, exact: bool = False) -> dict:
+    """Avalia o baseline de mediana das últimas semanas em vários cortes contra o realizado.
+
+    Para cada corte, o baseline de clip_growth_and_merge é treinado nas window_weeks semanas completas
+    anteriores à semana do corte, como a página faz com data inicial numa segunda-feira, e aplicado aos
+    horizon_days dias seguintes pelo dia da semana. Retorna os DataFrames "detalhe" (corte, chave e
+    dia), "por_praca" e "por_corte" com WAPE e viés. exact=True refaz o fluxo da página em cada corte.
+
+    Na semana que atravessa a virada do ano, o ano_semana da página (ano civil com semana ISO) não
+    descarta os dias de dezembro da semana do corte; o modo padrão descarta a semana inteira.
+    """
+    history = history.copy()
+    history["data_entrega"] = pd.to_datetime(history["data_entrega"])
+
+    baselines = _baselines(history, cutoffs, window_weeks, exact)
+    baselines = baselines.merge(_allowed_squares(history, cutoffs, window_weeks), on=["corte"] + SQUARE_KEYS)
+
+    dias = pd.DataFrame({"corte": np.repeat(np.asarray(cutoffs, dtype=object), horizon_days)})
+    dias["data_entrega"] = pd.to_datetime(dias["corte"]) + pd.to_timedelta(np.tile(np.arange(1, horizon_days + 1), len(cutoffs)), unit="D")
+    dias["dds"] = dias["data_entrega"].dt.weekday
+
+    previsao = dias.merge(baselines.astype({"dds": "int32"}), on=["corte", "dds"]).drop(columns="dds")
+    diario = history.groupby(["data_entrega"] + BASELINE_KEYS, observed=True)["qtd_pedido"].sum().reset_index()
+    realizado = dias.drop(columns="dds").merge(diario, on="data_entrega")
+
+    chaves = ["corte", "data_entrega"] + BASELINE_KEYS
+    detalhe = (
+        previsao.astype({col: object for col in BASELINE_KEYS})
+        .merge(realizado.astype({col: object for col in BASELINE_KEYS}), on=chaves, how="outer")
+        .rename(columns={"orders": "previsto", "qtd_pedido": "realizado"})
+    )
+    detalhe[["previsto", "realizado"]] = detalhe[["previsto", "realizado"]].fillna(0)
+    detalhe["erro"] = detalhe["previsto"] - detalhe["realizado"]
+    detalhe["erro_abs"] = detalhe["erro"].abs()
+    detalhe = detalhe.sort_values(chaves).reset_index(drop=True)
+
+    return {
+        "detalhe": detalhe,
+        "por_praca": _score(detalhe, ["corte"] + SQUARE_KEYS),
+        "por_corte": _score(detalhe, ["corte"]),
+    }
+
+
+def _score(detalhe: pd.DataFrame, chaves: list) -> pd.DataFrame:
+    soma = detalhe.groupby(chaves)[["previsto", "realizado", "erro_abs", "erro"]].sum()
+    soma["wape"] = (soma["erro_abs"] / soma["realizado"]).where(soma["realizado"] > 0)
+    soma["vies"] = (soma["erro"] / soma["realizado"]).where(soma["realizado"] > 0)
+    return soma.drop(columns=["erro_abs", "erro"]).reset_index()
@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+from schema import apply_schema
+
+# Colunas de chave da planilha do baseline, na ordem em que aparecem no Excel
+FORECAST_KEYS = ["big_region", "logistic_region", "modal", "shift", "turno_g"]
+
+
+def _codes(col: pd.Series) -> tuple:
+    """Códigos inteiros ordenados de uma coluna de chave e o número de valores possíveis."""
+    if isinstance(col.dtype, pd.CategoricalDtype):
+        return col.cat.codes.to_numpy(dtype="int64"), len(col.cat.categories)
+    codigos, valores = pd.factorize(col, sort=True)
+    return codigos.astype("int64"), len(valores)
+
+
+class BaselineMatrix:
+    """Baseline como chaves x datas: uma linha de chaves categóricas por praça e quebra, um eixo de
+    datas e uma matriz densa de pedidos (float64, chaves nas linhas).
+
+    Substitui o merge + pivot_table de create_baseline_forecast e o melt de melting_baseline_adjusted:
+    a planilha larga é a matriz com as chaves ao lado e o formato longo é a matriz lida coluna a coluna.
+    """
+
+    def __init__(self, keys: pd.DataFrame, dates: pd.DatetimeIndex, values: np.ndarray):
+        if values.shape != (len(keys), len(dates)):
+            raise ValueError(f"Matriz {values.shape} não corresponde a {len(keys)} chaves x {len(dates)} datas")
+        self.keys = keys.reset_index(drop=True).rename_axis(columns=None)
+        self.dates = pd.DatetimeIndex(dates, name="data_entrega")
+        self.values = values
+
+    def __len__(self):
+        return len(self.keys)
+
+    @classmethod
+    def from_medians(cls, baseline: pd.DataFrame, dias_previsao: pd.DataFrame, keys=FORECAST_KEYS, order=("logistic_region",), value="orders") -> "BaselineMatrix":
+        """Espalha os pedidos por dia da semana (dds) de cada chave pelas datas de dias_previsao.
+
+        As linhas saem na ordem de create_baseline_forecast: pelas colunas de order e depois pelas
+        demais chaves, na ordem das categorias. Chaves sem nenhum dds entre as datas e datas sem
+        nenhuma chave ficam de fora, como no pivot_table.
+        """
+        keys = list(keys)
+        prioridade = list(order) + [col for col in keys if col not in order]
+
+        # Código único por chave em base mista, na ordem de prioridade: o np.unique já devolve as
+        # chaves ordenadas, sem hash
+        composto = np.zeros(len(baseline), dtype="int64")
+        validos = np.ones(len(baseline), dtype=bool)
+        for col in prioridade:
+            codigos, n = _codes(baseline[col])
+            validos &= codigos >= 0
+            composto = composto * max(n, 1) + codigos
+        dds = baseline["dds"].to_numpy(dtype="int64")
+        validos &= (dds >= 0) & (dds <= 6)
+
+        unicos, primeira, linha = np.unique(composto[validos], return_index=True, return_inverse=True)
+        n_chaves = len(unicos)
+
+        # Pedidos por chave x dds; chaves repetidas no mesmo dds somam, como no aggfunc="sum"
+        por_dds = np.zeros((n_chaves, 7), dtype="float64")
+        presente = np.zeros((n_chaves, 7), dtype=bool)
+        np.add.at(por_dds, (linha, dds[validos]), np.nan_to_num(baseline[value].to_numpy(dtype="float64")[validos]))
+        presente[linha, dds[validos]] = True
+
+        datas = pd.DatetimeIndex(dias_previsao["data_entrega"]).normalize()
+        ordem_datas = np.argsort(datas.to_numpy(), kind="stable")
+        datas = datas[ordem_datas]
+        dds_datas = dias_previsao["dds"].to_numpy(dtype="int64")[ordem_datas]
+
+        values = por_dds[:, dds_datas]
+        mascara = presente[:, dds_datas]
+        manter_chaves = mascara.any(axis=1)
+        manter_datas = mascara.any(axis=0)
+
+        chaves = baseline.loc[validos, keys].iloc[primeira[manter_chaves]]
+        return cls(chaves, datas[manter_datas], values[np.ix_(manter_chaves, manter_datas)])
+
+    @classmethod
+    def from_wide(cls, wide: pd.DataFrame, keys=FORECAST_KEYS) -> "BaselineMatrix":
+        """Lê a planilha larga (chaves + uma coluna por data), como o baseline ajustado no Excel."""
+        keys = list(keys)
+        colunas_datas = [col for col in wide.columns if col not in keys]
+        chaves = apply_schema(wide[keys].copy())
+        datas = pd.DatetimeIndex(pd.to_datetime(pd.Index(colunas_datas).astype(str)))
+        values = wide[colunas_datas].to_numpy(dtype="float64")
+        return cls(chaves, datas, values)
+
+    def to_wide(self) -> pd.DataFrame:
+        """Planilha larga: as chaves seguidas de uma coluna por data (datetime.date)."""
+        valores = pd.DataFrame(self.values, columns=pd.Index(self.dates.date, name="data_entrega"))
+        wide = pd.concat([self.keys, valores], axis=1)
+        wide.columns.name = "data_entrega"
+        return wide
+
+    def to_long(self, value_name="qtd_pedidos") -> pd.DataFrame:
+        """Uma linha por chave e data, data a data (a mesma ordem do pd.melt da planilha larga)."""
+        n_chaves, n_datas = self.values.shape
+        longo = self.keys.take(np.tile(np.arange(n_chaves), n_datas)).reset_index(drop=True)
+        longo["data_entrega"] = np.repeat(self.dates.to_numpy(), n_chaves)
+        longo[value_name] = self.values.ravel(order="F")
+        return longo
@@ -0,0 +1,142 @@
+import os
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date
+import pandas as pd
+from backend import DataProcessor, DateUtils
+from pipelines import QUEBRAS, run_baseline, run_consolidador
+from reconciliation import ReconciliationError
+from validation import ValidationErrors
+
+# Arquivos de cada pacote, reconhecidos pelo nome; o baseline ajustado é opcional
+BUNDLE_FILES = {"historico": "historico", "previsao": "previsao", "baseline": "baseline"}
+INPUT_EXTENSIONS = (".xlsx", ".csv", ".parquet")
+MANIFEST_COLUMNS = ["unidade", "status", "linhas_baseline", "linhas_final", "pedidos_final", "segundos", "erro"]
+
+
+def discover_bundles(root: str) -> list:
+    """Um pacote por diretório (root ou qualquer subdiretório) com um arquivo de histórico.
+
+    No mesmo diretório ficam a previsão top e, se houver, o baseline ajustado; a unidade é o
+    caminho do diretório relativo a root.
+    """
+    bundles = []
+    for directory, _, files in sorted(os.walk(root)):
+        arquivos = {}
+        for nome in sorted(files):
+            if not nome.lower().endswith(INPUT_EXTENSIONS) or nome.startswith((".", "~$")):
+                continue
+            for papel, trecho in BUNDLE_FILES.items():
+                if trecho in nome.lower():
+                    arquivos.setdefault(papel, os.path.join(directory, nome))
+                    break
+        if "historico" in arquivos:
+            unidade = os.path.relpath(directory, root)
+            bundles.append({"unidade": os.path.basename(os.path.abspath(root)) if unidade == "." else unidade, **arquivos})
+    return bundles
+
+
+def extract_bundles(zip_file, directory: str) -> list:
+    """Extrai um .zip (caminho ou arquivo enviado) com uma pasta por unidade e descobre os pacotes."""
+    with zipfile.ZipFile(zip_file) as arquivo:
+        arquivo.extractall(directory)
+    return discover_bundles(directory)
+
+
+def _run_bundle(bundle: dict, start_date: date, end_date: date, dias_previsao: pd.DataFrame, quebras: list) -> tuple:
+    # Roda num processo do pool: o fluxo das páginas Baseline e Consolidador para uma unidade
+    data_processor = DataProcessor()
+    inicio = time.perf_counter()
+    linha = {"unidade": bundle["unidade"], "status": "ok", "linhas_baseline": 0, "linhas_final": 0, "pedidos_final": 0.0, "erro": None}
+    baseline = df_final = None
+
+    try:
+        df, result, errors = data_processor.process_history_orders(bundle["historico"])
+        if errors:
+            linha["status"] = "erro_validacao"
+            mensagens = errors.describe() if isinstance(errors, ValidationErrors) else list(errors)
+            linha["erro"] = "; ".join(mensagens[:3])
+        elif not bundle.get("previsao"):
+            linha["status"] = "sem_previsao"
+            linha["erro"] = "Pacote sem arquivo de previsão top."
+        else:
+            baseline = run_baseline(df, start_date, end_date, None, dias_previsao=dias_previsao)
+            linha["linhas_baseline"] = len(baseline)
+
+            top_forecasting, top_result, top_errors = data_processor.process_top_forecasting_file(bundle["previsao"])
+            # Sem baseline ajustado no pacote, o baseline gerado é consolidado como está
+            ajustado, ajustado_errors = baseline, []
+            if bundle.get("baseline"):
+                ajustado, ajustado_result, ajustado_errors = data_processor.process_adjusted_baseline(bundle["baseline"])
+
+            if top_errors or ajustado_errors:
+                linha["status"] = "erro_validacao"
+                linha["erro"] = "; ".join(list(top_errors) + list(ajustado_errors))
+            else:
+                df_final = run_consolidador(top_forecasting, ajustado, quebras)
+                linha["linhas_final"] = len(df_final)
+                linha["pedidos_final"] = float(df_final["orders"].sum())
+    except ReconciliationError as e:
+        linha["status"] = "erro_reconciliacao"
+        linha["erro"] = "; ".join(e.report.describe(max_rows=3))
+    except ValueError as e:
+        # Um pacote com dados inválidos não interrompe os demais; o erro fica no manifesto
+        linha["status"] = "erro"
+        linha["erro"] = f"{type(e).__name__}: {e}"
+
+    linha["segundos"] = round(time.perf_counter() - inicio, 3)
+    return linha, baseline, df_final
+
+
+def _combine(resultados: list, unidades: list) -> pd.DataFrame:
+    frames = [df.assign(unidade=unidade) for unidade, df in zip(unidades, resultados) if df is not None]
+    if not frames:
+        return pd.DataFrame(columns=["unidade"])
+    combinado = pd.concat(frames, ignore_index=True)
+    return combinado[["unidade"] + [col for col in combinado.columns if col != "unidade"]]
+
+
+def run_batch(bundles: list, start_date: date, end_date: date, delivery_date: date, incluir_mes_seguinte=False,
+              quebras=QUEBRAS, workers=None, log_callback=None) -> tuple:
+    """Roda o fluxo completo (baseline e consolidação) de cada pacote num pool de processos.
+
+    Cada pacote é um dict com unidade, historico, previsao e, opcionalmente, baseline (ajustado).
+    As datas da previsão são geradas uma única vez e compartilhadas por todos. Retorna o manifesto
+    (uma linha por pacote, na ordem recebida), os baselines e as saídas finais de todas as unidades
+    juntos, com a coluna unidade na frente.
+    """
+    if not bundles:
+        raise ValueError("Nenhum pacote de entrada encontrado (cada pacote precisa de um arquivo de histórico)")
+    dias_previsao = DateUtils.generate_dates_until_end_of_month(delivery_date, incluir_mes_seguinte)
+    workers = max(1, min(workers or os.cpu_count() or 1, len(bundles)))
+    if log_callback:
+        log_callback(f"Processando {len(bundles)} pacotes em {workers} processos...")
+
+    resultados = [None] * len(bundles)
+    if workers == 1:
+        for i, bundle in enumerate(bundles):
+            resultados[i] = _run_bundle(bundle, start_date, end_date, dias_previsao, list(quebras))
+            if log_callback:
+                log_callback(f"{bundle['unidade']}: {resultados[i][0]['status']} ({i + 1}/{len(bundles)})")
+    else:
+        executor = ProcessPoolExecutor(max_workers=workers)
+        try:
+            futuros = {
+                executor.submit(_run_bundle, bundle, start_date, end_date, dias_previsao, list(quebras)): i
+                for i, bundle in enumerate(bundles)
+            }
+            for concluidos, futuro in enumerate(as_completed(futuros), start=1):
+                i = futuros[futuro]
+                resultados[i] = futuro.result()
+                if log_callback:
+                    log_callback(f"{bundles[i]['unidade']}: {resultados[i][0]['status']} ({concluidos}/{len(bundles)})")
+        finally:
+            # Num cancelamento, os pacotes que ainda não começaram nem chegam a rodar
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    unidades = [bundle["unidade"] for bundle in bundles]
+    manifesto = pd.DataFrame([linha for linha, _, _ in resultados], columns=MANIFEST_COLUMNS)
+    baselines = _combine([baseline for _, baseline, _ in resultados], unidades)
+    finais = _combine([df_final for _, _, df_final in resultados], unidades)
+    return manifesto, baselines, finais
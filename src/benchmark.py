@@ -0,0 +1,146 @@
+"""Mede tempo e pico de memória de cada etapa do DataProcessor sobre dados sintéticos.
+
+Exemplo:
+    python src/benchmark.py --regioes 50 --dias 365 --saida benchmark_resultados.jsonl
+    python src/benchmark.py --regioes 50 --dias 365 --comparar benchmark_resultados.jsonl
+"""
+import argparse
+import io
+import json
+import sys
+from datetime import datetime, timedelta
+import pandas as pd
+from backend import DataProcessor, DateUtils, FixingTopForecastingFile
+from pipelines import QUEBRAS
+from instrumentation import PipelineInstrumentation
+import synthetic
+
+
+def run_benchmark(n_regions, n_modals, n_shifts, n_turnos, n_days, horizon=60, seed=0, history_format="parquet") -> list:
+    timer = PipelineInstrumentation(trace_peak=True)
+    data_processor = DataProcessor()
+
+    history = synthetic.generate_history(n_regions, n_modals, n_shifts, n_turnos, n_days, seed=seed)
+    start_date = history["data_entrega"].min().date()
+    end_date = history["data_entrega"].max().date()
+    delivery_date = end_date + timedelta(days=1)
+
+    buffer = io.BytesIO()
+    if history_format == "csv":
+        history.to_csv(buffer, index=False)
+    elif history_format == "xlsx":
+        history.to_excel(buffer, index=False)
+    else:
+        history.to_parquet(buffer, index=False)
+    buffer.seek(0)
+    buffer.name = f"historico_pedidos.{history_format}"
+
+    df, _, errors = timer.run("process_history_orders", data_processor.process_history_orders, buffer)
+    if errors:
+        raise ValueError(f"O histórico sintético não passou na validação: {errors.describe()}")
+
+    df = timer.run("filter_dataframe", data_processor.filter_dataframe, df, start_date, end_date)
+    enriched = timer.run("order_data_enricher", data_processor.order_data_enricher, df)
+    medianas = timer.run(
+        "calculate_central_tendency", data_processor.calculate_central_tendency,
+        enriched, ["var_lw", "qtd_pedido"], "median"
+    )
+    baseline = data_processor.clip_growth_and_merge(medianas)
+    dias_previsao = DateUtils.generate_dates_until_end_of_month(delivery_date, True)
+    baseline = timer.run("create_baseline_forecast", data_processor.create_baseline_forecast, dias_previsao, baseline)
+
+    datas = synthetic.forecast_dates(delivery_date, horizon)
+    modais = list(history["modal"].cat.categories)
+    adjusted = synthetic.generate_adjusted_baseline(history, datas, seed=seed)
+    top_forecast = synthetic.generate_top_forecast(datas, modais, seed=seed)
+    fct_brasil = timer.run("process_all", FixingTopForecastingFile(top_forecast).process_all)
+
+    melted = timer.run("melting_baseline_adjusted", data_processor.melting_baseline_adjusted, adjusted)
+    timer.run("process_region_data", data_processor.process_region_data, melted, fct_brasil, QUEBRAS, "shift")
+    base_final = timer.run("consolidate_region_data", data_processor.consolidate_region_data, melted, fct_brasil, QUEBRAS)
+    base_final_shift = base_final.loc[base_final["tipo"] == "gerencial"].reset_index(drop=True)
+    base_final_turno_g = base_final.loc[base_final["tipo"] == "turno_g"].reset_index(drop=True)
+    timer.run("final_validation", data_processor.final_validation, base_final_shift, base_final_turno_g, None, fct_brasil, QUEBRAS)
+
+    return [
+        {campo: span[campo] for campo in ("stage", "seconds", "peak_mb", "rows_in", "rows_out", "memory_before_mb", "memory_after_mb")}
+        for span in timer.spans
+    ]
+
+
+def compare(previous: list, current: list) -> pd.DataFrame:
+    anterior = pd.DataFrame(previous).set_index("stage")[["seconds", "peak_mb"]]
+    atual = pd.DataFrame(current).set_index("stage")[["seconds", "peak_mb"]]
+    comparacao = anterior.join(atual, lsuffix="_anterior", rsuffix="_atual", how="outer")
+    comparacao["razao_tempo"] = (comparacao["seconds_atual"] / comparacao["seconds_anterior"]).round(2)
+    comparacao["razao_memoria"] = (comparacao["peak_mb_atual"] / comparacao["peak_mb_anterior"]).round(2)
+    return comparacao
+
+
+def _last_run(path: str, params: dict):
+    # Última execução salva com os mesmos parâmetros de escala
+    ultima = None
+    with open(path, encoding="utf-8") as f:
+        for linha in f:
+            execucao = json.loads(linha)
+            if execucao["params"] == params:
+                ultima = execucao
+    return ultima
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark das etapas do DataProcessor com dados sintéticos.")
+    parser.add_argument("--regioes", type=int, default=10)
+    parser.add_argument("--modais", type=int, default=3)
+    parser.add_argument("--shifts", type=int, default=3)
+    parser.add_argument("--turnos", type=int, default=2)
+    parser.add_argument("--dias", type=int, default=365)
+    parser.add_argument("--horizonte", type=int, default=60, help="Dias do baseline ajustado e da previsão top.")
+    parser.add_argument("--formato", choices=["parquet", "csv", "xlsx"], default="parquet", help="Formato do histórico lido.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--saida", help="Arquivo jsonl onde a execução é acrescentada.")
+    parser.add_argument("--comparar", help="Arquivo jsonl com execuções anteriores para comparar.")
+    parser.add_argument("--gerar-arquivos", metavar="DIRETORIO", help="Só grava os arquivos sintéticos de entrada no diretório.")
+    args = parser.parse_args(argv)
+
+    if args.gerar_arquivos:
+        history = synthetic.generate_history(args.regioes, args.modais, args.shifts, args.turnos, args.dias, seed=args.seed)
+        datas = synthetic.forecast_dates(history["data_entrega"].max().date(), args.horizonte)
+        paths = synthetic.write_dataset(
+            args.gerar_arquivos,
+            history,
+            synthetic.generate_adjusted_baseline(history, datas, seed=args.seed),
+            synthetic.generate_top_forecast(datas, list(history["modal"].cat.categories), seed=args.seed),
+            history_format=args.formato,
+        )
+        for nome, path in paths.items():
+            print(f"{nome}: {path}")
+        return 0
+
+    params = {
+        "regioes": args.regioes, "modais": args.modais, "shifts": args.shifts, "turnos": args.turnos,
+        "dias": args.dias, "horizonte": args.horizonte, "formato": args.formato, "seed": args.seed,
+    }
+    records = run_benchmark(
+        args.regioes, args.modais, args.shifts, args.turnos, args.dias,
+        horizon=args.horizonte, seed=args.seed, history_format=args.formato
+    )
+    print(pd.DataFrame(records).to_string(index=False))
+
+    if args.comparar:
+        anterior = _last_run(args.comparar, params)
+        if anterior:
+            print()
+            print(compare(anterior["stages"], records).to_string())
+        else:
+            print("Nenhuma execução anterior com os mesmos parâmetros.", file=sys.stderr)
+
+    if args.saida:
+        with open(args.saida, "a", encoding="utf-8") as f:
+            execucao = {"timestamp": datetime.now().isoformat(timespec="seconds"), "params": params, "stages": records}
+            f.write(json.dumps(execucao) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
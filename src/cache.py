@@ -0,0 +1,60 @@
+import hashlib
+from collections import OrderedDict
+import pandas as pd
+
+
+def content_hash(uploaded_file) -> str:
+    """Hash do conteúdo do arquivo enviado, independente do nome ou da sessão."""
+    if hasattr(uploaded_file, "getvalue"):
+        data = uploaded_file.getvalue()
+    elif hasattr(uploaded_file, "read"):
+        data = uploaded_file.read()
+        uploaded_file.seek(0)
+    else:
+        with open(uploaded_file, "rb") as f:
+            data = f.read()
+    return hashlib.sha256(data).hexdigest()
+
+
+def _copy(value):
+    # As etapas do DataProcessor alteram os DataFrames recebidos, então o cache entrega cópias
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return value.copy()
+    if isinstance(value, tuple):
+        return tuple(_copy(item) for item in value)
+    if isinstance(value, list):
+        return [_copy(item) for item in value]
+    return value
+
+
+class StageCache:
+    """Cache LRU dos resultados de cada etapa do pipeline, chaveado por hash do arquivo e parâmetros."""
+
+    def __init__(self, max_entries: int = 16):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_compute(self, stage: str, key: tuple, compute):
+        full_key = (stage, *key)
+        if full_key in self._entries:
+            self._entries.move_to_end(full_key)
+            self.hits += 1
+            return _copy(self._entries[full_key])
+
+        self.misses += 1
+        value = compute()
+        self._entries[full_key] = _copy(value)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return value
+
+    def contains(self, stage: str, key: tuple) -> bool:
+        return (stage, *key) in self._entries
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,418 @@
+"""Execução dos fluxos Baseline e Consolidador pela linha de comando, sem streamlit.
+
+Exemplos:
+    python src/cli.py baseline historico_pedidos.xlsx --janela 2024-01-01 2024-03-31 --entrega 2024-04-01 --saida saida/
+    python src/cli.py consolidador previsao_top.xlsx baseline_ajustado.xlsx --saida saida/
+    python src/cli.py backtest historico_pedidos.xlsx --cortes 2024-03-03 2024-12-29 --saida saida/
+    python src/cli.py cenarios historico_pedidos.xlsx --janela 2024-01-01 2024-03-31 --clip -0.1 1.3 --clip 0 1 --lag 7 14 --saida saida/
+    python src/cli.py paridade historico_pedidos.xlsx --janela 2024-01-01 2024-03-31 --backend duckdb
+    python src/cli.py aproximado historico_pedidos.xlsx --janela 2024-01-01 2024-12-31 --precisao 0.05 0.01
+    python src/cli.py incremental estado/ pedidos_semana.xlsx --historico historico_pedidos.xlsx --janela 2024-01-01 2024-03-31
+    python src/cli.py lote unidades/ --janela 2024-01-01 2024-03-31 --entrega 2024-04-01 --saida saida/
+"""
+import argparse
+import os
+import sys
+import tempfile
+from datetime import date
+import pandas as pd
+from backend import DataProcessor, DateUtils
+from cache import content_hash
+from backtest import rolling_backtest, weekly_cutoffs
+from batch import discover_bundles, extract_bundles, run_batch
+from compute_backends import BACKENDS, backend_parity
+from exporters import export_dataframe
+from incremental import IncrementalBaseline, IncrementalConsolidador
+from instrumentation import PipelineInstrumentation
+from pipelines import QUEBRAS, run_baseline, run_consolidador
+from reconciliation import ReconciliationError
+from sketches import sketch_accuracy_report
+from scenarios import DEFAULT_SCENARIO, run_scenarios, scenario_grid
+from validation import ValidationErrors
+
+
+def _print_event(event):
+    if event["type"] == "log":
+        print(event["message"], file=sys.stderr)
+    elif event["type"] == "span":
+        print(f"[{event['stage']}] {event['seconds']}s, linhas {event['rows_in']} -> {event['rows_out']}", file=sys.stderr)
+
+
+def _parse_date(value: str) -> date:
+    return date.fromisoformat(value)
+
+
+def _stem(path: str) -> str:
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def save_output(df: pd.DataFrame, path: str):
+    file_format = os.path.splitext(path)[1].lower().lstrip(".")
+    with open(path, "wb") as f:
+        f.write(export_dataframe(df, file_format))
+
+
+def log_errors(path: str, errors, log_callback):
+    # Erros de validação saem resumidos por coluna e regra, e não um por linha
+    for error in errors.describe() if isinstance(errors, ValidationErrors) else errors:
+        log_callback(f"{path}: {error}")
+
+
+def command_baseline(args, instrumentation) -> int:
+    data_processor = DataProcessor()
+    log_callback = instrumentation.log
+    janelas = args.janela or []
+    status = 0
+
+    for path in args.historico:
+        # Cada arquivo é lido e validado uma única vez, mesmo com várias janelas de datas
+        df, result, errors = instrumentation.run(
+            "process_history_orders", data_processor.process_history_orders, path, log_callback, max_errors=args.max_erros
+        )
+        if errors:
+            log_errors(path, errors, log_callback)
+            if errors.rows:
+                saida = os.path.join(args.saida, f"erros_{_stem(path)}.csv")
+                save_output(errors.to_frame(), saida)
+                log_callback(f"Tabela completa de erros salva em {saida}.")
+            status = 1
+            continue
+
+        for inicio, fim in janelas:
+            entrega = args.entrega or fim
+            final_baseline = run_baseline(
+                df, inicio, fim, entrega, args.mes_seguinte, log_callback, instrumentation, args.workers, args.backend, args.aproximado
+            )
+            saida = os.path.join(args.saida, f"baseline_{_stem(path)}_{inicio}_{fim}.{args.formato}")
+            save_output(final_baseline, saida)
+            log_callback(f"Baseline salvo em {saida} ({len(final_baseline)} linhas).")
+    return status
+
+
+def command_consolidador(args, instrumentation) -> int:
+    data_processor = DataProcessor()
+    log_callback = instrumentation.log
+    top_forecasting, top_result, top_errors = data_processor.process_top_forecasting_file(args.previsao, log_callback)
+    if top_errors:
+        # Sem previsão top nenhum baseline pode ser consolidado
+        log_errors(args.previsao, top_errors, log_callback)
+        return 1
+
+    # Versões seguintes do baseline ajustado refazem só os grupos alterados em relação à anterior
+    estado = IncrementalConsolidador() if args.backend == "pandas" else None
+    chave_previsao = content_hash(args.previsao)
+
+    status = 0
+    for path in args.baseline:
+        baseline, baseline_result, baseline_errors = data_processor.process_adjusted_baseline(path, log_callback)
+        if baseline_errors:
+            log_errors(path, baseline_errors, log_callback)
+            status = 1
+            continue
+
+        try:
+            df_final = run_consolidador(
+                top_forecasting, baseline, args.quebras, log_callback, instrumentation, args.backend, estado, chave_previsao
+            )
+        except ReconciliationError as e:
+            # A reconciliação já saiu resumida no log; a tabela completa aponta cada grupo divergente
+            saida = os.path.join(args.saida, f"divergencias_{_stem(path)}.csv")
+            save_output(e.report.mismatches, saida)
+            log_callback(f"{path}: consolidação com divergências, tabela completa salva em {saida}.")
+            status = 1
+            continue
+        except ValueError as e:
+            # Um baseline com problema não interrompe os demais arquivos
+            log_callback(f"{path}: {e}")
+            status = 1
+            continue
+        saida = os.path.join(args.saida, f"output_{_stem(path)}.{args.formato}")
+        save_output(df_final, saida)
+        log_callback(f"Arquivo final salvo em {saida} ({len(df_final)} linhas).")
+    return status
+
+
+def command_backtest(args, instrumentation) -> int:
+    data_processor = DataProcessor()
+    log_callback = instrumentation.log
+    df, result, errors = instrumentation.run("process_history_orders", data_processor.process_history_orders, args.historico, log_callback)
+    if errors:
+        log_errors(args.historico, errors, log_callback)
+        return 1
+
+    cortes = weekly_cutoffs(*args.cortes)
+    resultado = instrumentation.run("rolling_backtest", rolling_backtest, df, cortes, args.semanas, args.horizonte, args.exato)
+    for nome in ["por_praca", "por_corte", "detalhe"]:
+        saida = os.path.join(args.saida, f"backtest_{nome}_{_stem(args.historico)}.{args.formato}")
+        save_output(resultado[nome], saida)
+        log_callback(f"Backtest ({nome}) salvo em {saida} ({len(resultado[nome])} linhas).")
+    return 0
+
+
+def command_cenarios(args, instrumentation) -> int:
+    data_processor = DataProcessor()
+    log_callback = instrumentation.log
+    df, result, errors = instrumentation.run("process_history_orders", data_processor.process_history_orders, args.historico, log_callback)
+    if errors:
+        log_errors(args.historico, errors, log_callback)
+        return 1
+
+    inicio, fim = args.janela
+    grid = scenario_grid(
+        clips=args.clip or [(DEFAULT_SCENARIO["clip_min"], DEFAULT_SCENARIO["clip_max"])],
+        semanas_pracas=args.semanas_pracas,
+        lags=args.lag,
+        estatisticas=args.estatistica,
+    )
+    df_filtered = instrumentation.run("filter_dataframe", data_processor.filter_dataframe, df, inicio, fim)
+    dias_previsao = DateUtils.generate_dates_until_end_of_month(args.entrega or fim, args.mes_seguinte)
+    baselines = instrumentation.run("run_scenarios", run_scenarios, df_filtered, fim, dias_previsao, grid, log_callback)
+
+    for nome, tabela in [("cenarios", grid), ("baselines", baselines)]:
+        saida = os.path.join(args.saida, f"{nome}_{_stem(args.historico)}_{inicio}_{fim}.{args.formato}")
+        save_output(tabela, saida)
+        log_callback(f"Tabela de {nome} salva em {saida} ({len(tabela)} linhas).")
+    return 0
+
+
+def command_paridade(args, instrumentation) -> int:
+    data_processor = DataProcessor()
+    log_callback = instrumentation.log
+    df, result, errors = instrumentation.run("process_history_orders", data_processor.process_history_orders, args.historico, log_callback)
+    if errors:
+        log_errors(args.historico, errors, log_callback)
+        return 1
+
+    top_forecasting = None
+    if args.previsao:
+        top_forecasting, top_result, top_errors = data_processor.process_top_forecasting_file(args.previsao, log_callback)
+        if top_errors:
+            log_errors(args.previsao, top_errors, log_callback)
+            return 1
+
+    inicio, fim = args.janela
+    # Sem --entrega, a previsão vai até o fim do mês seguinte ao da janela: uma janela que termina no
+    # último dia do mês não deixa a comparação do baseline sem nenhuma data
+    mes_seguinte = args.mes_seguinte or args.entrega is None
+    relatorio = instrumentation.run(
+        "backend_parity", backend_parity, df, inicio, fim, args.entrega or fim, mes_seguinte, args.backend,
+        top_forecasting, args.quebras
+    )
+    print(relatorio.to_string(index=False))
+    if args.formato:
+        saida = os.path.join(args.saida, f"paridade_{args.backend}_{_stem(args.historico)}_{inicio}_{fim}.{args.formato}")
+        save_output(relatorio, saida)
+        log_callback(f"Relatório de paridade salvo em {saida}.")
+    return 0 if relatorio["igual"].all() else 1
+
+
+def command_incremental(args, instrumentation) -> int:
+    data_processor = DataProcessor()
+    log_callback = instrumentation.log
+
+    def ler(path):
+        df, result, errors = instrumentation.run("process_history_orders", data_processor.process_history_orders, path, log_callback)
+        log_errors(path, errors, log_callback)
+        return None if errors else df
+
+    if IncrementalBaseline.exists(args.estado):
+        estado = instrumentation.run("load_state", IncrementalBaseline.load, args.estado)
+    elif args.historico and args.janela:
+        historico = ler(args.historico)
+        if historico is None:
+            return 1
+        estado = instrumentation.run("build_state", IncrementalBaseline.build, historico, *args.janela, log_callback)
+    else:
+        log_callback(f"Nenhum estado em {args.estado}: informe --historico e --janela para criá-lo.")
+        return 1
+
+    # Cada arquivo de pedidos é uma semana nova, na ordem dada
+    for path in args.pedidos:
+        novos = ler(path)
+        if novos is None:
+            return 1
+        instrumentation.run("advance", estado.advance, novos, log_callback)
+        instrumentation.run("save_state", estado.save, args.estado)
+    if not args.pedidos:
+        instrumentation.run("save_state", estado.save, args.estado)
+
+    final_baseline = instrumentation.run(
+        "baseline_output", estado.baseline, args.entrega or estado.end_date, args.mes_seguinte
+    )
+    saida = os.path.join(args.saida, f"baseline_{estado.start_date}_{estado.end_date}.{args.formato}")
+    save_output(final_baseline, saida)
+    log_callback(f"Baseline salvo em {saida} ({len(final_baseline)} linhas).")
+    return 0
+
+
+def command_aproximado(args, instrumentation) -> int:
+    data_processor = DataProcessor()
+    log_callback = instrumentation.log
+    df, result, errors = instrumentation.run("process_history_orders", data_processor.process_history_orders, args.historico, log_callback)
+    if errors:
+        log_errors(args.historico, errors, log_callback)
+        return 1
+
+    inicio, fim = args.janela
+    relatorio = instrumentation.run(
+        "sketch_accuracy_report", sketch_accuracy_report, df, inicio, fim, args.precisao, args.estatistica
+    )
+    print(relatorio.to_string(index=False))
+    saida = os.path.join(args.saida, f"aproximado_{_stem(args.historico)}_{inicio}_{fim}.{args.formato}")
+    save_output(relatorio, saida)
+    log_callback(f"Relatório de precisão salvo em {saida}.")
+    return 0
+
+
+def command_lote(args, instrumentation) -> int:
+    log_callback = instrumentation.log
+    inicio, fim = args.janela
+    entrega = args.entrega or fim
+
+    with tempfile.TemporaryDirectory() as extraidos:
+        if args.entrada.lower().endswith(".zip"):
+            bundles = extract_bundles(args.entrada, extraidos)
+        else:
+            bundles = discover_bundles(args.entrada)
+        manifesto, baselines, finais = instrumentation.run(
+            "run_batch", run_batch, bundles, inicio, fim, entrega, args.mes_seguinte, args.quebras, args.workers, log_callback
+        )
+
+    print(manifesto.to_string(index=False))
+    os.makedirs(args.saida, exist_ok=True)
+    save_output(manifesto, os.path.join(args.saida, "manifesto_lote.csv"))
+    for nome, df in [("baseline_lote", baselines), ("output_lote", finais)]:
+        saida = os.path.join(args.saida, f"{nome}.{args.formato}")
+        save_output(df, saida)
+        log_callback(f"{nome} salvo em {saida} ({len(df)} linhas).")
+    return 0 if (manifesto["status"] == "ok").all() else 1
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Gerador de Baseline e Consolidador sem interface.")
+    subparsers = parser.add_subparsers(dest="comando", required=True)
+
+    baseline = subparsers.add_parser("baseline", help="Gera o baseline a partir do histórico de pedidos.")
+    baseline.add_argument("historico", nargs="+", help="Arquivos de histórico de pedidos (xlsx, csv ou parquet).")
+    baseline.add_argument("--janela", nargs=2, action="append", type=_parse_date, metavar=("INICIO", "FIM"), required=True,
+                          help="Datas inicial e final de corte do histórico. Pode ser repetido.")
+    baseline.add_argument("--entrega", type=_parse_date, help="Data em que a demanda será entregue (padrão: data final da janela).")
+    baseline.add_argument("--mes-seguinte", action="store_true", help="Inclui o mês seguinte na previsão.")
+    baseline.add_argument("--saida", default=".", help="Diretório de saída.")
+    baseline.add_argument("--formato", choices=["xlsx", "csv", "parquet"], default="xlsx")
+    baseline.add_argument("--tempos", help="Arquivo JSON onde os tempos de cada etapa são gravados.")
+    baseline.add_argument("--workers", type=int, default=1, help="Processos para gerar o baseline por blocos de praças.")
+    baseline.add_argument("--backend", choices=sorted(BACKENDS), default="pandas", help="Motor de cálculo das etapas.")
+    baseline.add_argument("--max-erros", type=int, metavar="N",
+                          help="Para a validação após N linhas com erro (1 = no primeiro erro).")
+    baseline.add_argument("--aproximado", type=float, metavar="PRECISAO",
+                          help="Medianas por esboços de quantis com este erro relativo (ex.: 0.01), lendo o histórico por blocos.")
+    baseline.set_defaults(func=command_baseline)
+
+    consolidador = subparsers.add_parser("consolidador", help="Consolida baselines ajustados com a previsão top.")
+    consolidador.add_argument("previsao", help="Arquivo de previsão top.")
+    consolidador.add_argument("baseline", nargs="+", help="Arquivos de baseline ajustado.")
+    consolidador.add_argument("--quebras", nargs="+", default=QUEBRAS, help="Origens da previsão usadas nas quebras.")
+    consolidador.add_argument("--saida", default=".", help="Diretório de saída.")
+    consolidador.add_argument("--formato", choices=["xlsx", "csv", "parquet"], default="xlsx")
+    consolidador.add_argument("--tempos", help="Arquivo JSON onde os tempos de cada etapa são gravados.")
+    consolidador.add_argument("--backend", choices=sorted(BACKENDS), default="pandas", help="Motor de cálculo das etapas.")
+    consolidador.set_defaults(func=command_consolidador)
+
+    backtest = subparsers.add_parser("backtest", help="Avalia o baseline em vários cortes contra os pedidos realizados.")
+    backtest.add_argument("historico", help="Arquivo de histórico de pedidos (xlsx, csv ou parquet).")
+    backtest.add_argument("--cortes", nargs=2, type=_parse_date, metavar=("PRIMEIRO", "ULTIMO"), required=True,
+                          help="Primeiro e último corte; os cortes são semanais a partir do primeiro.")
+    backtest.add_argument("--semanas", type=int, default=8, help="Semanas de histórico usadas no baseline de cada corte.")
+    backtest.add_argument("--horizonte", type=int, default=7, help="Dias após o corte comparados com o realizado.")
+    backtest.add_argument("--exato", action="store_true", help="Refaz o fluxo da página em cada corte (mais lento).")
+    backtest.add_argument("--saida", default=".", help="Diretório de saída.")
+    backtest.add_argument("--formato", choices=["xlsx", "csv", "parquet"], default="csv")
+    backtest.add_argument("--tempos", help="Arquivo JSON onde os tempos de cada etapa são gravados.")
+    backtest.set_defaults(func=command_backtest)
+
+    cenarios = subparsers.add_parser("cenarios", help="Gera o baseline para um grid de parâmetros numa única passada.")
+    cenarios.add_argument("historico", help="Arquivo de histórico de pedidos (xlsx, csv ou parquet).")
+    cenarios.add_argument("--janela", nargs=2, type=_parse_date, metavar=("INICIO", "FIM"), required=True,
+                          help="Datas inicial e final de corte do histórico.")
+    cenarios.add_argument("--entrega", type=_parse_date, help="Data em que a demanda será entregue (padrão: data final da janela).")
+    cenarios.add_argument("--mes-seguinte", action="store_true", help="Inclui o mês seguinte na previsão.")
+    cenarios.add_argument("--clip", nargs=2, type=float, action="append", metavar=("MIN", "MAX"),
+                          help="Limites da variação semanal. Pode ser repetido (padrão: -0.1 1.3).")
+    cenarios.add_argument("--semanas-pracas", nargs="+", type=int, default=[DEFAULT_SCENARIO["semanas_pracas"]],
+                          help="Semanas sem pedido até uma praça sair do baseline.")
+    cenarios.add_argument("--lag", nargs="+", type=int, default=[DEFAULT_SCENARIO["lag"]], help="Linhas de defasagem da variação.")
+    cenarios.add_argument("--estatistica", nargs="+", default=[DEFAULT_SCENARIO["estatistica"]],
+                          help="Medidas de tendência central: median, mean ou quantis como q75.")
+    cenarios.add_argument("--saida", default=".", help="Diretório de saída.")
+    cenarios.add_argument("--formato", choices=["xlsx", "csv", "parquet"], default="xlsx")
+    cenarios.add_argument("--tempos", help="Arquivo JSON onde os tempos de cada etapa são gravados.")
+    cenarios.set_defaults(func=command_cenarios)
+
+    lote = subparsers.add_parser("lote", help="Roda baseline e consolidação de várias unidades em paralelo.")
+    lote.add_argument("entrada", help="Diretório (ou .zip) com uma pasta por unidade: histórico, previsão top e, opcionalmente, baseline ajustado.")
+    lote.add_argument("--janela", nargs=2, type=_parse_date, metavar=("INICIO", "FIM"), required=True,
+                      help="Datas inicial e final de corte do histórico.")
+    lote.add_argument("--entrega", type=_parse_date, help="Data em que a demanda será entregue (padrão: data final da janela).")
+    lote.add_argument("--mes-seguinte", action="store_true", help="Inclui o mês seguinte na previsão.")
+    lote.add_argument("--quebras", nargs="+", default=QUEBRAS, help="Origens da previsão usadas nas quebras.")
+    lote.add_argument("--workers", type=int, help="Processos em paralelo (padrão: um por núcleo, até o número de unidades).")
+    lote.add_argument("--saida", default=".", help="Diretório de saída.")
+    lote.add_argument("--formato", choices=["xlsx", "csv", "parquet"], default="xlsx")
+    lote.add_argument("--tempos", help="Arquivo JSON onde os tempos de cada etapa são gravados.")
+    lote.set_defaults(func=command_lote)
+
+    paridade = subparsers.add_parser("paridade", help="Compara, etapa a etapa, o baseline de outro backend com o do pandas.")
+    paridade.add_argument("historico", help="Arquivo de histórico de pedidos (xlsx, csv ou parquet).")
+    paridade.add_argument("--janela", nargs=2, type=_parse_date, metavar=("INICIO", "FIM"), required=True,
+                          help="Datas inicial e final de corte do histórico.")
+    paridade.add_argument("--entrega", type=_parse_date,
+                          help="Data em que a demanda será entregue (padrão: data final da janela, com o mês seguinte na previsão).")
+    paridade.add_argument("--mes-seguinte", action="store_true", help="Inclui o mês seguinte na previsão.")
+    paridade.add_argument("--previsao", help="Previsão top usada na comparação da consolidação (padrão: os totais do próprio baseline).")
+    paridade.add_argument("--quebras", nargs="+", default=QUEBRAS, help="Origens da previsão usadas nas quebras.")
+    paridade.add_argument("--backend", choices=sorted(set(BACKENDS) - {"pandas"}), default="duckdb", help="Backend comparado com o pandas.")
+    paridade.add_argument("--saida", default=".", help="Diretório de saída.")
+    paridade.add_argument("--formato", choices=["xlsx", "csv", "parquet"], help="Também grava o relatório neste formato.")
+    paridade.add_argument("--tempos", help="Arquivo JSON onde os tempos de cada etapa são gravados.")
+    paridade.set_defaults(func=command_paridade)
+
+    aproximado = subparsers.add_parser("aproximado", help="Compara as medianas do modo aproximado com as exatas.")
+    aproximado.add_argument("historico", help="Arquivo de histórico de pedidos (xlsx, csv ou parquet).")
+    aproximado.add_argument("--janela", nargs=2, type=_parse_date, metavar=("INICIO", "FIM"), required=True,
+                            help="Datas inicial e final de corte do histórico.")
+    aproximado.add_argument("--precisao", nargs="+", type=float, default=[0.05, 0.01, 0.005], help="Erros relativos comparados.")
+    aproximado.add_argument("--estatistica", nargs="+", default=["median", "q90"], help="median ou quantis como q90.")
+    aproximado.add_argument("--saida", default=".", help="Diretório de saída.")
+    aproximado.add_argument("--formato", choices=["xlsx", "csv", "parquet"], default="csv")
+    aproximado.add_argument("--tempos", help="Arquivo JSON onde os tempos de cada etapa são gravados.")
+    aproximado.set_defaults(func=command_aproximado)
+
+    incremental = subparsers.add_parser("incremental", help="Atualiza o baseline com semanas novas de pedidos, sem recalcular a janela.")
+    incremental.add_argument("estado", help="Diretório do estado do baseline (criado na primeira execução).")
+    incremental.add_argument("pedidos", nargs="*", help="Arquivos com os pedidos de cada semana nova, em ordem.")
+    incremental.add_argument("--historico", help="Histórico usado para criar o estado, quando ele ainda não existe.")
+    incremental.add_argument("--janela", nargs=2, type=_parse_date, metavar=("INICIO", "FIM"),
+                             help="Janela inicial do estado, quando ele ainda não existe.")
+    incremental.add_argument("--entrega", type=_parse_date, help="Data em que a demanda será entregue (padrão: data final da janela).")
+    incremental.add_argument("--mes-seguinte", action="store_true", help="Inclui o mês seguinte na previsão.")
+    incremental.add_argument("--saida", default=".", help="Diretório de saída.")
+    incremental.add_argument("--formato", choices=["xlsx", "csv", "parquet"], default="xlsx")
+    incremental.add_argument("--tempos", help="Arquivo JSON onde os tempos de cada etapa são gravados.")
+    incremental.set_defaults(func=command_incremental)
+
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    os.makedirs(args.saida, exist_ok=True)
+    instrumentation = PipelineInstrumentation(listeners=[_print_event])
+    status = args.func(args, instrumentation)
+    if args.tempos:
+        instrumentation.save(args.tempos)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,372 @@
+from datetime import date, timedelta
+import pandas as pd
+from backend import EMPTY_WINDOW, DataProcessor, TopForecastLookup
+from history_store import HistoryStore, _ano_semana
+from schema import apply_schema
+
+LAG_KEYS = ["modal", "big_region", "logistic_region", "shift", "turno_g"]
+MEDIAN_KEYS = ["modal", "big_region", "logistic_region", "shift", "turno_g", "dds"]
+FORECAST_KEYS = ["big_region", "logistic_region", "modal", "shift", "turno_g"]
+
+
+class PandasBackend:
+    """Etapas do DataProcessor sobre DataFrames em memória (o fluxo padrão das páginas)."""
+
+    name = "pandas"
+
+    def filter(self, history, start_date: date, end_date: date):
+        return DataProcessor.filter_dataframe(history, start_date, end_date)
+
+    def enrich(self, df, lag: int = 7):
+        return DataProcessor.order_data_enricher(df, lag=lag)
+
+    def allowed_squares(self, end_date: date, df, weeks: int = 6) -> pd.DataFrame:
+        return DataProcessor.allowed_squares(end_date, df, weeks)
+
+    def central_tendency(self, df, cols_to_calc: list, type: str | list = "median") -> pd.DataFrame:
+        return DataProcessor.calculate_central_tendency(df, cols_to_calc, type)
+
+    def baseline_forecast(self, dias_previsao: pd.DataFrame, baseline: pd.DataFrame) -> pd.DataFrame:
+        return DataProcessor.create_baseline_forecast(dias_previsao, baseline)
+
+    def consolidate(self, baseline_melted: pd.DataFrame, fct_brasil: pd.DataFrame, quebras: list, group_cols=("shift", "turno_g")) -> pd.DataFrame:
+        return DataProcessor.consolidate_region_data(baseline_melted, fct_brasil, quebras, group_cols)
+
+    def collect(self, value) -> pd.DataFrame:
+        return value
+
+
+class DuckDBBackend:
+    """As mesmas etapas em SQL num DuckDB embutido, para históricos maiores que a memória.
+
+    filter e enrich devolvem relações do DuckDB, que só são executadas quando a etapa seguinte
+    agrega; assim o histórico enriquecido nunca é materializado em pandas. Com memory_limit e
+    temp_directory, o DuckDB grava em disco o que não couber na memória. As linhas saem na ordem
+    das categorias da entrada, como no pandas; lidas direto de arquivos parquet, em ordem alfabética.
+    """
+
+    name = "duckdb"
+
+    def __init__(self, database: str = ":memory:", memory_limit: str | None = None, temp_directory: str | None = None):
+        try:
+            import duckdb
+        except ImportError as e:
+            raise ImportError("O backend duckdb precisa do pacote duckdb (pip install duckdb).") from e
+
+        config = {}
+        if memory_limit:
+            config["memory_limit"] = memory_limit
+        if temp_directory:
+            config["temp_directory"] = temp_directory
+        self.con = duckdb.connect(database, config=config)
+        self._views = 0
+
+    def _relation(self, df: pd.DataFrame):
+        # Cada DataFrame vira uma view com nome próprio; o DuckDB lê os arrays do pandas sem copiar
+        self._views += 1
+        nome = f"entrada_{self._views}"
+        self.con.register(nome, df)
+        return nome
+
+    def _query(self, sql: str, params=None):
+        return self.con.sql(sql, params=params) if params else self.con.sql(sql)
+
+    def filter(self, history, start_date: date, end_date: date):
+        inicio, fim = pd.Timestamp(start_date), pd.Timestamp(end_date)
+        if isinstance(history, HistoryStore):
+            # Mesma poda de partições de HistoryStore.read, lendo os parquets direto no DuckDB
+            semanas = _ano_semana(pd.Series([inicio, fim]))
+            paths = [
+                history._partition_path(ano_semana)
+                for ano_semana in history.partitions()
+                if int(semanas.iloc[0]) <= ano_semana <= int(semanas.iloc[1])
+            ]
+            if not paths:
+                # O vazio tipado do HistoryStore, para as funções de data do DuckDB
+                return self.con.from_df(history.read(start_date, end_date))
+            fonte = "read_parquet(" + repr(paths) + ")"
+        elif isinstance(history, (str, list)):
+            # Arquivos parquet (ou um glob) lidos sem passar pelo pandas
+            fonte = f"read_parquet({history!r})"
+        else:
+            fonte = self._relation(history)
+
+        return self._query(
+            f"SELECT * REPLACE (CAST(data_entrega AS TIMESTAMP) AS data_entrega) FROM {fonte} "
+            "WHERE CAST(data_entrega AS TIMESTAMP) BETWEEN $inicio AND $fim",
+            {"inicio": inicio.to_pydatetime(), "fim": fim.to_pydatetime()},
+        )
+
+    def enrich(self, relation, lag: int = 7):
+        nome = self._relation_name(relation)
+        if self._query(f"SELECT 1 FROM {nome} LIMIT 1").fetchone() is None:
+            raise ValueError(EMPTY_WINDOW)
+        particao = ", ".join(LAG_KEYS)
+        # round_even arredonda meio para o par, como o round do pandas
+        return self._query(f"""
+            WITH base AS (
+                SELECT *,
+                    year(data_entrega) AS ano,
+                    isodow(data_entrega) - 1 AS dds,
+                    month(data_entrega) AS mes,
+                    weekofyear(data_entrega) AS semana,
+                    year(data_entrega) * 100 + weekofyear(data_entrega) AS ano_semana
+                FROM {nome}
+            ),
+            defasada AS (
+                SELECT *, lag(qtd_pedido, {int(lag)}) OVER (PARTITION BY {particao} ORDER BY data_entrega) AS qtd_pedido_lw
+                FROM base
+            )
+            SELECT * REPLACE (coalesce(qtd_pedido_lw, 0) AS qtd_pedido_lw),
+                coalesce(round_even(qtd_pedido / qtd_pedido_lw - 1, 4), 0) AS var_lw
+            FROM defasada
+            WHERE ano_semana < (SELECT max(ano_semana) FROM base)
+        """)
+
+    def _relation_name(self, relation) -> str:
+        if isinstance(relation, pd.DataFrame):
+            return self._relation(relation)
+        self._views += 1
+        nome = f"etapa_{self._views}"
+        relation.create_view(nome)
+        return nome
+
+    def allowed_squares(self, end_date: date, relation, weeks: int = 6) -> pd.DataFrame:
+        nome = self._relation_name(relation)
+        return apply_schema(self._query(
+            f"SELECT DISTINCT modal, logistic_region FROM {nome} "
+            "WHERE CAST(data_entrega AS DATE) BETWEEN $inicio AND $fim",
+            {"inicio": end_date - timedelta(weeks=weeks), "fim": end_date},
+        ).df())
+
+    def central_tendency(self, relation, cols_to_calc: list, type: str | list = "median") -> pd.DataFrame:
+        nome = self._relation_name(relation)
+        estatisticas = [type] if isinstance(type, str) else list(type)
+        medidas = []
+        for estatistica in estatisticas:
+            for col in cols_to_calc:
+                valor = f"coalesce({col}, 0)"
+                if estatistica == "median":
+                    expressao = f"median({valor})"
+                elif estatistica == "mean":
+                    expressao = f"avg({valor})"
+                elif estatistica.startswith("q") and estatistica[1:].isdigit():
+                    expressao = f"quantile_cont({valor}, {int(estatistica[1:]) / 100})"
+                else:
+                    raise ValueError(f"Medida de tendência central não suportada: {estatistica}")
+                medidas.append(f"{expressao} AS {estatistica}_{col}")
+
+        chaves = ", ".join(MEDIAN_KEYS)
+        return apply_schema(self._query(f"SELECT {chaves}, {', '.join(medidas)} FROM {nome} GROUP BY {chaves}").df())
+
+    def baseline_forecast(self, dias_previsao: pd.DataFrame, baseline: pd.DataFrame) -> pd.DataFrame:
+        dias = self._relation(dias_previsao)
+        nome = self._relation(baseline[MEDIAN_KEYS + ["orders"]])
+        chaves = ", ".join(f"b.{col}" for col in FORECAST_KEYS)
+        longo = self._query(f"""
+            SELECT {chaves}, CAST(d.data_entrega AS DATE) AS data_entrega, sum(b.orders) AS orders
+            FROM {nome} b JOIN {dias} d ON d.dds = b.dds
+            GROUP BY ALL
+        """)
+        datas = [linha[0] for linha in self._query(f"SELECT DISTINCT data_entrega FROM ({longo.sql_query()}) ORDER BY 1").fetchall()]
+        if not datas:
+            return pd.DataFrame(columns=FORECAST_KEYS)
+
+        # Uma coluna por data, na ordem de create_baseline_forecast: praça e depois as demais chaves
+        colunas = ", ".join(f"coalesce(sum(orders) FILTER (WHERE data_entrega = DATE '{data}'), 0) AS \"{data}\"" for data in datas)
+        ordem = ", ".join(["logistic_region"] + [col for col in FORECAST_KEYS if col != "logistic_region"])
+        largo = self._query(
+            f"SELECT {', '.join(FORECAST_KEYS)}, {colunas} FROM ({longo.sql_query()}) "
+            f"GROUP BY {', '.join(FORECAST_KEYS)} ORDER BY {ordem}"
+        ).df()
+        largo.columns = FORECAST_KEYS + datas
+        largo.columns.name = "data_entrega"
+        return apply_schema(largo)
+
+    def consolidate(self, baseline_melted: pd.DataFrame, fct_brasil: pd.DataFrame, quebras: list, group_cols=("shift", "turno_g")) -> pd.DataFrame:
+        base = self._relation(baseline_melted)
+        if isinstance(fct_brasil, TopForecastLookup):
+            fct_brasil = fct_brasil.frame
+        fct = self._relation(fct_brasil[["ORIGEM", "data_entrega", "modal", "planned_orders"]])
+        pracas = [quebra for quebra in quebras if quebra != "BRASIL_SEM_PRACA"]
+        tipos = ["gerencial" if group_col == "shift" else group_col for group_col in group_cols]
+
+        origem = (
+            "CASE WHEN CAST(logistic_region AS VARCHAR) IN (SELECT unnest($pracas)) "
+            "THEN CAST(logistic_region AS VARCHAR) ELSE 'BRASIL_SEM_PRACA' END"
+        )
+        empilhado = " UNION ALL ".join(
+            f"SELECT {i} AS ordem_tipo, ORIGEM, data_entrega, modal, big_region, logistic_region, "
+            f"CAST({group_col} AS VARCHAR) AS shift, qtd_pedidos FROM origens"
+            for i, group_col in enumerate(group_cols)
+        )
+        df_final = self._query(f"""
+            WITH origens AS (
+                SELECT *, {origem} AS ORIGEM FROM {base}
+            ),
+            empilhado AS ({empilhado}),
+            consolidar AS (
+                SELECT ordem_tipo, list_position($quebras, ORIGEM) AS ordem_origem, ORIGEM,
+                    data_entrega, CAST(modal AS VARCHAR) AS modal, CAST(big_region AS VARCHAR) AS big_region,
+                    CAST(logistic_region AS VARCHAR) AS logistic_region, shift, sum(qtd_pedidos) AS qtd_pedidos
+                FROM empilhado
+                WHERE list_contains($quebras, ORIGEM)
+                    AND data_entrega IS NOT NULL AND modal IS NOT NULL AND big_region IS NOT NULL
+                    AND logistic_region IS NOT NULL AND shift IS NOT NULL
+                GROUP BY ALL
+            ),
+            com_share AS (
+                SELECT *, qtd_pedidos / sum(qtd_pedidos) OVER (PARTITION BY ordem_tipo, ordem_origem, data_entrega, modal) AS share
+                FROM consolidar
+            )
+            SELECT c.data_entrega AS date, c.big_region AS region, c.modal AS business_model, c.logistic_region, c.shift,
+                c.share * f.planned_orders AS orders, list_extract($tipos, c.ordem_tipo + 1) AS tipo
+            FROM com_share c
+            JOIN {fct} f ON f.ORIGEM = c.ORIGEM AND f.data_entrega = c.data_entrega AND f.modal = c.modal
+            WHERE f.planned_orders IS NOT NULL AND c.share * f.planned_orders > 0
+            ORDER BY c.ordem_tipo, c.ordem_origem, c.data_entrega, c.modal, c.big_region, c.logistic_region, c.shift
+        """, {"pracas": pracas, "quebras": list(quebras), "tipos": tipos}).df()
+
+        # O SQL devolve texto; as colunas voltam às categorias que o pandas tira da entrada
+        def categorias(col):
+            valores = baseline_melted[col]
+            if isinstance(valores.dtype, pd.CategoricalDtype):
+                return valores.cat.categories
+            return sorted(valores.dropna().unique())
+
+        return df_final.astype({
+            "region": pd.CategoricalDtype(categorias("big_region")),
+            "business_model": pd.CategoricalDtype(categorias("modal")),
+            "logistic_region": pd.CategoricalDtype(categorias("logistic_region")),
+            "shift": pd.CategoricalDtype(sorted(set().union(*(baseline_melted[col].dropna().unique() for col in group_cols)))),
+        })
+
+    def collect(self, value) -> pd.DataFrame:
+        if isinstance(value, pd.DataFrame):
+            return value
+        return apply_schema(value.df())
+
+
+BACKENDS = {"pandas": PandasBackend, "duckdb": DuckDBBackend}
+
+
+def _compare(esperado: pd.DataFrame, obtido: pd.DataFrame, sort_by: list) -> str | None:
+    # Devolve None quando os dois resultados são iguais, ou a primeira diferença encontrada
+    # Ordena pelo texto das chaves: a ordem das categorias depende da origem (um HistoryStore mantém
+    # a ordem dos dicionários do parquet), e a ordem das linhas não faz parte da paridade
+    def ordenar(df):
+        df = df.reset_index(drop=True)
+        return df.loc[df[sort_by].astype(str).sort_values(sort_by, kind="stable").index].reset_index(drop=True)
+
+    if esperado.empty and obtido.empty:
+        # Uma etapa sem linhas nos dois backends não prova nada (uma previsão sem datas, por exemplo)
+        return "nenhuma linha para comparar"
+    faltando = [col for col in esperado.columns if col not in obtido.columns]
+    if faltando:
+        return f"colunas ausentes: {', '.join(faltando)}"
+    categoricas = [
+        col for col in esperado.columns
+        if isinstance(esperado[col].dtype, pd.CategoricalDtype) != isinstance(obtido[col].dtype, pd.CategoricalDtype)
+    ]
+    if categoricas:
+        return f"colunas categóricas em só um dos backends: {', '.join(categoricas)}"
+
+    esperado, obtido = ordenar(esperado), ordenar(obtido)
+    try:
+        pd.testing.assert_frame_equal(
+            esperado.reset_index(drop=True), obtido[list(esperado.columns)].reset_index(drop=True),
+            check_dtype=False, check_categorical=False, check_names=False,
+        )
+    except (AssertionError, KeyError) as e:
+        return str(e).splitlines()[0] if str(e) else type(e).__name__
+    return None
+
+
+def _planned_from_baseline(baseline_melted: pd.DataFrame, quebras: list) -> pd.DataFrame:
+    # Previsão top no formato de process_all tirada do próprio baseline: o total de cada origem,
+    # modal e data, para comparar a consolidação quando não há um arquivo de previsão
+    pracas = [quebra for quebra in quebras if quebra != "BRASIL_SEM_PRACA"]
+    logistic_region = baseline_melted["logistic_region"].astype(object)
+    origem = logistic_region.where(logistic_region.isin(pracas), "BRASIL_SEM_PRACA")
+    return (
+        baseline_melted.assign(ORIGEM=origem, modal=baseline_melted["modal"].astype(object))
+        .groupby(["ORIGEM", "modal", "data_entrega"])["qtd_pedidos"].sum()
+        .rename("planned_orders").astype("float64").reset_index()
+    )
+
+
+def backend_parity(history, start_date: date, end_date: date, delivery_date: date, incluir_mes_seguinte=False, candidate="duckdb",
+                   top_forecasting=None, quebras=None) -> pd.DataFrame:
+    """Roda as etapas do baseline e a consolidação por praça no backend pandas e no candidato e compara
+    o resultado de cada uma.
+
+    A consolidação usa o baseline gerado por cada backend e a previsão top (top_forecasting) ou, sem
+    ela, os totais do próprio baseline. As linhas são comparadas ordenadas pelas chaves, e não na
+    ordem de saída de cada backend. Retorna uma linha por etapa, com a primeira diferença encontrada
+    (ou None).
+    """
+    from backend import DateUtils, FixingTopForecastingFile
+    from pipelines import QUEBRAS
+
+    referencia, candidato = PandasBackend(), get_backend(candidate)
+    dias_previsao = DateUtils.generate_dates_until_end_of_month(delivery_date, incluir_mes_seguinte)
+    chaves_linha = LAG_KEYS + ["data_entrega"]
+    etapas = []
+
+    def registrar(etapa, esperado, obtido, sort_by):
+        obtido = candidato.collect(obtido)
+        etapas.append({
+            "etapa": etapa,
+            "linhas_pandas": len(esperado),
+            f"linhas_{candidato.name}": len(obtido),
+            "diferenca": _compare(esperado, obtido, sort_by),
+        })
+
+    history_pandas = history.copy() if isinstance(history, pd.DataFrame) else history
+    filtrado = referencia.filter(history_pandas, start_date, end_date)
+    filtrado_candidato = candidato.filter(history, start_date, end_date)
+    registrar("filter", filtrado, filtrado_candidato, chaves_linha)
+
+    enriquecido = referencia.enrich(filtrado)
+    enriquecido_candidato = candidato.enrich(filtrado_candidato)
+    registrar("enrich", enriquecido, enriquecido_candidato, chaves_linha)
+
+    pracas = referencia.allowed_squares(end_date, enriquecido.copy())
+    registrar("allowed_squares", pracas, candidato.allowed_squares(end_date, enriquecido_candidato), ["modal", "logistic_region"])
+
+    medianas = referencia.central_tendency(enriquecido, ["var_lw", "qtd_pedido"], "median")
+    medianas_candidato = candidato.central_tendency(enriquecido_candidato, ["var_lw", "qtd_pedido"], "median")
+    registrar("central_tendency", medianas, medianas_candidato, MEDIAN_KEYS)
+
+    previsao = referencia.baseline_forecast(dias_previsao, DataProcessor.clip_growth_and_merge(medianas))
+    previsao_candidato = candidato.collect(
+        candidato.baseline_forecast(dias_previsao, DataProcessor.clip_growth_and_merge(medianas_candidato))
+    )
+    registrar("baseline_forecast", previsao, previsao_candidato, FORECAST_KEYS)
+
+    quebras = list(quebras or QUEBRAS)
+    melted = DataProcessor.melting_baseline_adjusted(previsao)
+    melted_candidato = DataProcessor.melting_baseline_adjusted(previsao_candidato)
+    if top_forecasting is not None:
+        fct_brasil = FixingTopForecastingFile(top_forecasting).process_all()
+    else:
+        fct_brasil = _planned_from_baseline(melted, quebras)
+    registrar(
+        "consolidate_region_data",
+        referencia.consolidate(melted, fct_brasil, quebras),
+        candidato.consolidate(melted_candidato, fct_brasil, quebras),
+        ["tipo", "date", "business_model", "logistic_region", "region", "shift"],
+    )
+
+    relatorio = pd.DataFrame(etapas)
+    relatorio["igual"] = relatorio["diferenca"].isna()
+    return relatorio
+
+
+def get_backend(backend="pandas", **options):
+    """Aceita o nome de um backend (com as opções do construtor) ou uma instância já criada."""
+    if not isinstance(backend, str):
+        return backend
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend não suportado: {backend}")
+    return BACKENDS[backend](**options)
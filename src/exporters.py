@@ -0,0 +1,82 @@
+import hashlib
+import io
+import pandas as pd
+
+EXPORT_FORMATS = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv",
+    "parquet": "application/octet-stream",
+}
+# Linhas convertidas para objetos Python de cada vez na escrita do xlsx
+XLSX_CHUNK_ROWS = 5_000
+
+
+def dataframe_hash(df: pd.DataFrame) -> str:
+    """Hash do conteúdo do DataFrame (valores e nomes de colunas), usado como chave das exportações."""
+    digest = hashlib.sha256()
+    digest.update(repr(list(df.columns)).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def _column_values(serie: pd.Series) -> list:
+    # Valores Python simples; ausentes viram None, que o xlsxwriter grava como célula vazia
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return [None if pd.isna(value) else value.to_pydatetime() for value in serie]
+    return serie.astype(object).where(serie.notna(), None).tolist()
+
+
+def _write_xlsx(df: pd.DataFrame, buffer: io.BytesIO, sheet_name: str = "Sheet1"):
+    import xlsxwriter
+
+    # constant_memory grava linha a linha em arquivo temporário em vez de manter a planilha na memória;
+    # por isso as células precisam ser escritas em ordem de linha
+    workbook = xlsxwriter.Workbook(buffer, {"constant_memory": True})
+    worksheet = workbook.add_worksheet(sheet_name)
+    header_format = workbook.add_format({"bold": True, "border": 1, "align": "center"})
+    header_date_format = workbook.add_format({"bold": True, "border": 1, "align": "center", "num_format": "yyyy-mm-dd"})
+    datetime_format = workbook.add_format({"num_format": "yyyy-mm-dd hh:mm:ss"})
+    date_format = workbook.add_format({"num_format": "yyyy-mm-dd"})
+
+    # O baseline largo tem datas como nomes de coluna
+    for col, name in enumerate(df.columns):
+        if isinstance(name, pd.Timestamp):
+            worksheet.write_datetime(0, col, name.to_pydatetime(), header_date_format)
+        elif hasattr(name, "isoformat"):
+            worksheet.write_datetime(0, col, name, header_date_format)
+        else:
+            worksheet.write(0, col, name, header_format)
+
+    formatos = [
+        datetime_format if pd.api.types.is_datetime64_any_dtype(df[col])
+        else date_format if len(df) and hasattr(df[col].iloc[0], "isoformat")
+        else None
+        for col in df.columns
+    ]
+    # As linhas são convertidas em fatias de tamanho fixo: só uma fatia vira objetos Python por vez
+    for inicio in range(0, len(df), XLSX_CHUNK_ROWS):
+        fatia = df.iloc[inicio:inicio + XLSX_CHUNK_ROWS]
+        colunas = [_column_values(fatia[col]) for col in fatia.columns]
+        for row, valores in enumerate(zip(*colunas), start=inicio + 1):
+            for col, value in enumerate(valores):
+                if value is None:
+                    continue
+                if formatos[col] is not None:
+                    worksheet.write_datetime(row, col, value, formatos[col])
+                else:
+                    worksheet.write(row, col, value)
+    workbook.close()
+
+
+def export_dataframe(df: pd.DataFrame, file_format: str) -> bytes:
+    buffer = io.BytesIO()
+    if file_format == "xlsx":
+        _write_xlsx(df, buffer)
+    elif file_format == "csv":
+        buffer.write(df.to_csv(index=False).encode("utf-8"))
+    elif file_format == "parquet":
+        # Parquet só aceita nomes de coluna em texto (o baseline largo tem datas como colunas)
+        df.rename(columns=str).to_parquet(buffer, index=False)
+    else:
+        raise ValueError(f"Formato de exportação não suportado: {file_format}")
+    return buffer.getvalue()
@@ -0,0 +1,154 @@
+import os
+import threading
+from collections import OrderedDict
+import pandas as pd
+import pyarrow as pa
+from validation import ValidationErrors
+
+
+class _FrozenFrame:
+    """Cópia imutável de um DataFrame: uma pyarrow.Table quando o Arrow representa os tipos sem perda,
+    ou o próprio DataFrame (entregue sempre como cópia) quando não representa."""
+
+    def __init__(self, df: pd.DataFrame):
+        self.columns = df.columns
+        self.table = None
+        self.frame = None
+        try:
+            # Nomes de coluna viram posições, já que o Arrow só aceita texto (o baseline ajustado usa datas)
+            table = pa.Table.from_pandas(df.set_axis([str(i) for i in range(df.shape[1])], axis=1), preserve_index=False)
+            self.table = table.combine_chunks()
+            view = self.view()
+            if not (view.dtypes.tolist() == df.dtypes.tolist() and view.index.equals(df.index)):
+                self.table = None
+        except (pa.ArrowException, TypeError, ValueError):
+            self.table = None
+
+        if self.table is None:
+            self.frame = df.copy()
+
+    @property
+    def nbytes(self) -> int:
+        if self.table is not None:
+            return self.table.nbytes
+        return int(self.frame.memory_usage(deep=True).sum())
+
+    def view(self) -> pd.DataFrame:
+        if self.table is None:
+            return self.frame.copy()
+        # split_blocks mantém cada coluna apontando para o buffer do Arrow: nada é copiado, e os
+        # arrays são somente leitura, então nenhuma sessão altera a cópia compartilhada
+        df = self.table.to_pandas(split_blocks=True)
+        df.columns = self.columns
+        return df
+
+
+def _freeze(value):
+    if isinstance(value, pd.DataFrame):
+        return _FrozenFrame(value)
+    if isinstance(value, (ValidationErrors, list)):
+        # Erros são mutáveis (truncate, extend): a entrada guarda a sua cópia e entrega outras
+        return value.copy()
+    if isinstance(value, tuple):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def _view(value):
+    if isinstance(value, _FrozenFrame):
+        return value.view()
+    if isinstance(value, (ValidationErrors, list)):
+        return value.copy()
+    if isinstance(value, tuple):
+        return tuple(_view(item) for item in value)
+    return value
+
+
+def _nbytes(value) -> int:
+    if isinstance(value, _FrozenFrame):
+        return value.nbytes
+    if isinstance(value, tuple):
+        return sum(_nbytes(item) for item in value)
+    return 0
+
+
+class SharedFrameStore:
+    """Arquivos já lidos e validados, um por hash de conteúdo, compartilhados por todas as sessões e páginas.
+
+    Cada entrada é guardada uma única vez em Arrow e cada get_or_load devolve visões sem cópia.
+    Quando a soma das entradas passa de budget_mb, as menos usadas recentemente saem primeiro.
+    """
+
+    def __init__(self, budget_mb: float = 1024):
+        self.budget_bytes = int(budget_mb * 2**20)
+        self._entries = OrderedDict()
+        self._loading = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_load(self, kind: str, content_hash: str, load):
+        key = (kind, content_hash)
+        while True:
+            with self._lock:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return _view(self._entries[key])
+                carregando = self._loading.get(key)
+                if carregando is None:
+                    # Esta chamada carrega; outras sessões pedindo o mesmo arquivo esperam por ela
+                    self._loading[key] = threading.Event()
+                    self.misses += 1
+                    break
+            carregando.wait()
+
+        try:
+            value = load()
+            frozen = _freeze(value)
+            with self._lock:
+                self._store(key, frozen)
+            return _view(frozen)
+        finally:
+            with self._lock:
+                self._loading.pop(key).set()
+
+    def _store(self, key: tuple, frozen):
+        if _nbytes(frozen) > self.budget_bytes:
+            return
+        self._entries[key] = frozen
+        while self.memory_bytes() > self.budget_bytes:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def memory_bytes(self) -> int:
+        return sum(_nbytes(value) for value in self._entries.values())
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entradas": len(self._entries),
+                "memoria_mb": round(self.memory_bytes() / 2**20, 2),
+                "orcamento_mb": round(self.budget_bytes / 2**20, 2),
+                "hits": self.hits,
+                "misses": self.misses,
+                "despejos": self.evictions,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_shared_store = None
+_shared_lock = threading.Lock()
+
+
+def shared_frame_store() -> SharedFrameStore:
+    """SharedFrameStore único do processo; o orçamento vem de CACHE_COMPARTILHADO_MB (padrão 1024)."""
+    global _shared_store
+    with _shared_lock:
+        if _shared_store is None:
+            _shared_store = SharedFrameStore(float(os.environ.get("CACHE_COMPARTILHADO_MB", 1024)))
+        return _shared_store
@@ -1,6 +1,13 @@
+import os
+import time
+import uuid
 import streamlit as st
 import pandas as pd
-import io
+from cache import StageCache
+from exporters import EXPORT_FORMATS, dataframe_hash, export_dataframe
+from jobs import JobCancelled
+from reconciliation import ReconciliationError
+from validation import ValidationErrors
 
 class PageConfig:
     def __init__(self, page_title="Gerador de Baseline", layout="centered"):
@@ -43,6 +50,97 @@ class MessageDisplay:
     def display_wrong_message(self):
         st.error("Houve um problema durante o processamento. Verifique os erros.")
 
+    def display_stage_timings(self):
+        """Cria o espaço onde os tempos de cada etapa aparecem conforme o pipeline avança."""
+        self.stage_spans = []
+        self.timings_placeholder = st.empty()
+
+    def update_stage_event(self, event):
+        # Ouvinte dos eventos do PipelineInstrumentation
+        if event["type"] == "span_start":
+            self.update_processing_message(f"Executando etapa: {event['stage']}...")
+        elif event["type"] == "log":
+            self.update_processing_message(event["message"])
+        elif event["type"] == "span" and getattr(self, "timings_placeholder", None):
+            self.stage_spans.append(event)
+            tempos = pd.DataFrame(self.stage_spans)[
+                ["stage", "seconds", "rows_in", "rows_out", "memory_before_mb", "memory_after_mb"]
+            ]
+            self.timings_placeholder.dataframe(tempos, hide_index=True)
+
+    def cancel_button(self) -> bool:
+        return st.button("Cancelar processamento", key="cancelar_processamento")
+
+    def follow_job(self, job, poll_seconds: float = 0.25):
+        """Repassa os eventos do job para a página até ele terminar e devolve o resultado.
+
+        A página pode ser reexecutada a qualquer momento por uma interação; o job continua no
+        JobRunner e a nova execução volta a acompanhá-lo do primeiro evento.
+        """
+        status = st.empty()
+        inicio = time.perf_counter()
+        posicao = 0
+        while True:
+            concluido = job.done()
+            eventos = job.events_since(posicao)
+            for event in eventos:
+                self.update_stage_event(event)
+            posicao += len(eventos)
+            if concluido:
+                break
+            # Escrever na página a cada volta também deixa o streamlit interromper este laço numa reexecução
+            status.caption(f"Processando em segundo plano há {time.perf_counter() - inicio:.0f}s...")
+            time.sleep(poll_seconds)
+        status.empty()
+
+        try:
+            return job.result()
+        except JobCancelled:
+            st.info("Processamento cancelado.")
+            return None
+        except ReconciliationError as e:
+            self.display_reconciliation(e.report)
+            return None
+        except ValueError as e:
+            # Entradas que não permitem seguir (janela sem pedidos, por exemplo)
+            st.error(str(e))
+            return None
+
+    def display_reconciliation(self, report):
+        # Onde a consolidação diverge: resumo por verificação e a tabela de grupos para baixar
+        st.error("Inconsistência detectada na consolidação.")
+        st.dataframe(
+            report.summary(),
+            column_config={
+                "verificacao": "Verificação", "grupos": "Grupos", "divergentes": "Divergentes",
+                "maior_diferenca": "Maior diferença",
+            },
+            hide_index=True,
+        )
+        st.dataframe(report.mismatches.head(100), hide_index=True)
+        with st.expander("Baixar todas as divergências"):
+            ResultDisplay().display_export(report.mismatches, "divergencias.csv")
+
+    def display_shared_cache_stats(self, stats: dict):
+        st.caption(
+            f"Cache compartilhado: {stats['entradas']} arquivo(s), {stats['memoria_mb']} de {stats['orcamento_mb']} MB, "
+            f"{stats['hits']} acerto(s), {stats['misses']} leitura(s), {stats['despejos']} descartado(s)."
+        )
+
+    def display_timings_export(self, instrumentation):
+        st.download_button(
+            label="Baixar tempos das etapas (JSON)",
+            data=instrumentation.to_json(),
+            file_name="tempos_etapas.json",
+            mime="application/json"
+        )
+
+class SessionInfo:
+    @staticmethod
+    def session_id(page: str) -> str:
+        # Identifica a sessão (e a página, que acompanha o seu próprio job) no JobRunner compartilhado
+        return f'{st.session_state.setdefault("session_id", uuid.uuid4().hex)}:{page}'
+
 class DateInputs:
     @staticmethod
     def data_inicial():
@@ -65,30 +163,77 @@ class DateInputs:
         incluir_mes_seguinte = st.checkbox("Incluir mês seguinte na previsão?", key="incluir_mes_seguinte")
         return incluir_mes_seguinte
 
+class HistoryInputs:
+    @staticmethod
+    def usar_historico_salvo(indisponivel: str | None = None):
+        # indisponivel é o motivo (histórico salvo não configurado, por exemplo) para desabilitar a opção
+        usar_historico = st.checkbox(
+            "Acrescentar o arquivo ao histórico salvo e gerar o baseline a partir dele?",
+            key="usar_historico_salvo", disabled=indisponivel is not None, help=indisponivel
+        )
+        return usar_historico and indisponivel is None
+
+    @staticmethod
+    def max_erros():
+        max_erros = st.number_input(
+            "Parar a validação após quantas linhas com erro? (0 = validar o arquivo inteiro)",
+            min_value=0, value=0, step=1, key="max_erros"
+        )
+        return int(max_erros) or None
+
 class ResultDisplay:
     def display_results(self, result, errors, df, success_message, file_name):
-        if errors:
+        if isinstance(errors, ValidationErrors) and errors:
+            self.display_validation_errors(errors)
+        elif errors:
             for error in errors:
                 st.error(f"Erro na validação: {error}")
         else:
             st.success(success_message)
+            self.display_export(df, file_name)
 
-            buffer = io.BytesIO()
+    def display_validation_errors(self, errors: ValidationErrors, max_samples: int = 5):
+        # Uma linha por coluna e regra, em vez de um st.error por linha inválida
+        for message in errors.messages:
+            st.error(f"Erro na validação: {message}")
+        if not errors.rows:
+            return
 
-            # Salvar o DataFrame no buffer como Excel
-            with pd.ExcelWriter(buffer, engine='xlsxwriter') as writer:
-                df.to_excel(writer, index=False, sheet_name='Sheet1')
+        aviso = f"{errors.rows} linhas com erro de validação."
+        if errors.truncated:
+            aviso += " A validação parou antes do fim do arquivo."
+        st.error(aviso)
+        st.dataframe(
+            errors.summary(max_samples),
+            column_config={
+                "coluna": "Coluna", "regra": "Regra", "ocorrencias": "Ocorrências",
+                "linhas_exemplo": f"Linhas (até {max_samples})",
+            },
+            hide_index=True,
+        )
+        with st.expander("Baixar todos os erros"):
+            self.display_export(errors.to_frame(), "erros_validacao.csv")
+
+    def display_export(self, df, file_name):
+        # O arquivo só é gerado quando pedido e fica guardado pelo hash do resultado e pelo formato
+        nome = os.path.splitext(file_name)[0]
+        exportacoes = st.session_state.setdefault("exportacoes", StageCache(max_entries=4))
+
+        formato = st.radio("Formato do arquivo", list(EXPORT_FORMATS), horizontal=True, key=f"formato_{nome}")
+        chave = (dataframe_hash(df), formato)
 
-            # Definir o ponteiro do buffer para o início
-            buffer.seek(0)
+        if not exportacoes.contains(nome, chave):
+            if not st.button("Gerar arquivo para download", key=f"gerar_{nome}"):
+                return
+            with st.spinner("Gerando arquivo..."):
+                exportacoes.get_or_compute(nome, chave, lambda: export_dataframe(df, formato))
 
-            # Adicionar um botão para download
-            st.download_button(
-                label="Baixar como Excel",
-                data=buffer,
-                file_name=file_name,
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            )
+        st.download_button(
+            label=f"Baixar como {formato}",
+            data=exportacoes.get_or_compute(nome, chave, lambda: export_dataframe(df, formato)),
+            file_name=f"{nome}.{formato}",
+            mime=EXPORT_FORMATS[formato]
+        )
 
     def display_baseline_results(self, result, errors, df):
         self.display_results(
@@ -111,14 +256,16 @@ class ResultDisplay:
     def display_top_forecasting_results(self, df, success, errors):
         if not success:
             st.error("Erro ao processar o arquivo. Verifique a mensagem abaixo:")
-            st.error(errors)
+            for error in errors:
+                st.error(error)
         else:
             pass
 
     def display_baseline_adjusted_results(self, df, success, errors):
         if not success:
             st.error("Erro ao processar o arquivo. Verifique a mensagem abaixo:")
-            st.error(errors)
+            for error in errors:
+                st.error(error)
         else:
             pass
 
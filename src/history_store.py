@@ -0,0 +1,120 @@
+import hashlib
+import os
+import threading
+from datetime import date
+import pandas as pd
+from contrato import Orders
+from schema import apply_schema
+
+# Colunas que identificam um pedido no histórico; qtd_pedido é o valor e não entra na chave
+ORDER_KEYS = [col for col in Orders.model_fields.keys() if col != "qtd_pedido"]
+PARTITION_COL = "ano_semana"
+
+# Um lock por pasta, compartilhado pelas instâncias: cada execução da página cria o seu HistoryStore
+_append_locks = {}
+_append_locks_lock = threading.Lock()
+
+
+def _ano_semana(datas: pd.Series) -> pd.Series:
+    calendario = datas.dt.isocalendar()
+    return (calendario["year"] * 100 + calendario["week"]).astype("int64")
+
+
+class HistoryStore:
+    """Histórico de pedidos em parquet, particionado por ano_semana (ano ISO * 100 + semana).
+
+    root (ou HISTORICO_PATH) precisa ser um caminho absoluto: um caminho relativo dependeria da pasta
+    de onde o app foi iniciado.
+    """
+
+    def __init__(self, root: str | None = None):
+        root = root or os.environ.get("HISTORICO_PATH")
+        if not root:
+            raise ValueError("Histórico salvo não configurado: defina HISTORICO_PATH com o caminho absoluto da pasta.")
+        if not os.path.isabs(root):
+            raise ValueError(f"O caminho do histórico salvo precisa ser absoluto: {root}")
+        self.root = root
+        with _append_locks_lock:
+            self._lock = _append_locks.setdefault(os.path.realpath(root), threading.Lock())
+
+    def _partition_path(self, ano_semana: int) -> str:
+        return os.path.join(self.root, f"{PARTITION_COL}={ano_semana}", "part.parquet")
+
+    def partitions(self) -> list:
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(
+            int(nome.split("=", 1)[1])
+            for nome in os.listdir(self.root)
+            if nome.startswith(f"{PARTITION_COL}=")
+        )
+
+    def is_empty(self) -> bool:
+        return not self.partitions()
+
+    def fingerprint(self) -> str:
+        """Muda sempre que alguma partição é regravada; usado como chave de cache."""
+        digest = hashlib.sha256()
+        for ano_semana in self.partitions():
+            stat = os.stat(self._partition_path(ano_semana))
+            digest.update(f"{ano_semana}:{stat.st_mtime_ns}:{stat.st_size};".encode())
+        return digest.hexdigest()
+
+    def append(self, df: pd.DataFrame, log_callback=None) -> int:
+        """Acrescenta pedidos já validados, regravando apenas as semanas presentes em df.
+
+        Pedidos repetidos nas colunas-chave do contrato ficam com o valor mais recente.
+        Retorna o número de partições regravadas. Gravações na mesma pasta acontecem uma de cada vez,
+        para que duas sessões não regravem a mesma semana a partir da mesma versão anterior.
+        """
+        novos = df[list(Orders.model_fields.keys())].copy()
+        novos["data_entrega"] = pd.to_datetime(novos["data_entrega"])
+        semanas = _ano_semana(novos["data_entrega"])
+
+        with self._lock:
+            for ano_semana, semana in novos.groupby(semanas, sort=True):
+                path = self._partition_path(ano_semana)
+                if os.path.exists(path):
+                    semana = pd.concat([pd.read_parquet(path), semana], ignore_index=True)
+                semana = (
+                    semana
+                    .drop_duplicates(subset=ORDER_KEYS, keep="last")
+                    .sort_values(by=ORDER_KEYS)
+                    .reset_index(drop=True)
+                )
+
+                # Grava em arquivo temporário e troca de uma vez para não deixar partição pela metade
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.tmp"
+                semana.to_parquet(tmp_path, index=False)
+                os.replace(tmp_path, path)
+                if log_callback:
+                    log_callback(f"Semana {ano_semana} gravada no histórico ({len(semana)} linhas).")
+
+        return semanas.nunique()
+
+    def read(self, start_date: date, end_date: date, columns: list | None = None) -> pd.DataFrame:
+        """Lê só as partições da janela e empurra o filtro de datas para o leitor parquet."""
+        inicio = pd.Timestamp(start_date)
+        fim = pd.Timestamp(end_date)
+        semanas = _ano_semana(pd.Series([inicio, fim]))
+        primeira, ultima = int(semanas.iloc[0]), int(semanas.iloc[1])
+
+        paths = [
+            self._partition_path(ano_semana)
+            for ano_semana in self.partitions()
+            if primeira <= ano_semana <= ultima
+        ]
+        colunas = columns or list(Orders.model_fields.keys())
+        if not paths:
+            # Vazio com os mesmos tipos de uma leitura com dados, para as etapas seguintes (.dt, categorias)
+            vazio = pd.DataFrame({col: pd.Series(dtype="datetime64[ns]" if col == "data_entrega" else object) for col in colunas})
+            return apply_schema(vazio)
+
+        filtros = [("data_entrega", ">=", inicio), ("data_entrega", "<=", fim)]
+        df = pd.concat(
+            [pd.read_parquet(path, columns=colunas, filters=filtros) for path in paths],
+            ignore_index=True,
+        )
+        df = df.sort_values(by="data_entrega", kind="stable").reset_index(drop=True)
+        return apply_schema(df)
@@ -0,0 +1,403 @@
+import json
+import os
+import threading
+from datetime import date, timedelta
+import numpy as np
+import pandas as pd
+from backend import DataProcessor, DateUtils, FixingTopForecastingFile
+from baseline_matrix import BaselineMatrix
+from contrato import Orders
+from instrumentation import run_stage
+from schema import apply_schema
+
+# Chaves do lag de qtd_pedido; as medianas usam as mesmas chaves mais o dds
+LAG_KEYS = ["modal", "big_region", "logistic_region", "shift", "turno_g"]
+LAG = 7
+SQUARE_WEEKS = 6
+STATE_FILES = {"linhas": "linhas.parquet", "grupos": "grupos.parquet", "medianas": "medianas.parquet"}
+# Quebras de consolidate_region_data, na ordem em que saem no arquivo final
+TIPOS = ["gerencial", "turno_g"]
+
+
+def _ano_semana(datas: pd.Series) -> np.ndarray:
+    # Mesmo ano_semana de order_data_enricher (ano civil com semana ISO), com a mesma virada de ano
+    return (datas.dt.year * 100 + datas.dt.isocalendar().week).to_numpy(dtype="int64")
+
+
+def _var_lw(qtd: np.ndarray, qtd_lw: np.ndarray) -> np.ndarray:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.nan_to_num(np.round(qtd / qtd_lw - 1, 4), nan=0.0, posinf=np.inf, neginf=-np.inf)
+
+
+class IncrementalBaseline:
+    """Estado das medianas do baseline numa janela de semanas, atualizado semana a semana.
+
+    Guarda as linhas da janela já enriquecidas (com a posição de cada uma no seu grupo de lag) e a
+    mediana de var_lw e qtd_pedido de cada chave (grupo de lag + dds). advance descarta a semana mais
+    antiga, calcula o lag só das linhas novas e refaz as medianas só das chaves que mudaram, em vez de
+    refiltrar e reagrupar a janela inteira. O resultado é o mesmo de run_baseline na janela deslocada.
+    """
+
+    def __init__(self, linhas: pd.DataFrame, grupos: pd.DataFrame, medianas: pd.DataFrame, start_date: date, end_date: date):
+        self.linhas = linhas
+        self.grupos = grupos
+        self.medianas = medianas
+        self.start_date = start_date
+        self.end_date = end_date
+
+    @classmethod
+    def build(cls, history, start_date: date, end_date: date, log_callback=None) -> "IncrementalBaseline":
+        """Estado inicial: o fluxo da página sobre a janela, guardando também a última semana,
+        que a página descarta mas passa a contar quando a semana seguinte chega."""
+        data_processor = DataProcessor()
+        history = history.copy() if isinstance(history, pd.DataFrame) else history
+        df = data_processor.filter_dataframe(history, start_date, end_date)
+        df = data_processor.order_data_enricher(df, max_week=np.iinfo("int32").max)
+
+        agrupado = df.groupby(LAG_KEYS, observed=True, sort=True)
+        linhas = pd.DataFrame({
+            "grupo": agrupado.ngroup().to_numpy(dtype="int64"),
+            "dds": df["dds"].to_numpy(dtype="int64"),
+            "data_entrega": df["data_entrega"].to_numpy(),
+            "ano_semana": df["ano_semana"].to_numpy(dtype="int64"),
+            "qtd_pedido": df["qtd_pedido"].to_numpy(dtype="float64"),
+            "var_lw": df["var_lw"].to_numpy(dtype="float64"),
+            "posicao": agrupado.cumcount().to_numpy(dtype="int64"),
+        })
+        grupos = agrupado.size().index.to_frame(index=False)
+
+        estado = cls(linhas, grupos, pd.DataFrame(columns=["median_var_lw", "median_qtd_pedido"]), start_date, end_date)
+        estado.medianas = estado._medians(estado._chaves())
+        if log_callback:
+            log_callback(f"Estado do baseline criado: {len(linhas)} linhas, {len(estado.medianas)} chaves.")
+        return estado
+
+    def _chaves(self, linhas: pd.DataFrame | None = None) -> np.ndarray:
+        linhas = self.linhas if linhas is None else linhas
+        return linhas["grupo"].to_numpy() * 7 + linhas["dds"].to_numpy()
+
+    def _incluidas(self) -> np.ndarray:
+        # A página descarta a maior ano_semana da janela
+        ano_semana = self.linhas["ano_semana"].to_numpy()
+        return ano_semana < ano_semana.max() if len(ano_semana) else np.zeros(0, dtype=bool)
+
+    def _medians(self, chaves: np.ndarray) -> pd.DataFrame:
+        selecao = self._incluidas() & np.isin(self._chaves(), chaves)
+        valores = self.linhas.loc[selecao, ["var_lw", "qtd_pedido"]].assign(chave=self._chaves()[selecao])
+        return valores.groupby("chave").median().add_prefix("median_")
+
+    def _group_ids(self, novos: pd.DataFrame) -> np.ndarray:
+        # Chaves de lag ainda não vistas ganham ids novos no fim da tabela de grupos
+        conhecidos = pd.MultiIndex.from_frame(self.grupos[LAG_KEYS].astype(str))
+        chaves_novas = pd.MultiIndex.from_frame(novos[LAG_KEYS].astype(str))
+        ids = conhecidos.get_indexer(chaves_novas)
+
+        faltantes = ids < 0
+        if faltantes.any():
+            posicoes, ineditos = pd.factorize(chaves_novas[faltantes])
+            ids[faltantes] = len(self.grupos) + posicoes
+            acrescimo = ineditos.to_frame(index=False, name=LAG_KEYS)
+            self.grupos = apply_schema(pd.concat(
+                [self.grupos.astype({col: object for col in LAG_KEYS}), acrescimo], ignore_index=True
+            ))
+        return ids
+
+    def advance(self, novos: pd.DataFrame, log_callback=None) -> int:
+        """Desloca a janela uma semana com os pedidos validados de (end_date, end_date + 7 dias].
+
+        Retorna o número de chaves cujas medianas foram recalculadas.
+        """
+        inicio = self.start_date + timedelta(weeks=1)
+        fim = self.end_date + timedelta(weeks=1)
+        novos = novos[list(Orders.model_fields.keys())].copy()
+        novos["data_entrega"] = pd.to_datetime(novos["data_entrega"])
+        fora = (novos["data_entrega"] <= pd.Timestamp(self.end_date)) | (novos["data_entrega"] > pd.Timestamp(fim))
+        if fora.any():
+            raise ValueError(f"{int(fora.sum())} pedidos fora da semana seguinte ao estado ({self.end_date + timedelta(days=1)} a {fim}).")
+
+        linhas = self.linhas
+        incluidas_antes = self._incluidas()
+        afetadas = []
+
+        # Semana mais antiga sai da janela; as linhas seguintes de cada grupo andam para trás, e as
+        # que viram uma das LAG primeiras do grupo ficam com var_lw 0, como o lag calculado após o filtro
+        saem = (linhas["data_entrega"] < pd.Timestamp(inicio)).to_numpy()
+        afetadas.append(self._chaves()[saem & incluidas_antes])
+        saidas_por_grupo = np.bincount(linhas["grupo"].to_numpy()[saem], minlength=len(self.grupos))
+        linhas = linhas.loc[~saem].reset_index(drop=True)
+        incluidas_antes = incluidas_antes[~saem]
+
+        posicao_antiga = linhas["posicao"].to_numpy()
+        posicao = posicao_antiga - saidas_por_grupo[linhas["grupo"].to_numpy()]
+        zerar = (posicao < LAG) & (posicao_antiga >= LAG)
+        linhas["posicao"] = posicao
+        linhas.loc[zerar, "var_lw"] = 0.0
+        afetadas.append(self._chaves(linhas)[zerar])
+
+        # Linhas novas: posição depois das que já estão no grupo, lag pela linha LAG posições antes
+        novos = novos.sort_values("data_entrega", kind="stable").reset_index(drop=True)
+        grupo = self._group_ids(novos)
+        por_grupo = np.bincount(linhas["grupo"].to_numpy(), minlength=len(self.grupos))
+        chegada = pd.DataFrame({
+            "grupo": grupo,
+            "dds": novos["data_entrega"].dt.weekday.to_numpy(dtype="int64"),
+            "data_entrega": novos["data_entrega"].to_numpy(),
+            "ano_semana": _ano_semana(novos["data_entrega"]),
+            "qtd_pedido": novos["qtd_pedido"].to_numpy(dtype="float64"),
+            "posicao": por_grupo[grupo] + novos.groupby(grupo).cumcount().to_numpy(),
+        })
+        cauda = linhas.loc[linhas["posicao"].to_numpy() >= por_grupo[linhas["grupo"].to_numpy()] - LAG, ["grupo", "posicao", "qtd_pedido"]]
+        anteriores = pd.concat([cauda, chegada[["grupo", "posicao", "qtd_pedido"]]], ignore_index=True)
+        qtd_lw = (
+            chegada[["grupo", "posicao"]]
+            .assign(posicao=chegada["posicao"] - LAG)
+            .merge(anteriores, on=["grupo", "posicao"], how="left")["qtd_pedido"]
+            .to_numpy()
+        )
+        chegada["var_lw"] = _var_lw(chegada["qtd_pedido"].to_numpy(), qtd_lw)
+
+        self.linhas = pd.concat([linhas, chegada[linhas.columns]], ignore_index=True)
+        incluidas = self._incluidas()
+        # A semana que era a última passa a contar; a nova última fica de fora
+        mudaram = incluidas[: len(linhas)] != incluidas_antes
+        afetadas.append(self._chaves(linhas)[mudaram])
+        afetadas.append(self._chaves(chegada)[incluidas[len(linhas):]])
+
+        afetadas = np.unique(np.concatenate(afetadas))
+        self.medianas = pd.concat([
+            self.medianas.drop(index=afetadas, errors="ignore"),
+            self._medians(afetadas),
+        ]).sort_index()
+        self.start_date, self.end_date = inicio, fim
+        if log_callback:
+            log_callback(f"Janela deslocada para {inicio} a {fim}: {len(chegada)} linhas novas, {len(afetadas)} chaves recalculadas.")
+        return len(afetadas)
+
+    def central_tendency(self) -> pd.DataFrame:
+        """Medianas no formato de DataProcessor.calculate_central_tendency."""
+        chaves = self.medianas.index.to_numpy()
+        medidas = self.grupos.iloc[chaves // 7].reset_index(drop=True)
+        medidas["dds"] = (chaves % 7).astype("int8")
+        medidas[["median_var_lw", "median_qtd_pedido"]] = self.medianas.to_numpy()
+        return medidas
+
+    def allowed_squares(self) -> pd.DataFrame:
+        # Praças com pedido nas últimas SQUARE_WEEKS semanas das linhas que a página usa
+        recentes = self._incluidas() & (self.linhas["data_entrega"] >= pd.Timestamp(self.end_date - timedelta(weeks=SQUARE_WEEKS))).to_numpy()
+        grupos = np.unique(self.linhas["grupo"].to_numpy()[recentes])
+        return self.grupos.iloc[grupos][["modal", "logistic_region"]].drop_duplicates().reset_index(drop=True)
+
+    def baseline(self, delivery_date: date, incluir_mes_seguinte=False) -> pd.DataFrame:
+        """Baseline da janela atual, com as mesmas etapas finais de run_baseline."""
+        data_processor = DataProcessor()
+        dias_previsao = DateUtils.generate_dates_until_end_of_month(delivery_date, incluir_mes_seguinte)
+        baseline = data_processor.clip_growth_and_merge(self.central_tendency())
+        baseline = data_processor.create_baseline_forecast(dias_previsao, baseline)
+        return data_processor.baseline_output(baseline, self.allowed_squares())
+
+    def save(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        tabelas = {"linhas": self.linhas, "grupos": self.grupos, "medianas": self.medianas.reset_index()}
+        for nome, tabela in tabelas.items():
+            # Grava em arquivo temporário e troca de uma vez, como as partições do HistoryStore
+            destino = os.path.join(path, STATE_FILES[nome])
+            tabela.to_parquet(f"{destino}.tmp", index=False)
+            os.replace(f"{destino}.tmp", destino)
+        with open(os.path.join(path, "janela.json"), "w") as f:
+            json.dump({"start_date": self.start_date.isoformat(), "end_date": self.end_date.isoformat()}, f)
+
+    @classmethod
+    def load(cls, path: str) -> "IncrementalBaseline":
+        with open(os.path.join(path, "janela.json")) as f:
+            janela = json.load(f)
+        tabelas = {nome: pd.read_parquet(os.path.join(path, arquivo)) for nome, arquivo in STATE_FILES.items()}
+        return cls(
+            tabelas["linhas"],
+            apply_schema(tabelas["grupos"]),
+            tabelas["medianas"].set_index("chave"),
+            date.fromisoformat(janela["start_date"]),
+            date.fromisoformat(janela["end_date"]),
+        )
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return os.path.exists(os.path.join(path, "janela.json"))
+
+
+class IncrementalConsolidador:
+    """Última consolidação de uma previsão top, refeita só onde o baseline ajustado mudou.
+
+    Guarda a matriz chave x data (em pedidos inteiros) do último baseline processado e a saída final.
+    Se o novo baseline tem as mesmas linhas e datas, as células alteradas apontam os grupos
+    (origem, modal, data) afetados; só esses passam de novo por consolidate_region_data e
+    final_validation, e as linhas deles são trocadas na saída guardada, na ordem de run_consolidador.
+    Outra previsão top, outras quebras ou outras linhas/datas no baseline refazem tudo.
+    """
+
+    def __init__(self):
+        self.chave_previsao = None
+        self.quebras = None
+        self.fct_brasil = None
+        self.chaves_hash = None
+        self.datas = None
+        self.pedidos = None
+        self.df_final = None
+        self._ordem = None
+        self._grupo = None
+        self._gerencial = 0
+        self._dias = 1
+        self._lock = threading.Lock()
+
+    def _origem(self, logistic_region: pd.Series) -> np.ndarray:
+        # Posição da origem da previsão em quebras (a própria praça ou BRASIL_SEM_PRACA), -1 fora delas
+        pracas = [quebra for quebra in self.quebras if quebra != "BRASIL_SEM_PRACA"]
+        posicoes = {quebra: i for i, quebra in enumerate(self.quebras)}
+        sem_praca = posicoes.get("BRASIL_SEM_PRACA", -1)
+        por_categoria = [posicoes[valor] if valor in pracas else sem_praca for valor in logistic_region.cat.categories]
+        return np.array(por_categoria + [-1], dtype="int64")[logistic_region.cat.codes.to_numpy()]
+
+    def _grupos_linhas(self, keys: pd.DataFrame) -> np.ndarray:
+        # Grupo (origem, modal) de cada linha do baseline, -1 para as que não entram na consolidação
+        origem = self._origem(keys["logistic_region"])
+        modal = keys["modal"].cat.codes.to_numpy(dtype="int64")
+        return np.where(origem >= 0, origem * len(keys["modal"].cat.categories) + modal, -1)
+
+    def _codigos(self, base_final: pd.DataFrame, modais: pd.Index) -> tuple:
+        """Chave de ordenação (a ordem de consolidate_region_data) e grupo (origem, modal, dia) de cada linha."""
+        dia = ((base_final["date"].to_numpy() - self.datas.min().to_datetime64()) // np.timedelta64(1, "D")).astype("int64")
+        origem = self._origem(base_final["logistic_region"])
+        # business_model sai do merge com a previsão como texto; o código é a posição nas categorias de modal
+        modal = modais.get_indexer(base_final["business_model"]).astype("int64")
+        grupo = (origem * len(modais) + modal) * self._dias + dia
+
+        ordem = pd.Index(TIPOS).get_indexer(base_final["tipo"]).astype("int64")
+        for codigos, n in [(origem, len(self.quebras)), (dia, self._dias)]:
+            ordem = ordem * n + codigos
+        ordem = ordem * len(modais) + modal
+        for col in ["region", "logistic_region", "shift"]:
+            ordem = ordem * len(base_final[col].cat.categories) + base_final[col].cat.codes.to_numpy(dtype="int64")
+        return ordem, grupo
+
+    def _finalizar(self, base_final: pd.DataFrame, log_callback=None, instrumentation=None) -> pd.DataFrame:
+        base_final_shift = base_final.loc[base_final["tipo"] == "gerencial"].reset_index(drop=True)
+        base_final_turno_g = base_final.loc[base_final["tipo"] == "turno_g"].reset_index(drop=True)
+        return run_stage(
+            instrumentation, "final_validation", DataProcessor.final_validation, base_final_shift, base_final_turno_g, log_callback,
+            self.fct_brasil, self.quebras
+        )
+
+    def update(self, chave_previsao, top_forecasting: pd.DataFrame, baseline_adjusted: pd.DataFrame, quebras: list, log_callback=None, instrumentation=None) -> pd.DataFrame:
+        """Saída de run_consolidador para este baseline ajustado, reaproveitando a consolidação anterior.
+
+        chave_previsao identifica a previsão top (o hash do arquivo, por exemplo).
+        """
+        with self._lock:
+            if chave_previsao != self.chave_previsao or list(quebras) != self.quebras or self.fct_brasil is None:
+                self.df_final = None
+                self.fct_brasil = run_stage(instrumentation, "process_all", FixingTopForecastingFile(top_forecasting).lookup)
+                self.chave_previsao, self.quebras = chave_previsao, list(quebras)
+
+            matriz = BaselineMatrix.from_wide(baseline_adjusted)
+            pedidos = np.nan_to_num(matriz.values).astype("int64")
+            chaves_hash = pd.util.hash_pandas_object(matriz.keys, index=False).to_numpy()
+            mesma_estrutura = (
+                self.df_final is not None
+                and np.array_equal(chaves_hash, self.chaves_hash)
+                and matriz.dates.equals(self.datas)
+            )
+            if mesma_estrutura:
+                df_final = self._patch(matriz, pedidos, log_callback, instrumentation)
+            else:
+                df_final = self._rebuild(matriz, baseline_adjusted, log_callback, instrumentation)
+
+            self.chaves_hash, self.pedidos = chaves_hash, pedidos
+            return df_final.copy()
+
+    def _rebuild(self, matriz: BaselineMatrix, baseline_adjusted: pd.DataFrame, log_callback=None, instrumentation=None) -> pd.DataFrame:
+        data_processor = DataProcessor()
+        # Até o fim da consolidação o estado não vale (um job cancelado no meio não deixa resto)
+        self.df_final = None
+        if log_callback:
+            log_callback("Consolidando o baseline ajustado inteiro...")
+        self.datas = matriz.dates
+        self._dias = int((self.datas.max() - self.datas.min()).days) + 1 if len(self.datas) else 1
+
+        baseline_melted = run_stage(
+            instrumentation, "melting_baseline_adjusted", data_processor.melting_baseline_adjusted, baseline_adjusted, log_callback
+        )
+        base_final = run_stage(
+            instrumentation, "consolidate_region_data", data_processor.consolidate_region_data, baseline_melted, self.fct_brasil, self.quebras
+        )
+        self._ordem, self._grupo = self._codigos(base_final, matriz.keys["modal"].cat.categories)
+        self._gerencial = int((base_final["tipo"] == "gerencial").sum())
+        self.df_final = self._finalizar(base_final, log_callback, instrumentation)
+        return self.df_final
+
+    def _patch(self, matriz: BaselineMatrix, pedidos: np.ndarray, log_callback=None, instrumentation=None) -> pd.DataFrame:
+        data_processor = DataProcessor()
+        modais = matriz.keys["modal"].cat.categories
+        grupo_linha = self._grupos_linhas(matriz.keys)
+        dia_coluna = ((matriz.dates - self.datas.min()) // pd.Timedelta(days=1)).to_numpy(dtype="int64")
+
+        # Grupos (origem, modal, dia) com alguma célula alterada
+        linhas, colunas = np.nonzero(pedidos != self.pedidos)
+        consolidadas = grupo_linha[linhas] >= 0
+        afetados = np.zeros(len(self.quebras) * len(modais) * self._dias, dtype=bool)
+        afetados[grupo_linha[linhas[consolidadas]] * self._dias + dia_coluna[colunas[consolidadas]]] = True
+        if log_callback:
+            log_callback(
+                f"Baseline ajustado com {len(linhas)} células alteradas em {int(afetados.sum())} grupos (origem, modal, data)."
+            )
+        if not afetados.any():
+            return self.df_final
+
+        # Todas as células dos grupos afetados, em formato longo, como melting_baseline_adjusted
+        selecao = np.zeros(pedidos.shape, dtype=bool)
+        com_grupo = grupo_linha >= 0
+        selecao[com_grupo] = afetados[grupo_linha[com_grupo][:, None] * self._dias + dia_coluna[None, :]]
+        colunas, linhas = np.nonzero(selecao.T)
+        baseline_melted = matriz.keys.take(linhas).reset_index(drop=True)
+        baseline_melted["data_entrega"] = matriz.dates.to_numpy()[colunas]
+        baseline_melted["qtd_pedidos"] = pedidos[linhas, colunas]
+        baseline_melted = apply_schema(baseline_melted)
+
+        base_patch = run_stage(
+            instrumentation, "consolidate_region_data", data_processor.consolidate_region_data, baseline_melted, self.fct_brasil, self.quebras
+        )
+        # As quebras do pedaço refeito ficam com as mesmas categorias da saída guardada
+        base_patch["shift"] = base_patch["shift"].astype(self.df_final["shift"].dtype)
+        ordem_patch, grupo_patch = self._codigos(base_patch, modais)
+        df_patch = self._finalizar(base_patch, log_callback, instrumentation)
+
+        # As linhas dos grupos afetados saem e as refeitas entram no lugar, pela mesma ordenação
+        manter = ~afetados[self._grupo]
+        ordem = np.concatenate([self._ordem[manter], ordem_patch])
+        grupo = np.concatenate([self._grupo[manter], grupo_patch])
+        posicoes = np.argsort(ordem, kind="stable")
+        df_final = pd.concat([self.df_final.loc[manter], df_patch], ignore_index=True).take(posicoes)
+        # Mesmo índice de final_validation (cada quebra numerada desde 0), o de uma consolidação completa
+        gerencial = int(manter[:self._gerencial].sum() + (base_patch["tipo"] == "gerencial").sum())
+        df_final.index = np.concatenate([np.arange(gerencial), np.arange(len(df_final) - gerencial)])
+
+        if log_callback:
+            log_callback(f"{len(df_patch)} de {len(df_final)} linhas da saída refeitas.")
+        self._ordem, self._grupo, self.df_final = ordem[posicoes], grupo[posicoes], df_final
+        self._gerencial = gerencial
+        return df_final
+
+
+_shared_consolidador = None
+_shared_lock = threading.Lock()
+
+
+def shared_consolidador() -> IncrementalConsolidador:
+    """IncrementalConsolidador único do processo, usado pelos jobs do Consolidador de todas as sessões.
+
+    O estado só decide o quanto é refeito; a saída de update é a mesma de run_consolidador para
+    qualquer estado anterior.
+    """
+    global _shared_consolidador
+    with _shared_lock:
+        if _shared_consolidador is None:
+            _shared_consolidador = IncrementalConsolidador()
+        return _shared_consolidador
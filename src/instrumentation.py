@@ -0,0 +1,136 @@
+import json
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+import pandas as pd
+
+# O tracemalloc é um só no processo: spans com trace_peak ao mesmo tempo (jobs em threads diferentes)
+# dividem o mesmo rastreamento, ligado pelo primeiro e desligado pelo último
+_tracing_lock = threading.Lock()
+_tracing_spans = 0
+_tracing_owned = False
+
+
+def _start_tracing():
+    global _tracing_spans, _tracing_owned
+    with _tracing_lock:
+        if _tracing_spans == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _tracing_owned = True
+        _tracing_spans += 1
+
+
+def _stop_tracing() -> int:
+    """Pico de memória rastreada desde o início do rastreamento, em bytes."""
+    global _tracing_spans, _tracing_owned
+    with _tracing_lock:
+        pico = tracemalloc.get_traced_memory()[1]
+        _tracing_spans -= 1
+        # Um rastreamento ligado fora daqui (por quem chamou) continua ligado
+        if _tracing_spans == 0 and _tracing_owned:
+            tracemalloc.stop()
+            _tracing_owned = False
+    return pico
+
+
+def _frames(value) -> list:
+    if isinstance(value, pd.DataFrame):
+        return [value]
+    if isinstance(value, (tuple, list)):
+        return [item for item in value if isinstance(item, pd.DataFrame)]
+    return []
+
+
+def frame_memory_mb(value) -> float | None:
+    frames = _frames(value)
+    if not frames:
+        return None
+    return round(sum(df.memory_usage(deep=True).sum() for df in frames) / 2**20, 2)
+
+
+def frame_rows(value) -> int | None:
+    frames = _frames(value)
+    return len(frames[0]) if frames else None
+
+
+class PipelineInstrumentation:
+    """Registra cada etapa do pipeline como um span estruturado e repassa os eventos aos ouvintes.
+
+    Cada span guarda duração, linhas de entrada e saída e memória dos DataFrames antes e depois.
+    Com trace_peak=True também registra o pico de memória alocada durante a etapa (tracemalloc). O
+    rastreamento é do processo inteiro: com etapas simultâneas em outras threads, o pico inclui as
+    alocações delas desde que a primeira começou.
+    """
+
+    def __init__(self, listeners=None, trace_peak=False):
+        self.listeners = list(listeners or [])
+        self.trace_peak = trace_peak
+        self.spans = []
+        self.logs = []
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def _emit(self, event: dict):
+        for listener in self.listeners:
+            listener(event)
+
+    def log(self, message: str):
+        event = {"type": "log", "timestamp": datetime.now().isoformat(timespec="seconds"), "message": message}
+        self.logs.append(event)
+        self._emit(event)
+
+    @contextmanager
+    def span(self, stage: str, inputs=None):
+        span = {
+            "type": "span",
+            "stage": stage,
+            "started_at": datetime.now().isoformat(timespec="seconds"),
+            "rows_in": frame_rows(inputs),
+            "memory_before_mb": frame_memory_mb(inputs),
+        }
+        self._emit({"type": "span_start", "stage": stage})
+        if self.trace_peak:
+            _start_tracing()
+        inicio = time.perf_counter()
+        try:
+            # Quem usa o span preenche span["output"] com o resultado da etapa
+            yield span
+        finally:
+            span["seconds"] = round(time.perf_counter() - inicio, 4)
+            if self.trace_peak:
+                span["peak_mb"] = round(_stop_tracing() / 2**20, 2)
+            output = span.pop("output", None)
+            span["rows_out"] = frame_rows(output)
+            span["memory_after_mb"] = frame_memory_mb(output)
+            self.spans.append(span)
+            self._emit(span)
+
+    def run(self, stage: str, func, *args, **kwargs):
+        inputs = [value for value in (*args, *kwargs.values()) if isinstance(value, pd.DataFrame)]
+        with self.span(stage, inputs) as span:
+            result = func(*args, **kwargs)
+            span["output"] = result
+        return result
+
+    def summary(self) -> pd.DataFrame:
+        return pd.DataFrame(self.spans).drop(columns=["type"], errors="ignore")
+
+    def to_dict(self) -> dict:
+        return {"spans": self.spans, "logs": self.logs}
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), ensure_ascii=False, indent=2)
+
+    def save(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.to_json())
+
+
+def run_stage(instrumentation, stage: str, func, *args, **kwargs):
+    """Executa a etapa instrumentada quando há instrumentação, ou diretamente quando não há."""
+    if instrumentation is None:
+        return func(*args, **kwargs)
+    return instrumentation.run(stage, func, *args, **kwargs)
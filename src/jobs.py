@@ -0,0 +1,119 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from instrumentation import PipelineInstrumentation
+
+
+class JobCancelled(Exception):
+    """Levantada dentro do job, no início da próxima etapa, quando ele foi cancelado."""
+
+
+class Job:
+    """Execução de um pipeline em segundo plano, com os eventos do PipelineInstrumentation guardados em ordem.
+
+    Várias sessões podem acompanhar o mesmo job; quem chega depois relê os eventos desde o início.
+    """
+
+    def __init__(self, key: tuple):
+        self.key = key
+        self.sessions = set()
+        self.events = []
+        self.instrumentation = PipelineInstrumentation(listeners=[self._record])
+        self.future = None
+        self._cancel = threading.Event()
+
+    def _record(self, event: dict):
+        # A checagem de cancelamento roda a cada evento, ou seja, entre etapas e a cada log
+        if self._cancel.is_set() and event["type"] != "span":
+            raise JobCancelled(f"Job cancelado: {self.key}")
+        self.events.append(event)
+
+    def cancel(self):
+        self._cancel.set()
+        if self.future is not None:
+            self.future.cancel()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def done(self) -> bool:
+        return self.future is not None and self.future.done()
+
+    def events_since(self, position: int) -> list:
+        return self.events[position:]
+
+    def result(self, timeout=None):
+        return self.future.result(timeout)
+
+
+class JobRunner:
+    """Executa pipelines num pool de threads, um job por chave de entradas.
+
+    Pedidos com a mesma chave, de qualquer sessão, compartilham o mesmo job. Cada sessão acompanha
+    um job por vez: ao pedir outra chave, ela deixa o job anterior, que é cancelado se ninguém mais
+    o acompanha. Os jobs concluídos ficam guardados (até max_finished) para reaproveitar o resultado.
+    """
+
+    def __init__(self, max_workers: int = 2, max_finished: int = 8):
+        self.max_finished = max_finished
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pipeline")
+        self._jobs = OrderedDict()
+        self._session_jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, session_id: str, key: tuple, func, *args, **kwargs) -> Job:
+        """Acompanha (ou inicia) o job da chave. func recebe o PipelineInstrumentation do job como primeiro argumento."""
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is None or job.cancelled or (job.done() and job.future.exception() is not None):
+                job = Job(key)
+                job.future = self._executor.submit(func, job.instrumentation, *args, **kwargs)
+                self._jobs[key] = job
+            self._jobs.move_to_end(key)
+
+            self._follow(session_id, job)
+            self._evict_finished()
+            return job
+
+    def _follow(self, session_id: str, job: Job):
+        anterior = self._session_jobs.get(session_id)
+        if anterior is not None and anterior is not job:
+            anterior.sessions.discard(session_id)
+            if not anterior.sessions and not anterior.done():
+                anterior.cancel()
+                self._jobs.pop(anterior.key, None)
+        job.sessions.add(session_id)
+        self._session_jobs[session_id] = job
+
+    def cancel(self, session_id: str):
+        """Deixa o job da sessão, cancelando-o se nenhuma outra sessão o acompanha."""
+        with self._lock:
+            job = self._session_jobs.pop(session_id, None)
+            if job is None:
+                return
+            job.sessions.discard(session_id)
+            if not job.sessions and not job.done():
+                job.cancel()
+                self._jobs.pop(job.key, None)
+
+    def _evict_finished(self):
+        concluidos = [key for key, job in self._jobs.items() if job.done()]
+        for key in concluidos[: max(0, len(concluidos) - self.max_finished)]:
+            self._jobs.pop(key)
+
+    def active_jobs(self) -> int:
+        return sum(1 for job in self._jobs.values() if not job.done())
+
+
+_shared_runner = None
+_shared_lock = threading.Lock()
+
+
+def shared_runner() -> JobRunner:
+    """JobRunner único do processo, compartilhado por todas as sessões do streamlit."""
+    global _shared_runner
+    with _shared_lock:
+        if _shared_runner is None:
+            _shared_runner = JobRunner()
+        return _shared_runner
@@ -0,0 +1,140 @@
+import os
+from abc import ABC, abstractmethod
+import pandas as pd
+
+
+class FileLoader(ABC):
+    """Interface dos leitores de arquivo: leitura completa ou em blocos de linhas."""
+
+    def load(self, source) -> pd.DataFrame:
+        return pd.concat(list(self.iter_chunks(source)), ignore_index=True)
+
+    @abstractmethod
+    def iter_chunks(self, source, chunksize: int = 50_000):
+        """Gera DataFrames de até chunksize linhas, na ordem do arquivo."""
+
+    def count_rows(self, source):
+        return None
+
+
+class ExcelLoader(FileLoader):
+    def load(self, source) -> pd.DataFrame:
+        # Leitura completa mantém o comportamento do pandas (cabeçalhos repetidos, linhas vazias)
+        return pd.read_excel(source)
+
+    def iter_chunks(self, source, chunksize: int = 50_000):
+        from openpyxl import load_workbook
+
+        # read_only percorre a planilha linha a linha sem carregar o workbook inteiro
+        workbook = load_workbook(source, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                return
+            header = list(header)
+            while header and header[-1] is None:
+                header.pop()
+
+            # Linhas vazias no meio da planilha ficam, como no pd.read_excel (a validação as aponta e
+            # index + 2 continua sendo a linha do Excel); só as do fim da planilha são descartadas
+            buffer, vazias = [], []
+            for row in rows:
+                if all(value is None for value in row):
+                    vazias.append(row[:len(header)])
+                    continue
+                buffer.extend(vazias)
+                vazias = []
+                buffer.append(row[:len(header)])
+                if len(buffer) >= chunksize:
+                    yield pd.DataFrame(buffer, columns=header)
+                    buffer = []
+            if buffer:
+                yield pd.DataFrame(buffer, columns=header)
+        finally:
+            workbook.close()
+
+    def count_rows(self, source):
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(source, read_only=True)
+        try:
+            max_row = workbook.active.max_row
+        finally:
+            workbook.close()
+        _rewind(source)
+        return max_row - 1 if max_row else None
+
+
+class CsvLoader(FileLoader):
+    def load(self, source) -> pd.DataFrame:
+        return pd.read_csv(source)
+
+    def iter_chunks(self, source, chunksize: int = 50_000):
+        yield from pd.read_csv(source, chunksize=chunksize)
+
+
+class ParquetLoader(FileLoader):
+    def load(self, source) -> pd.DataFrame:
+        return pd.read_parquet(source)
+
+    def iter_chunks(self, source, chunksize: int = 50_000):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("A leitura de arquivos parquet requer o pacote pyarrow.") from e
+
+        for batch in pq.ParquetFile(source).iter_batches(batch_size=chunksize):
+            yield batch.to_pandas()
+
+    def count_rows(self, source):
+        import pyarrow.parquet as pq
+
+        total = pq.ParquetFile(source).metadata.num_rows
+        _rewind(source)
+        return total
+
+
+LOADERS = {
+    "xlsx": ExcelLoader(),
+    "csv": CsvLoader(),
+    "parquet": ParquetLoader(),
+}
+
+
+def register_loader(file_format: str, loader: FileLoader):
+    LOADERS[file_format] = loader
+
+
+def _rewind(source):
+    if hasattr(source, "seek"):
+        source.seek(0)
+
+
+def detect_format(source) -> str:
+    """Identifica o formato pela extensão do arquivo e, na falta dela, pelos bytes iniciais."""
+    name = source if isinstance(source, (str, os.PathLike)) else getattr(source, "name", "")
+    extension = os.path.splitext(str(name))[1].lower().lstrip(".")
+    if extension in LOADERS:
+        return extension
+    if extension == "xlsm":
+        return "xlsx"
+
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            magic = f.read(4)
+    elif hasattr(source, "read"):
+        magic = source.read(4)
+        _rewind(source)
+    else:
+        magic = b""
+
+    if magic.startswith(b"PK"):
+        return "xlsx"
+    if magic == b"PAR1":
+        return "parquet"
+    return "csv"
+
+
+def get_loader(source) -> FileLoader:
+    return LOADERS[detect_format(source)]
@@ -1,55 +1,105 @@
 from frontend import (
-    PageConfig, Header, OrdersReader, MessageDisplay, ResultDisplay
+    PageConfig, Header, OrdersReader, MessageDisplay, ResultDisplay, SessionInfo
 )
 
-from backend import DataProcessor, FixingTopForecastingFile
+from backend import DataProcessor
+from cache import content_hash
+from frame_store import shared_frame_store
+from incremental import shared_consolidador
+from jobs import shared_runner
+from pipelines import QUEBRAS
+from reconciliation import ReconciliationError
 
 import streamlit as st
 
+
+def consolidador_pipeline(instrumentation, frame_store, upload_top_forecasting, upload_adjusted_baseline):
+    # Roda no JobRunner, fora da thread do streamlit
+    data_processor = DataProcessor()
+    log_callback = instrumentation.log
+
+    # Os arquivos lidos ficam no cache do processo, compartilhados com as outras sessões
+    df, result, errors = frame_store.get_or_load(
+        "previsao_top", content_hash(upload_top_forecasting),
+        lambda: instrumentation.run(
+            "process_top_forecasting_file", data_processor.process_top_forecasting_file, upload_top_forecasting, log_callback
+        )
+    )
+
+    baseline, baseline_result, baseline_errors = frame_store.get_or_load(
+        "baseline_ajustado", content_hash(upload_adjusted_baseline),
+        lambda: instrumentation.run(
+            "process_adjusted_baseline", data_processor.process_adjusted_baseline, upload_adjusted_baseline, log_callback
+        )
+    )
+
+    saida = {
+        "df_final": None, "result": result, "errors": errors,
+        "baseline": baseline, "baseline_result": baseline_result, "baseline_errors": baseline_errors,
+        "reconciliacao": None,
+    }
+    if not result or not baseline_result:
+        # Arquivo rejeitado: a página mostra os erros de cada um e não consolida
+        return saida
+
+    # Só os grupos (origem, modal, data) alterados desde o último baseline consolidado são refeitos
+    try:
+        saida["df_final"] = shared_consolidador().update(content_hash(upload_top_forecasting), df, baseline, QUEBRAS, log_callback, instrumentation)
+    except ReconciliationError as e:
+        # A divergência é o resultado do job, como uma saída normal: o job concluído é reaproveitado
+        # nas reexecuções da página em vez de consolidar tudo de novo
+        saida["reconciliacao"] = e.report
+    return saida
+
+
 def main():
     page_config = PageConfig(page_title="Consolidador", layout="wide")
     header = Header(title="Consolidador", subtitle=None)
     header.display_header()
     orders_reader = OrdersReader()
     message_display = MessageDisplay()
-    data_processor = DataProcessor()
     result_display = ResultDisplay()
-
-    QUEBRAS = ["SAO PAULO", "RIO - ZONA SUL", "BRASIL_SEM_PRACA"]
+    runner = shared_runner()
+    session_id = SessionInfo.session_id("consolidador")
 
     upload_top_forecasting = orders_reader.upload_file("Carregue o arquivo de previsão que você gerou! (`previsao_top.xslx`)")
     upload_adjusted_baseline = orders_reader.upload_file("Carregue o arquivo baseline que você ajustou!")
 
     if upload_top_forecasting and upload_adjusted_baseline:
-        message_display.display_processing_message()
-
-        def log_callback(message):
-            message_display.update_processing_message(message)
+        # Os mesmos dois arquivos reaproveitam o mesmo job, de qualquer sessão: o estado incremental
+        # só muda o quanto é refeito, não a saída, e por isso fica fora da chave
+        chave = ("consolidador", content_hash(upload_top_forecasting), content_hash(upload_adjusted_baseline))
+        job = runner.submit(
+            session_id, chave, consolidador_pipeline, shared_frame_store(), upload_top_forecasting, upload_adjusted_baseline
+        )
+        if not job.done() and message_display.cancel_button():
+            runner.cancel(session_id)
+            st.info("Processamento cancelado.")
+            return
 
-        df, result, errors = data_processor.process_top_forecasting_file(upload_top_forecasting, log_callback)
-
-        baseline, baseline_result, baseline_errors = data_processor.process_adjusted_baseline(upload_adjusted_baseline, log_callback)
-
-        fixer = FixingTopForecastingFile(df)
-        fct_brasil = fixer.process_all()
-
-        baseline_melted = data_processor.melting_baseline_adjusted(baseline)
-
-        base_final_shift = data_processor.process_region_data(baseline_melted, fct_brasil, QUEBRAS, "shift")
-        base_final_turno_g = data_processor.process_region_data(baseline_melted, fct_brasil, QUEBRAS, "turno_g")
-        base_final_turno_g = base_final_turno_g.rename(columns={"turno_g": "shift"})
-
-        df_final = data_processor.final_validation(base_final_shift, base_final_turno_g)
-
-        result_display.display_top_forecasting_results(df_final, result, errors)
-        result_display.display_baseline_adjusted_results(baseline, baseline_result, baseline_errors)
-
-        result_display.display_final_output(result, errors, df=df_final)
+        message_display.display_processing_message()
+        message_display.display_stage_timings()
+        saida = message_display.follow_job(job)
+        if saida is None:
+            return
+
+        result_display.display_top_forecasting_results(saida["df_final"], saida["result"], saida["errors"])
+        result_display.display_baseline_adjusted_results(saida["baseline"], saida["baseline_result"], saida["baseline_errors"])
+        if saida["reconciliacao"] is not None:
+            message_display.display_reconciliation(saida["reconciliacao"])
+            return
+        if saida["df_final"] is None:
+            return
+
+        result_display.display_final_output(saida["result"], saida["errors"], df=saida["df_final"])
+        message_display.display_shared_cache_stats(shared_frame_store().stats())
+        message_display.display_timings_export(job.instrumentation)
     else:
+        runner.cancel(session_id)
         if not upload_top_forecasting:
             st.warning("Por favor, carregue o arquivo de previsão.")
         if not upload_adjusted_baseline:
             st.warning("Por favor, carregue o arquivo baseline ajustado.")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
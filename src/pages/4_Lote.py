@@ -0,0 +1,74 @@
+import tempfile
+
+from frontend import (
+    PageConfig, Header, OrdersReader, DateInputs, MessageDisplay, ResultDisplay, SessionInfo
+)
+
+from batch import extract_bundles, run_batch
+from cache import content_hash
+from jobs import shared_runner
+
+import streamlit as st
+
+
+def lote_pipeline(instrumentation, upload_pacotes, start_date, end_date, delivery_date, incluir_mes_seguinte):
+    # Roda no JobRunner, fora da thread do streamlit; os pacotes ficam num diretório temporário até o fim
+    with tempfile.TemporaryDirectory() as diretorio:
+        bundles = instrumentation.run("extract_bundles", extract_bundles, upload_pacotes, diretorio)
+        return instrumentation.run(
+            "run_batch", run_batch, bundles, start_date, end_date, delivery_date, incluir_mes_seguinte,
+            log_callback=instrumentation.log
+        )
+
+
+def main():
+    page_config = PageConfig(page_title="Lote", layout="wide")
+    header = Header(title="Baseline e Consolidador em lote", subtitle=None)
+    header.display_header()
+    orders_reader = OrdersReader(file_types=["zip"])
+    start_date = DateInputs.data_inicial()
+    end_date = DateInputs.data_final()
+    delivery_date = DateInputs.data_entrega_demanda()
+    incluir_mes_seguinte = DateInputs.mes_seguinte()
+    message_display = MessageDisplay()
+    result_display = ResultDisplay()
+    runner = shared_runner()
+    session_id = SessionInfo.session_id("lote")
+
+    upload_pacotes = orders_reader.upload_file(
+        "Carregue um .zip com uma pasta por unidade: histórico de pedidos, previsão top e, se houver, o baseline ajustado!"
+    )
+    if not upload_pacotes:
+        runner.cancel(session_id)
+        return
+
+    chave = ("lote", content_hash(upload_pacotes), start_date, end_date, delivery_date, incluir_mes_seguinte)
+    job = runner.submit(session_id, chave, lote_pipeline, upload_pacotes, start_date, end_date, delivery_date, incluir_mes_seguinte)
+    if not job.done() and message_display.cancel_button():
+        runner.cancel(session_id)
+        st.info("Processamento cancelado.")
+        return
+
+    message_display.display_processing_message()
+    message_display.display_stage_timings()
+    saida = message_display.follow_job(job)
+    if saida is None:
+        return
+
+    manifesto, baselines, finais = saida
+    st.dataframe(manifesto, hide_index=True)
+    falhas = manifesto.loc[manifesto["status"] != "ok", "unidade"].tolist()
+    if falhas:
+        st.warning(f"Unidades com erro: {', '.join(falhas)}. Veja a coluna erro acima.")
+
+    if not finais.empty:
+        st.success("Aqui está o arquivo final de todas as unidades juntas!")
+        result_display.display_export(finais, "output_lote.xlsx")
+    if not baselines.empty:
+        with st.expander("Baselines de todas as unidades"):
+            result_display.display_export(baselines, "baseline_lote.xlsx")
+    message_display.display_timings_export(job.instrumentation)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+import numpy as np
+import pandas as pd
+from backend import DataProcessor
+
+# Todas as etapas do baseline são independentes por praça (logistic_region, modal)
+SQUARE_KEYS = ["logistic_region", "modal"]
+BASELINE_KEYS = ["big_region", "logistic_region", "modal", "shift", "turno_g"]
+
+
+def history_max_week(df: pd.DataFrame) -> int:
+    """Mesmo ano_semana máximo que order_data_enricher calcularia sobre o histórico inteiro."""
+    datas = df["data_entrega"]
+    return int((datas.dt.year * 100 + datas.dt.isocalendar().week).max())
+
+
+def split_by_square(df: pd.DataFrame, n_partitions: int) -> list:
+    """Distribui as praças em até n_partitions blocos de tamanho parecido, em ordem determinística."""
+    codigos = df.groupby(SQUARE_KEYS, observed=True, sort=True).ngroup().to_numpy()
+    n_pracas = int(codigos.max()) + 1 if len(codigos) else 0
+    n_partitions = max(1, min(n_partitions, n_pracas))
+
+    # Praças em rodízio entre os blocos, para equilibrar o volume de cada um
+    bloco_da_praca = np.arange(n_pracas) % n_partitions
+    blocos = bloco_da_praca[codigos]
+    return [df.loc[blocos == i] for i in range(n_partitions) if (blocos == i).any()]
+
+
+def _baseline_partition(df_partition: pd.DataFrame, end_date: date, dias_previsao: pd.DataFrame, max_week: int) -> pd.DataFrame:
+    data_processor = DataProcessor()
+    df_filtered = data_processor.order_data_enricher(df_partition, max_week=max_week)
+    pracas_permitidas = data_processor.allowed_squares(end_date, df_filtered)
+    medianas = data_processor.calculate_central_tendency(df_filtered, ["var_lw", "qtd_pedido"], "median")
+    baseline = data_processor.clip_growth_and_merge(medianas)
+    baseline = data_processor.create_baseline_forecast(dias_previsao, baseline)
+    return data_processor.baseline_output(baseline, pracas_permitidas)
+
+
+def parallel_baseline(df_filtered: pd.DataFrame, end_date: date, dias_previsao: pd.DataFrame, workers: int | None = None, partitions_per_worker: int = 4) -> pd.DataFrame:
+    """Gera o baseline por blocos de praças num pool de processos e junta em ordem determinística.
+
+    df_filtered é a saída de filter_dataframe. O resultado é o mesmo do fluxo em um único processo.
+    """
+    workers = workers or os.cpu_count() or 1
+    max_week = history_max_week(df_filtered)
+    particoes = split_by_square(df_filtered, workers * partitions_per_worker)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        resultados = list(executor.map(
+            _baseline_partition,
+            particoes,
+            [end_date] * len(particoes),
+            [dias_previsao] * len(particoes),
+            [max_week] * len(particoes),
+        ))
+
+    resultados = [resultado for resultado in resultados if not resultado.empty]
+    if not resultados:
+        return pd.DataFrame(columns=BASELINE_KEYS)
+
+    baseline = pd.concat(resultados, ignore_index=True)
+    # Praças sem algum dia da semana não têm a coluna da data correspondente: o pivot preencheria com 0
+    colunas_datas = sorted(col for col in baseline.columns if col not in BASELINE_KEYS)
+    baseline[colunas_datas] = baseline[colunas_datas].fillna(0)
+
+    return (
+        baseline[BASELINE_KEYS + colunas_datas]
+        .sort_values(by=BASELINE_KEYS)
+        .sort_values(by="logistic_region", kind="stable")
+        .reset_index(drop=True)
+    )
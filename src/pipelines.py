@@ -0,0 +1,88 @@
+from datetime import date
+import pandas as pd
+from backend import DataProcessor, DateUtils, FixingTopForecastingFile
+from compute_backends import get_backend
+from instrumentation import run_stage
+from parallel import parallel_baseline
+from sketches import approximate_baseline
+
+QUEBRAS = ["SAO PAULO", "RIO - ZONA SUL", "BRASIL_SEM_PRACA"]
+
+
+def run_baseline(history, start_date: date, end_date: date, delivery_date: date, incluir_mes_seguinte=False, log_callback=None, instrumentation=None, workers=None, backend="pandas", relative_accuracy=None, dias_previsao=None) -> pd.DataFrame:
+    """Fluxo da página Baseline: filtro -> enriquecimento -> medianas -> previsão -> praças permitidas.
+
+    history pode ser o DataFrame já validado ou um HistoryStore (e, no backend duckdb, arquivos
+    parquet). Com instrumentation, cada etapa vira um span de PipelineInstrumentation. Com
+    workers > 1, as etapas após o filtro rodam por blocos de praças num pool de processos.
+    backend é o nome ("pandas" ou "duckdb") ou uma instância de compute_backends. Com
+    relative_accuracy, as medianas vêm de esboços de quantis lidos semana a semana (sketches),
+    com esse erro relativo, sem ter a janela inteira na memória. dias_previsao, quando já calculado
+    (num lote, por exemplo), substitui as datas geradas a partir de delivery_date.
+    """
+    data_processor = DataProcessor()
+    if dias_previsao is None:
+        dias_previsao = DateUtils.generate_dates_until_end_of_month(delivery_date, incluir_mes_seguinte)
+
+    if relative_accuracy:
+        if log_callback:
+            log_callback(f"Gerando baseline aproximado de {start_date} a {end_date} (precisão relativa {relative_accuracy})...")
+        return run_stage(
+            instrumentation, "approximate_baseline", approximate_baseline,
+            history, start_date, end_date, dias_previsao, relative_accuracy, log_callback
+        )
+
+    backend = get_backend(backend)
+    if log_callback:
+        log_callback(f"Gerando baseline de {start_date} a {end_date} (backend {backend.name})...")
+    df_filtered = run_stage(instrumentation, "filter_dataframe", backend.filter, history, start_date, end_date)
+
+    if workers and workers > 1:
+        return run_stage(
+            instrumentation, "parallel_baseline", parallel_baseline, backend.collect(df_filtered), end_date, dias_previsao, workers
+        )
+
+    df_filtered = run_stage(instrumentation, "order_data_enricher", backend.enrich, df_filtered)
+    pracas_permitidas = run_stage(instrumentation, "allowed_squares", backend.allowed_squares, end_date, df_filtered)
+
+    medianas = run_stage(
+        instrumentation, "calculate_central_tendency", backend.central_tendency,
+        df_filtered, ["var_lw", "qtd_pedido"], "median"
+    )
+    baseline = run_stage(instrumentation, "clip_growth_and_merge", data_processor.clip_growth_and_merge, medianas)
+    baseline = run_stage(instrumentation, "create_baseline_forecast", backend.baseline_forecast, dias_previsao, baseline)
+
+    return run_stage(instrumentation, "baseline_output", data_processor.baseline_output, baseline, pracas_permitidas)
+
+
+def run_consolidador(top_forecasting: pd.DataFrame, baseline_adjusted: pd.DataFrame, quebras=QUEBRAS, log_callback=None, instrumentation=None, backend="pandas", estado=None, chave_previsao=None) -> pd.DataFrame:
+    """Fluxo da página Consolidador: previsão top -> melt do baseline -> quebras por região -> validação.
+
+    Com estado (um IncrementalConsolidador), só os grupos cujo baseline mudou desde a última chamada
+    com a mesma previsão (identificada por chave_previsao) são refeitos.
+    """
+    data_processor = DataProcessor()
+    backend = get_backend(backend)
+
+    if estado is not None:
+        if backend.name != "pandas":
+            raise ValueError(f"A consolidação incremental só está disponível no backend pandas, não em {backend.name}")
+        return estado.update(chave_previsao, top_forecasting, baseline_adjusted, quebras, log_callback, instrumentation)
+
+    if log_callback:
+        log_callback("Consolidando baseline ajustado com a previsão top...")
+    fct_brasil = run_stage(instrumentation, "process_all", FixingTopForecastingFile(top_forecasting).process_all)
+    baseline_melted = run_stage(
+        instrumentation, "melting_baseline_adjusted", data_processor.melting_baseline_adjusted, baseline_adjusted, log_callback
+    )
+
+    base_final = run_stage(
+        instrumentation, "consolidate_region_data", backend.consolidate, baseline_melted, fct_brasil, quebras
+    )
+    base_final_shift = base_final.loc[base_final["tipo"] == "gerencial"].reset_index(drop=True)
+    base_final_turno_g = base_final.loc[base_final["tipo"] == "turno_g"].reset_index(drop=True)
+
+    return run_stage(
+        instrumentation, "final_validation", data_processor.final_validation, base_final_shift, base_final_turno_g, log_callback,
+        fct_brasil, quebras
+    )
@@ -0,0 +1,140 @@
+import os
+import numpy as np
+import pandas as pd
+
+# Tolerância absoluta por grupo (a validação antiga arredondava em 5 casas) e relativa, para totais grandes
+DEFAULT_TOLERANCE = float(os.environ.get("TOLERANCIA_RECONCILIACAO", 1e-5))
+RELATIVE_TOLERANCE = 1e-9
+CHECKS = ["gerencial_turno_g", "previsao_gerencial", "previsao_turno_g"]
+# Por padrão só a coerência entre as quebras interrompe a consolidação; com RECONCILIACAO_ESTRITA=1,
+# a divergência com a previsão também
+STRICT = os.environ.get("RECONCILIACAO_ESTRITA", "0") == "1"
+REPORT_COLUMNS = ["verificacao", "origem", "logistic_region", "date", "modal", "esperado", "obtido", "diferenca"]
+
+
+def _group_ids(frame: pd.DataFrame, cols: list) -> tuple:
+    """Id de grupo de cada linha (na ordem das chaves) e a primeira linha de cada grupo, sem hash."""
+    composto = np.zeros(len(frame), dtype="int64")
+    for col in cols:
+        valores = frame[col]
+        if isinstance(valores.dtype, pd.CategoricalDtype):
+            codigos, n = valores.cat.codes.to_numpy(dtype="int64"), len(valores.cat.categories)
+        else:
+            codigos, unicos = pd.factorize(valores, sort=True)
+            n = len(unicos)
+        composto = composto * (n + 1) + codigos + 1
+    unicos, primeira, grupo = np.unique(composto, return_index=True, return_inverse=True)
+    return grupo, primeira
+
+
+class ReconciliationReport:
+    """Divergências da consolidação, uma linha por grupo, e o número de grupos checados em cada verificação.
+
+    gerencial_turno_g compara o total das duas quebras por (logistic_region, date, modal);
+    previsao_<tipo> compara o total de cada quebra por (origem, date, modal) com o planned_orders da
+    previsão top.
+    """
+
+    def __init__(self, mismatches: pd.DataFrame, checked: dict, strict: bool = STRICT):
+        self.mismatches = mismatches
+        self.checked = checked
+        self.strict = strict
+
+    @property
+    def failed(self) -> bool:
+        fatais = CHECKS if self.strict else ["gerencial_turno_g"]
+        return bool(self.mismatches["verificacao"].isin(fatais).any())
+
+    def summary(self) -> pd.DataFrame:
+        """Uma linha por verificação: grupos checados, divergentes e a maior diferença absoluta."""
+        checks = [check for check in CHECKS if check in self.checked]
+        verificacao = self.mismatches["verificacao"].astype(object)
+        diferenca = self.mismatches["diferenca"].abs()
+        return pd.DataFrame({
+            "verificacao": checks,
+            "grupos": [self.checked[check] for check in checks],
+            "divergentes": verificacao.value_counts().reindex(checks, fill_value=0).to_numpy(dtype="int64"),
+            "maior_diferenca": diferenca.groupby(verificacao).max().reindex(checks).to_numpy(),
+        })
+
+    def describe(self, max_rows: int = 5) -> list:
+        linhas = [
+            f"{linha.verificacao}: {linha.divergentes} de {linha.grupos} grupos divergentes"
+            + (f" (maior diferença {linha.maior_diferenca:.4f})" if linha.divergentes else "")
+            for linha in self.summary().itertuples()
+        ]
+        maiores = self.mismatches.reindex(self.mismatches["diferenca"].abs().sort_values(ascending=False).index).head(max_rows)
+        for linha in maiores.itertuples():
+            local = linha.logistic_region if pd.notna(linha.logistic_region) else linha.origem
+            linhas.append(
+                f"{linha.verificacao} em {local}, {pd.Timestamp(linha.date).date()}, {linha.modal}: "
+                f"esperado {linha.esperado:.4f}, obtido {linha.obtido:.4f}"
+            )
+        return linhas
+
+
+class ReconciliationError(ValueError):
+    """Consolidação com divergências fatais; report traz todas elas."""
+
+    def __init__(self, report: ReconciliationReport):
+        self.report = report
+        super().__init__("Inconsistência detectada na consolidação:\n" + "\n".join(report.describe()))
+
+
+def _mismatches(verificacao: str, chaves: pd.DataFrame, esperado: np.ndarray, obtido: np.ndarray, tolerance: float) -> pd.DataFrame:
+    divergente = ~np.isclose(obtido, esperado, rtol=RELATIVE_TOLERANCE, atol=tolerance)
+    relatorio = chaves.loc[divergente].reset_index(drop=True)
+    relatorio.insert(0, "verificacao", verificacao)
+    relatorio["esperado"] = esperado[divergente]
+    relatorio["obtido"] = obtido[divergente]
+    relatorio["diferenca"] = relatorio["obtido"] - relatorio["esperado"]
+    return relatorio
+
+
+def reconcile(base_final_shift: pd.DataFrame, base_final_turno_g: pd.DataFrame, planned=None, quebras=None,
+              tolerance: float = DEFAULT_TOLERANCE, strict: bool = STRICT) -> ReconciliationReport:
+    """Confere as duas quebras da consolidação entre si e, com planned (um TopForecastLookup) e quebras,
+    contra a previsão top, numa passada agregada por verificação.
+
+    Os frames são as saídas de consolidate_region_data (colunas date, logistic_region, business_model
+    e orders), antes da conversão das datas.
+    """
+    tipos = np.repeat(np.array([0, 1], dtype="int8"), [len(base_final_shift), len(base_final_turno_g)])
+    colunas = ["logistic_region", "date", "business_model", "orders"]
+    base = pd.concat([base_final_shift[colunas], base_final_turno_g[colunas]], ignore_index=True)
+    orders = base["orders"].to_numpy(dtype="float64")
+    relatorios, checked = [], {}
+
+    # Gerencial x turno_g: totais de cada quebra por (logistic_region, date, modal) com bincount
+    grupo, primeira = _group_ids(base, ["logistic_region", "date", "business_model"])
+    n_grupos = len(primeira)
+    gerencial = np.bincount(grupo, weights=np.where(tipos == 0, orders, 0.0), minlength=n_grupos)
+    turno_g = np.bincount(grupo, weights=np.where(tipos == 1, orders, 0.0), minlength=n_grupos)
+    chaves = base.iloc[primeira][["logistic_region", "date", "business_model"]].rename(columns={"business_model": "modal"})
+    relatorios.append(_mismatches("gerencial_turno_g", chaves, gerencial, turno_g, tolerance))
+    checked["gerencial_turno_g"] = n_grupos
+
+    if planned is not None and quebras is not None:
+        # Cada quebra soma, por origem da previsão, o planned_orders do grupo (as shares somam 1)
+        pracas = [quebra for quebra in quebras if quebra != "BRASIL_SEM_PRACA"]
+        logistic_region = base["logistic_region"].astype("category")
+        categorias = logistic_region.cat.categories
+        origem = pd.Index(list(quebras)).get_indexer(categorias.where(categorias.isin(pracas), "BRASIL_SEM_PRACA"))
+        base["origem"] = pd.Categorical.from_codes(
+            np.append(origem, -1)[logistic_region.cat.codes.to_numpy()], categories=list(quebras)
+        )
+        base["tipo"] = tipos
+        grupo, primeira = _group_ids(base, ["tipo", "origem", "date", "business_model"])
+        totais = np.bincount(grupo, weights=orders, minlength=len(primeira))
+        chaves = base.iloc[primeira][["tipo", "origem", "date", "business_model"]].rename(columns={"business_model": "modal"}).reset_index(drop=True)
+        previsto = planned.get(chaves["origem"], chaves["modal"], chaves["date"])
+        for tipo, nome in enumerate(["previsao_gerencial", "previsao_turno_g"]):
+            selecao = (chaves["tipo"] == tipo).to_numpy()
+            relatorios.append(_mismatches(
+                nome, chaves.loc[selecao, ["origem", "date", "modal"]], np.nan_to_num(previsto[selecao]), totais[selecao], tolerance
+            ))
+            checked[nome] = int(selecao.sum())
+
+    mismatches = pd.concat(relatorios, ignore_index=True).reindex(columns=REPORT_COLUMNS)
+    mismatches["verificacao"] = pd.Categorical(mismatches["verificacao"], categories=CHECKS)
+    return ReconciliationReport(mismatches, checked, strict)
@@ -0,0 +1,87 @@
+from datetime import date
+from itertools import product
+import numpy as np
+import pandas as pd
+from backend import DataProcessor
+from baseline_matrix import BaselineMatrix
+
+BASELINE_KEYS = ["big_region", "logistic_region", "modal", "shift", "turno_g"]
+MEDIAN_KEYS = ["modal", "big_region", "logistic_region", "shift", "turno_g", "dds"]
+SQUARE_KEYS = ["modal", "logistic_region"]
+
+# Valores fixos do fluxo da página Baseline
+DEFAULT_SCENARIO = {"clip_min": -0.1, "clip_max": 1.3, "semanas_pracas": 6, "lag": 7, "estatistica": "median"}
+
+
+def scenario_grid(clips=((-0.1, 1.3),), semanas_pracas=(6,), lags=(7,), estatisticas=("median",)) -> pd.DataFrame:
+    """Todas as combinações dos parâmetros, uma linha por cenário, numeradas na coluna "cenario"."""
+    linhas = [
+        {"clip_min": clip[0], "clip_max": clip[1], "semanas_pracas": semanas, "lag": lag, "estatistica": estatistica}
+        for clip, semanas, lag, estatistica in product(clips, semanas_pracas, lags, estatisticas)
+    ]
+    grid = pd.DataFrame(linhas, columns=list(DEFAULT_SCENARIO))
+    grid.insert(0, "cenario", np.arange(len(grid)))
+    return grid
+
+
+def enrich_lags(df_filtered: pd.DataFrame, lags: list) -> pd.DataFrame:
+    """order_data_enricher com uma coluna var_lw_{lag} por lag, calculadas sobre a mesma ordenação."""
+    data_processor = DataProcessor()
+    enriched = data_processor.order_data_enricher(df_filtered, max_week=np.iinfo("int32").max)
+    grupos = enriched.groupby(["modal", "big_region", "logistic_region", "shift", "turno_g"], observed=False)["qtd_pedido"]
+    for lag in lags:
+        enriched[f"var_lw_{lag}"] = (enriched["qtd_pedido"] / grupos.shift(lag) - 1).round(4).fillna(0)
+
+    # O descarte da última semana vem depois dos lags, como em order_data_enricher
+    max_week = int(enriched["ano_semana"].max())
+    return enriched.query(f"ano_semana < {max_week}").copy()
+
+
+def _allowed_squares(enriched: pd.DataFrame, end_date: date, grid: pd.DataFrame) -> pd.DataFrame:
+    # Uma praça é permitida se o último pedido até end_date cai dentro da janela do cenário,
+    # o mesmo que DataProcessor.allowed_squares com weeks=semanas_pracas
+    datas = enriched["data_entrega"].dt.date
+    ultimo = enriched.loc[datas <= end_date].assign(data_entrega=datas).groupby(SQUARE_KEYS, observed=True)["data_entrega"].max()
+    inicio = pd.Series([end_date - pd.Timedelta(weeks=int(semanas)) for semanas in grid["semanas_pracas"]])
+
+    permitidas = (ultimo.to_numpy()[None, :] >= inicio.to_numpy(dtype=object)[:, None])
+    cenario, praca = np.nonzero(permitidas)
+    pracas = ultimo.index.to_frame(index=False).iloc[praca].reset_index(drop=True)
+    pracas.insert(0, "cenario", grid["cenario"].to_numpy()[cenario])
+    return pracas
+
+
+def run_scenarios(df_filtered: pd.DataFrame, end_date: date, dias_previsao: pd.DataFrame, grid: pd.DataFrame, log_callback=None) -> pd.DataFrame:
+    """Baselines de todos os cenários de scenario_grid, empilhados com a chave "cenario".
+
+    df_filtered é a saída de filter_dataframe. O enriquecimento, a agregação das seis chaves e o pivot
+    da previsão rodam uma única vez para o grid inteiro; cada cenário só escolhe suas colunas de
+    medida, aplica seus limites e sua janela de praças. O resultado de cada cenário é o mesmo de
+    run_baseline com os parâmetros dele.
+    """
+    data_processor = DataProcessor()
+    lags = sorted(set(int(lag) for lag in grid["lag"]))
+    estatisticas = sorted(set(grid["estatistica"]))
+    if log_callback:
+        log_callback(f"Calculando {len(grid)} cenários ({len(lags)} lags, {len(estatisticas)} medidas)...")
+
+    enriched = enrich_lags(df_filtered, lags)
+    colunas = ["qtd_pedido"] + [f"var_lw_{lag}" for lag in lags]
+    medidas = data_processor.calculate_central_tendency(enriched, colunas, estatisticas)
+
+    # Matrizes cenário x chave: cada cenário aponta para as colunas da sua medida e do seu lag
+    qtd = medidas[[f"{estatistica}_qtd_pedido" for estatistica in grid["estatistica"]]].to_numpy(dtype="float64").T
+    var = medidas[[f"{estatistica}_var_lw_{lag}" for estatistica, lag in zip(grid["estatistica"], grid["lag"])]].to_numpy(dtype="float64").T
+    var = np.clip(var, grid["clip_min"].to_numpy()[:, None], grid["clip_max"].to_numpy()[:, None])
+    orders = np.round(qtd * (1 + var), 0)
+
+    baselines = medidas.loc[np.tile(np.arange(len(medidas)), len(grid)), MEDIAN_KEYS].reset_index(drop=True)
+    baselines.insert(0, "cenario", np.repeat(grid["cenario"].to_numpy(), len(medidas)))
+    baselines["orders"] = orders.ravel()
+
+    # Mesma matriz chave x data de create_baseline_forecast, com o cenário como primeira chave
+    baseline_por_praca = BaselineMatrix.from_medians(
+        baselines, dias_previsao, keys=["cenario"] + BASELINE_KEYS, order=("cenario", "logistic_region")
+    ).to_wide()
+
+    return baseline_por_praca.merge(_allowed_squares(enriched, end_date, grid), on=["cenario"] + SQUARE_KEYS, how="inner")
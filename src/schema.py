@@ -0,0 +1,43 @@
+import pandas as pd
+from contrato import Orders
+
+# Colunas de texto do contrato viram categóricas; o restante ganha inteiros compactos
+DIMENSION_COLUMNS = [nome for nome, field in Orders.model_fields.items() if field.annotation is str]
+
+INTEGER_DTYPES = {
+    "qtd_pedido": "int32",
+    "qtd_pedidos": "int32",
+    "ano": "int16",
+    "mes": "int8",
+    "semana": "int8",
+    "dds": "int8",
+    "ano_semana": "int32",
+}
+
+
+def schema_categories(*dfs: pd.DataFrame) -> dict:
+    """Conjunto ordenado de categorias de cada dimensão, somando todos os DataFrames."""
+    categorias = {}
+    for col in DIMENSION_COLUMNS:
+        valores = set()
+        for df in dfs:
+            if col in df.columns:
+                valores.update(df[col].dropna().unique())
+        categorias[col] = sorted(valores)
+    return categorias
+
+
+def apply_schema(df: pd.DataFrame, categories: dict | None = None) -> pd.DataFrame:
+    # Categorias ordenadas mantêm sort_values e groupby na mesma ordem das colunas de texto
+    for col in DIMENSION_COLUMNS:
+        if col not in df.columns:
+            continue
+        if categories and col in categories:
+            df[col] = df[col].astype(pd.CategoricalDtype(categories[col]))
+        elif not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype(pd.CategoricalDtype(sorted(df[col].dropna().unique())))
+
+    for col, dtype in INTEGER_DTYPES.items():
+        if col in df.columns and not df[col].isna().any():
+            df[col] = df[col].astype(dtype)
+    return df
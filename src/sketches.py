@@ -0,0 +1,322 @@
+import math
+from datetime import date, timedelta
+import numpy as np
+import pandas as pd
+from backend import DataProcessor
+from history_store import HistoryStore
+from schema import apply_schema, schema_categories
+
+MEDIAN_KEYS = ["modal", "big_region", "logistic_region", "shift", "turno_g", "dds"]
+LAG_KEYS = ["modal", "big_region", "logistic_region", "shift", "turno_g"]
+SQUARE_KEYS = ["modal", "logistic_region"]
+LAG = 7
+# Valores com módulo abaixo disso caem no balde do zero
+MIN_VALUE = 1e-9
+# Balde com sinal em BUCKET_BITS bits (o infinito fica no extremo) e até MAX_COLUMNS colunas por chave
+BUCKET_BITS = 32
+INF_BUCKET = 2**30
+MAX_COLUMNS = 64
+
+
+class QuantileSketch:
+    """Esboço de quantis por chave com erro relativo limitado, no estilo do DDSketch.
+
+    Cada valor cai num balde logarítmico de razão gamma = (1 + a) / (1 - a) e o esboço guarda só a
+    contagem de cada (chave, coluna, balde), num código int64 ordenado e num contador: a memória
+    cresce com o número de baldes ocupados, e não com o de linhas. Qualquer quantil devolvido fica a
+    até relative_accuracy (relativo) do valor exato. Esboços de blocos ou partições diferentes se
+    juntam somando as contagens (merge).
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01, keys: list = MEDIAN_KEYS, compact_rows: int = 250_000):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError(f"relative_accuracy deve estar entre 0 e 1: {relative_accuracy}")
+        self.relative_accuracy = relative_accuracy
+        self.keys = list(keys)
+        self.compact_rows = compact_rows
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        # Desloca os índices para que o menor balde fora do zero seja 1 e o sinal do código seja o do valor
+        self._offset = 1 - math.ceil(math.log(MIN_VALUE) / self._log_gamma)
+        self.rows = 0
+        self.columns = []
+        # Cada chave distinta ganha um id; as contagens só guardam ids
+        self._chaves = pd.DataFrame(columns=self.keys)
+        self._indice = pd.MultiIndex.from_arrays([[] for _ in self.keys], names=self.keys)
+        self._codes = np.zeros(0, dtype="int64")
+        self._n = np.zeros(0, dtype="int64")
+        self._pending = []
+        self._pending_rows = 0
+
+    def _bucket(self, values: np.ndarray) -> np.ndarray:
+        valores = np.nan_to_num(np.asarray(values, dtype="float64"), nan=0.0, posinf=np.inf, neginf=-np.inf)
+        modulo = np.abs(valores)
+        baldes = np.zeros(len(valores), dtype="int64")
+        finitos = (modulo > MIN_VALUE) & np.isfinite(modulo)
+        baldes[finitos] = np.ceil(np.log(modulo[finitos]) / self._log_gamma).astype("int64") + self._offset
+        baldes[np.isinf(modulo)] = INF_BUCKET
+        return baldes * np.sign(valores).astype("int64")
+
+    def _value(self, baldes: np.ndarray) -> np.ndarray:
+        # Representante do balde: o ponto com o mesmo erro relativo até as duas bordas
+        indice = np.abs(baldes)
+        finitos = (indice > 0) & (indice < INF_BUCKET)
+        modulo = np.zeros(len(baldes))
+        modulo[finitos] = 2 * self.gamma ** (indice[finitos] - self._offset) / (self.gamma + 1)
+        modulo[indice == INF_BUCKET] = np.inf
+        return modulo * np.sign(baldes)
+
+    @staticmethod
+    def _encode(chave: np.ndarray, coluna: np.ndarray, balde: np.ndarray) -> np.ndarray:
+        # A ordem dos códigos é a de (chave, coluna, balde), e a dos baldes é a dos valores
+        grupo = chave.astype("int64") * MAX_COLUMNS + coluna
+        return (grupo << BUCKET_BITS) | (balde + INF_BUCKET)
+
+    @staticmethod
+    def _decode(codes: np.ndarray) -> tuple:
+        grupo = codes >> BUCKET_BITS
+        return grupo // MAX_COLUMNS, grupo % MAX_COLUMNS, (codes & (2**BUCKET_BITS - 1)) - INF_BUCKET
+
+    def _key_ids(self, chaves: pd.DataFrame) -> np.ndarray:
+        # Chaves ainda não vistas entram no fim da tabela de chaves
+        indice = pd.MultiIndex.from_frame(chaves.astype(str))
+        ids = self._indice.get_indexer(indice)
+        novas = ids < 0
+        if novas.any():
+            ids[novas] = len(self._chaves) + np.arange(novas.sum())
+            self._indice = self._indice.append(indice[novas])
+            self._chaves = pd.concat([self._chaves, chaves.loc[novas].astype(object)], ignore_index=True)
+        return ids
+
+    def _column_ids(self, cols: list) -> np.ndarray:
+        for col in cols:
+            if col not in self.columns:
+                if len(self.columns) == MAX_COLUMNS:
+                    raise ValueError(f"O esboço aceita no máximo {MAX_COLUMNS} colunas.")
+                self.columns.append(col)
+        return np.array([self.columns.index(col) for col in cols], dtype="int64")
+
+    def update(self, df: pd.DataFrame, cols: list):
+        """Acrescenta os valores de cols de um bloco de linhas; NaN conta como 0, como na página."""
+        grupos = df.groupby(self.keys, observed=True, sort=False)
+        chave = self._key_ids(grupos.size().index.to_frame(index=False))[grupos.ngroup().to_numpy()]
+        colunas = self._column_ids(cols)
+        codes = np.concatenate([
+            self._encode(chave, coluna, self._bucket(df[col].to_numpy())) for col, coluna in zip(cols, colunas)
+        ])
+        self._add(*np.unique(codes, return_counts=True))
+        self.rows += len(df)
+
+    def merge(self, other: "QuantileSketch") -> "QuantileSketch":
+        if other.relative_accuracy != self.relative_accuracy or other.keys != self.keys:
+            raise ValueError("Só é possível juntar esboços com a mesma precisão e as mesmas chaves.")
+        other._compact()
+        chave, coluna, balde = self._decode(other._codes)
+        chave = self._key_ids(other._chaves)[chave]
+        coluna = self._column_ids(other.columns)[coluna]
+        self._add(self._encode(chave, coluna, balde), other._n)
+        self.rows += other.rows
+        return self
+
+    def _add(self, codes: np.ndarray, n: np.ndarray):
+        self._pending.append((codes, n.astype("int64")))
+        self._pending_rows += len(codes)
+        if self._pending_rows > self.compact_rows:
+            self._compact()
+
+    def _compact(self):
+        if not self._pending:
+            return
+        codes = np.concatenate([self._codes] + [codes for codes, _ in self._pending])
+        n = np.concatenate([self._n] + [n for _, n in self._pending])
+        self._codes, posicao = np.unique(codes, return_inverse=True)
+        self._n = np.bincount(posicao, weights=n, minlength=len(self._codes)).astype("int64")
+        self._pending = []
+        self._pending_rows = 0
+
+    def counts(self) -> pd.DataFrame:
+        """Contagens por chave, coluna e balde, com o valor representante de cada balde."""
+        self._compact()
+        chave, coluna, balde = self._decode(self._codes)
+        contagens = apply_schema(self._chaves.iloc[chave].reset_index(drop=True))
+        contagens["coluna"] = np.asarray(self.columns, dtype=object)[coluna]
+        contagens["valor"] = self._value(balde)
+        contagens["n"] = self._n
+        return contagens
+
+    @property
+    def buckets(self) -> int:
+        self._compact()
+        return len(self._codes)
+
+    @property
+    def nbytes(self) -> int:
+        self._compact()
+        return self._codes.nbytes + self._n.nbytes
+
+    def quantile(self, q: float) -> pd.DataFrame:
+        """Quantil q de cada coluna por chave, com a interpolação linear do pandas entre as posições vizinhas."""
+        self._compact()
+        n = self._n
+        acumulado = np.cumsum(n)
+        chave, coluna, balde = self._decode(self._codes)
+        grupo = self._codes >> BUCKET_BITS
+        primeira = np.flatnonzero(np.r_[True, grupo[1:] != grupo[:-1]]) if len(grupo) else np.zeros(0, dtype="int64")
+
+        inicio = acumulado[primeira] - n[primeira]
+        total = np.diff(np.r_[inicio, acumulado[-1:]])
+        posicao = q * (total - 1)
+        fracao = posicao - np.floor(posicao)
+
+        valores = self._value(balde)
+        abaixo = valores[np.searchsorted(acumulado, inicio + np.floor(posicao), side="right")]
+        acima = valores[np.searchsorted(acumulado, inicio + np.ceil(posicao), side="right")]
+        with np.errstate(invalid="ignore"):
+            quantil = np.where(abaixo == acima, abaixo, abaixo + fracao * (acima - abaixo))
+
+        largo = pd.DataFrame({
+            "chave": chave[primeira],
+            "coluna": np.asarray(self.columns, dtype=object)[coluna[primeira]],
+            "valor": quantil,
+        }).pivot(index="chave", columns="coluna", values="valor")
+        resultado = apply_schema(self._chaves.iloc[largo.index.to_numpy()].reset_index(drop=True))
+        resultado[list(largo.columns)] = largo.to_numpy()
+        return resultado
+
+    def central_tendency(self, type: str | list = "median") -> pd.DataFrame:
+        """Mesmo formato de DataProcessor.calculate_central_tendency, para median e quantis "qNN"."""
+        estatisticas = [type] if isinstance(type, str) else list(type)
+        medidas = None
+        for estatistica in estatisticas:
+            if estatistica == "median":
+                q = 0.5
+            elif estatistica.startswith("q") and estatistica[1:].isdigit():
+                q = int(estatistica[1:]) / 100
+            else:
+                raise ValueError(f"Medida não suportada no modo aproximado: {estatistica}")
+            # Todas as medidas saem com as mesmas chaves, na ordem dos ids
+            resultado = self.quantile(q)
+            if medidas is None:
+                medidas = resultado[self.keys].copy()
+            for col in self.columns:
+                medidas[f"{estatistica}_{col}"] = resultado[col].to_numpy()
+        return medidas
+
+
+def _weekly_chunks(history, start_date: date, end_date: date, chunk_weeks: int):
+    # chunk_weeks semanas por vez: no HistoryStore cada leitura abre só as partições dessas semanas
+    if not isinstance(history, HistoryStore):
+        datas = pd.to_datetime(history["data_entrega"])
+    segunda = start_date - timedelta(days=start_date.weekday())
+    while segunda <= end_date:
+        inicio, fim = max(segunda, start_date), min(segunda + timedelta(weeks=chunk_weeks, days=-1), end_date)
+        if isinstance(history, HistoryStore):
+            bloco = history.read(inicio, fim)
+        else:
+            bloco = history.loc[(datas >= pd.Timestamp(inicio)) & (datas <= pd.Timestamp(fim))].copy()
+        if not bloco.empty:
+            if not pd.api.types.is_datetime64_any_dtype(bloco["data_entrega"]):
+                bloco["data_entrega"] = pd.to_datetime(bloco["data_entrega"])
+            yield bloco
+        segunda += timedelta(weeks=chunk_weeks)
+
+
+def stream_sketch(history, start_date: date, end_date: date, relative_accuracy: float = 0.01, cols=("var_lw", "qtd_pedido"), chunk_weeks: int = 4, log_callback=None) -> tuple:
+    """Enriquece e esboça a janela em blocos de chunk_weeks semanas, sem ter a janela inteira na memória.
+
+    O lag de cada bloco usa as últimas LAG linhas de cada grupo dos blocos anteriores, e a maior
+    ano_semana fica retida até aparecer uma maior, já que a página a descarta. Retorna o esboço das
+    colunas cols e as praças permitidas, como DataProcessor.allowed_squares sobre o mesmo intervalo.
+    """
+    esboco = QuantileSketch(relative_accuracy)
+    cauda = None
+    retidas, maior_semana = [], None
+    pracas = []
+    inicio_pracas = pd.Timestamp(end_date - timedelta(weeks=6))
+
+    def incluir(linhas):
+        esboco.update(linhas, list(cols))
+        pracas.append(linhas.loc[linhas["data_entrega"] >= inicio_pracas, SQUARE_KEYS].drop_duplicates())
+
+    for bloco in _weekly_chunks(history, start_date, end_date, chunk_weeks):
+        if cauda is not None:
+            # Mesmas categorias nos dois lados, para o concat manter as chaves categóricas
+            categorias = schema_categories(cauda, bloco)
+            cauda, bloco = apply_schema(cauda, categorias), apply_schema(bloco, categorias)
+        bloco["dds"] = bloco["data_entrega"].dt.weekday
+        bloco["ano_semana"] = bloco["data_entrega"].dt.year * 100 + bloco["data_entrega"].dt.isocalendar().week.astype("int64")
+        bloco = bloco.sort_values(["data_entrega", "modal", "logistic_region", "shift", "turno_g"], kind="stable")
+
+        linhas = bloco if cauda is None else pd.concat([cauda.assign(_cauda=True), bloco], ignore_index=True)
+        qtd_lw = linhas.groupby(LAG_KEYS, observed=True, sort=False)["qtd_pedido"].shift(LAG)
+        linhas = linhas.assign(var_lw=(linhas["qtd_pedido"] / qtd_lw - 1).round(4).fillna(0))
+        cauda = linhas.groupby(LAG_KEYS, observed=True, sort=False).tail(LAG).drop(columns=["_cauda", "var_lw"], errors="ignore")
+        if "_cauda" in linhas.columns:
+            linhas = linhas.loc[linhas["_cauda"].isna()].drop(columns="_cauda")
+
+        # Linhas da maior ano_semana até aqui esperam: só contam se vier uma semana maior
+        semana_bloco = int(linhas["ano_semana"].max())
+        if maior_semana is None or semana_bloco > maior_semana:
+            for retida in retidas:
+                incluir(retida)
+            retidas, maior_semana = [], semana_bloco
+        incluir(linhas.loc[linhas["ano_semana"] < maior_semana])
+        retidas.append(linhas.loc[linhas["ano_semana"] == maior_semana])
+
+    if log_callback:
+        log_callback(f"Esboço de quantis: {esboco.rows} linhas em {esboco.buckets} baldes (precisão relativa {relative_accuracy}).")
+    permitidas = pd.concat(pracas, ignore_index=True).drop_duplicates() if pracas else pd.DataFrame(columns=SQUARE_KEYS)
+    return esboco, apply_schema(permitidas.reset_index(drop=True))
+
+
+def approximate_baseline(history, start_date: date, end_date: date, dias_previsao: pd.DataFrame, relative_accuracy: float = 0.01, log_callback=None) -> pd.DataFrame:
+    """Fluxo da página Baseline com as medianas vindas de stream_sketch em vez do groupby exato."""
+    data_processor = DataProcessor()
+    esboco, pracas_permitidas = stream_sketch(history, start_date, end_date, relative_accuracy, log_callback=log_callback)
+    baseline = data_processor.clip_growth_and_merge(esboco.central_tendency("median"))
+    baseline = data_processor.create_baseline_forecast(dias_previsao, baseline)
+    return data_processor.baseline_output(baseline, pracas_permitidas)
+
+
+def sketch_accuracy_report(history, start_date: date, end_date: date, relative_accuracies=(0.05, 0.01, 0.005), estatisticas=("median", "q90")) -> pd.DataFrame:
+    """Compara o modo aproximado com o exato (calculate_central_tendency) na mesma janela.
+
+    Uma linha por precisão, medida e coluna, com o erro relativo (máximo e p99) e absoluto contra o
+    exato, a fração de chaves com o mesmo orders do baseline e o tamanho do esboço em baldes e em
+    linhas lidas. A garantia de erro relativo vale para cada posição; numa mediana que interpola
+    vizinhos de sinais opostos (var_lw perto de 0), o erro absoluto é a medida que faz sentido.
+    """
+    data_processor = DataProcessor()
+    df = data_processor.filter_dataframe(history.copy() if isinstance(history, pd.DataFrame) else history, start_date, end_date)
+    df = data_processor.order_data_enricher(df)
+    cols = ["var_lw", "qtd_pedido"]
+    exato = data_processor.calculate_central_tendency(df, cols, list(estatisticas))
+    chave = lambda medidas: medidas.astype({col: str for col in MEDIAN_KEYS}).astype({"dds": "int64"})
+    exato = chave(exato)
+    orders_exato = data_processor.clip_growth_and_merge(exato) if "median" in estatisticas else None
+
+    linhas = []
+    for precisao in relative_accuracies:
+        esboco, _ = stream_sketch(history, start_date, end_date, precisao, cols)
+        aproximado = chave(esboco.central_tendency(list(estatisticas)))
+        comparado = exato.merge(aproximado, on=MEDIAN_KEYS, suffixes=("", "_aprox"))
+        for estatistica in estatisticas:
+            for col in cols:
+                nome = f"{estatistica}_{col}"
+                real, aprox = comparado[nome].to_numpy(), comparado[f"{nome}_aprox"].to_numpy()
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    erro = np.where(real == aprox, 0.0, np.abs(aprox - real) / np.abs(real))
+                linhas.append({
+                    "precisao": precisao, "medida": estatistica, "coluna": col,
+                    "erro_relativo_max": float(np.nanmax(erro)) if len(erro) else 0.0,
+                    "erro_relativo_p99": float(np.nanquantile(erro, 0.99)) if len(erro) else 0.0,
+                    "erro_absoluto_max": float(np.nanmax(np.abs(aprox - real))) if len(erro) else 0.0,
+                    "chaves": len(comparado),
+                    "baldes": esboco.buckets, "linhas": esboco.rows,
+                })
+        if orders_exato is not None:
+            orders = orders_exato.merge(data_processor.clip_growth_and_merge(aproximado), on=MEDIAN_KEYS, suffixes=("", "_aprox"))
+            iguais = (orders["orders"] == orders["orders_aprox"]).mean() if len(orders) else 1.0
+            for linha in linhas[-2 * len(estatisticas):]:
+                linha["orders_iguais"] = float(iguais)
+    return pd.DataFrame(linhas)
@@ -0,0 +1,123 @@
+import os
+from datetime import date, timedelta
+import numpy as np
+import pandas as pd
+
+MODAIS = ["CARROS", "NAO_CARROS", "MOTOS", "BIKES", "VANS"]
+ORIGENS_PREVISAO = ["BRASIL_SEM_PRACA", "BRASIL", "SAO PAULO", "RIO - ZONA SUL"]
+# Peso de cada dia da semana (segunda = 0) no volume de pedidos
+SAZONALIDADE_SEMANAL = np.array([1.0, 0.95, 0.95, 1.0, 1.15, 1.3, 0.8])
+
+
+def _region_names(n_regions: int) -> list:
+    # As duas praças com previsão própria no Consolidador entram sempre na lista
+    nomes = ["SAO PAULO", "RIO - ZONA SUL"]
+    nomes += [f"PRACA {i:03d}" for i in range(len(nomes), n_regions)]
+    return nomes[:n_regions]
+
+
+def generate_history(
+    n_regions: int = 10,
+    n_modals: int = 3,
+    n_shifts: int = 3,
+    n_turnos: int = 2,
+    n_days: int = 365,
+    start: date = date(2024, 1, 1),
+    n_big_regions: int = 4,
+    seed: int = 0,
+) -> pd.DataFrame:
+    """Histórico de pedidos no formato de historico_pedidos.xlsx.
+
+    O número de linhas é n_regions * n_modals * n_shifts * n_turnos * n_days.
+    """
+    rng = np.random.default_rng(seed)
+    regioes = _region_names(n_regions)
+    modais = MODAIS[:n_modals]
+    shifts = [f"SHIFT {i + 1}" for i in range(n_shifts)]
+    turnos = [f"G{i + 1}" for i in range(n_turnos)]
+    big_regions = np.array([f"REGIAO {i + 1}" for i in range(n_big_regions)])
+
+    n_chaves = n_regions * n_modals * n_shifts * n_turnos
+    # Índices de cada dimensão para todas as combinações, na ordem regiao > modal > shift > turno
+    regiao, modal, shift, turno = np.unravel_index(np.arange(n_chaves), (n_regions, n_modals, n_shifts, n_turnos))
+    escala = rng.lognormal(mean=4.0, sigma=0.8, size=n_chaves)
+
+    datas = pd.date_range(start, periods=n_days, freq="D")
+    tendencia = 1 + 0.1 * np.arange(n_days) / 365
+    fator_dia = SAZONALIDADE_SEMANAL[datas.weekday.to_numpy()] * tendencia
+
+    media = np.outer(fator_dia, escala)
+    qtd = np.maximum(rng.poisson(media), 1).astype("int32").ravel()
+
+    chaves = np.tile(np.arange(n_chaves), n_days)
+    df = pd.DataFrame({
+        "data_entrega": np.repeat(datas.to_numpy(), n_chaves),
+        "modal": pd.Categorical.from_codes(modal[chaves], modais),
+        "big_region": pd.Categorical.from_codes(regiao[chaves] % n_big_regions, big_regions),
+        "logistic_region": pd.Categorical.from_codes(regiao[chaves], regioes),
+        "shift": pd.Categorical.from_codes(shift[chaves], shifts),
+        "turno_g": pd.Categorical.from_codes(turno[chaves], turnos),
+        "qtd_pedido": qtd,
+    })
+    return df
+
+
+def forecast_dates(delivery_date: date, n_days: int) -> list:
+    return [delivery_date + timedelta(days=i + 1) for i in range(n_days)]
+
+
+def generate_adjusted_baseline(history: pd.DataFrame, dates: list, seed: int = 0) -> pd.DataFrame:
+    """Baseline largo (5 colunas de chave + uma coluna por data), como o gerado pela página Baseline."""
+    rng = np.random.default_rng(seed)
+    chaves = (
+        history[["big_region", "logistic_region", "modal", "shift", "turno_g"]]
+        .drop_duplicates()
+        .astype(object)
+        .sort_values(by="logistic_region")
+        .reset_index(drop=True)
+    )
+    valores = rng.integers(0, 500, size=(len(chaves), len(dates)))
+    return pd.concat([chaves, pd.DataFrame(valores, columns=list(dates))], axis=1)
+
+
+def generate_top_forecast(dates: list, modais: list, origens: list = ORIGENS_PREVISAO, seed: int = 0) -> pd.DataFrame:
+    """Planilha de previsão top no layout de blocos que FixingTopForecastingFile espera.
+
+    O primeiro bloco traz o cabeçalho na primeira linha; os demais têm uma linha com o nome
+    da origem e depois o cabeçalho. Os blocos são separados por uma linha vazia.
+    """
+    rng = np.random.default_rng(seed)
+    largura = len(dates) + 1
+    cabecalho = ["MODAL"] + [pd.Timestamp(d).to_pydatetime() for d in dates]
+    # A previsão top usa "NAO CARROS", que o FixingTopForecastingFile converte para NAO_CARROS
+    nomes_modais = [modal.replace("_", " ") for modal in modais]
+
+    linhas = []
+    for i, origem in enumerate(origens):
+        if i > 0:
+            linhas.append([None] * largura)
+            linhas.append([origem] + [None] * (largura - 1))
+        linhas.append(cabecalho)
+        for modal in nomes_modais:
+            linhas.append([modal] + list(rng.integers(1_000, 50_000, size=len(dates)).astype(float)))
+
+    return pd.DataFrame(linhas, columns=["PREVISAO TOP"] + [f"Unnamed: {i}" for i in range(1, largura)])
+
+
+def write_dataset(directory: str, history: pd.DataFrame, adjusted_baseline: pd.DataFrame, top_forecast: pd.DataFrame, history_format: str = "parquet") -> dict:
+    """Grava os três arquivos de entrada e retorna o caminho de cada um."""
+    os.makedirs(directory, exist_ok=True)
+    paths = {
+        "historico": os.path.join(directory, f"historico_pedidos.{history_format}"),
+        "baseline": os.path.join(directory, "baseline_ajustado.xlsx"),
+        "previsao": os.path.join(directory, "previsao_top.xlsx"),
+    }
+    if history_format == "parquet":
+        history.to_parquet(paths["historico"], index=False)
+    elif history_format == "csv":
+        history.to_csv(paths["historico"], index=False)
+    else:
+        history.to_excel(paths["historico"], index=False)
+    adjusted_baseline.to_excel(paths["baseline"], index=False)
+    top_forecast.to_excel(paths["previsao"], index=False)
+    return paths
@@ -0,0 +1,312 @@
+import pandas as pd
+import numpy as np
+from datetime import date, datetime
+from pydantic import BaseModel
+from contrato import Orders
+
+# Formatos de texto aceitos pelo campo datetime do pydantic: data ISO completa, hora e fuso opcionais
+ISO_DATETIME = (
+    r"^(?P<data>[0-9]{4}-[0-9]{2}-[0-9]{2})"
+    r"(?:[Tt _](?P<hora>[0-9]{2}:[0-9]{2})(?::(?P<segundo>[0-9]{2})(?:[.,](?P<fracao>[0-9]{1,6})[0-9]*)?)?"
+    r"(?:[Zz]|[+-][0-9]{2}:?[0-9]{2})?)?\Z"
+)
+UNIX_TEXT = r"[+-]?(?:[0-9]+(?:\.[0-9]*)?|\.[0-9]+)"
+
+
+class ValidationErrors:
+    """Falhas de validação como tabela compacta: uma linha por (linha, coluna, regra).
+
+    linha é a numeração do Excel (índice + 2); coluna e regra são categóricas. Mensagens que não
+    pertencem a uma linha (coluna ausente, arquivo ilegível) ficam em messages. Iterar devolve as
+    mensagens e depois uma mensagem por linha inválida, montadas só quando pedidas.
+    """
+
+    COLUMNS = ["linha", "coluna", "regra"]
+
+    def __init__(self, table: pd.DataFrame | None = None, messages: list | None = None):
+        self.messages = list(messages or [])
+        self.truncated = False
+        self._tables = []
+        self._rows = 0
+        if table is not None:
+            self._append(table)
+
+    def _append(self, table: pd.DataFrame):
+        if table.empty:
+            return
+        self._tables.append(table[self.COLUMNS])
+        self._rows += table["linha"].nunique()
+
+    def extend(self, other):
+        """Acrescenta outra ValidationErrors (de outro bloco de linhas) ou uma lista de mensagens."""
+        if isinstance(other, ValidationErrors):
+            self.messages.extend(other.messages)
+            for table in other._tables:
+                self._append(table)
+            self.truncated = self.truncated or other.truncated
+        else:
+            self.messages.extend(other)
+
+    def copy(self) -> "ValidationErrors":
+        """Cópia independente: truncate e extend na cópia não alteram a original (as tabelas não mudam no lugar)."""
+        copia = ValidationErrors(messages=self.messages)
+        copia._tables, copia._rows, copia.truncated = list(self._tables), self._rows, self.truncated
+        return copia
+
+    @property
+    def rows(self) -> int:
+        """Número de linhas com pelo menos uma falha."""
+        return self._rows
+
+    def __len__(self) -> int:
+        return len(self.messages) + self._rows
+
+    def __bool__(self) -> bool:
+        return len(self) > 0
+
+    def __iter__(self):
+        yield from self.messages
+        tabela = self.to_frame()
+        for linha, falhas in tabela.groupby("linha", sort=True):
+            detalhes = "; ".join(f"{coluna}: {regra}" for coluna, regra in zip(falhas["coluna"], falhas["regra"]))
+            yield f"Erro na linha {linha}: {detalhes}"
+
+    def to_frame(self) -> pd.DataFrame:
+        """Tabela completa, ordenada pela linha e, dentro dela, pela ordem das checagens."""
+        if not self._tables:
+            return pd.DataFrame({"linha": pd.Series(dtype="int64"), "coluna": pd.Categorical([]), "regra": pd.Categorical([])})
+        tabela = pd.concat(self._tables, ignore_index=True)
+        tabela[["coluna", "regra"]] = tabela[["coluna", "regra"]].astype("category")
+        return tabela.sort_values("linha", kind="stable").reset_index(drop=True)
+
+    def truncate(self, max_rows: int):
+        """Mantém só as falhas das primeiras max_rows linhas inválidas."""
+        tabela = self.to_frame()
+        primeiras = tabela["linha"].drop_duplicates().iloc[:max_rows]
+        self._tables, self._rows = [], 0
+        self._append(tabela.loc[tabela["linha"].isin(primeiras)])
+        self.truncated = True
+
+    def summary(self, max_samples: int = 5) -> pd.DataFrame:
+        """Falhas agrupadas por coluna e regra, com a contagem e até max_samples linhas de exemplo."""
+        tabela = self.to_frame()
+        agrupado = tabela.groupby(["coluna", "regra"], observed=True, sort=False)["linha"]
+        resumo = agrupado.size().rename("ocorrencias").to_frame()
+        resumo["linhas_exemplo"] = agrupado.agg(lambda linhas: ", ".join(map(str, linhas.iloc[:max_samples])))
+        return resumo.sort_values("ocorrencias", ascending=False, kind="stable").reset_index()
+
+    def describe(self, max_samples: int = 5) -> list:
+        """Mensagens gerais e uma mensagem por coluna e regra, para logs e linha de comando."""
+        linhas = list(self.messages)
+        linhas += [
+            f"{resumo.coluna}: {resumo.regra} em {resumo.ocorrencias} linhas (ex.: {resumo.linhas_exemplo})"
+            for resumo in self.summary(max_samples).itertuples(index=False)
+        ]
+        if self.truncated:
+            linhas.append(f"Validação interrompida após {self.rows} linhas com erro.")
+        return linhas
+
+
+class OrdersValidator:
+    """Valida o histórico de pedidos coluna a coluna a partir do contrato pydantic."""
+
+    def __init__(self, model: type[BaseModel] = Orders):
+        self.model = model
+
+    def _field_rules(self, field) -> dict:
+        # Extrai os limites numéricos (gt, ge, lt, le) declarados no contrato, ex: PositiveInt -> gt=0
+        bounds = {}
+        for constraint in field.metadata:
+            for bound in ("gt", "ge", "lt", "le"):
+                value = getattr(constraint, bound, None)
+                if value is not None:
+                    bounds[bound] = value
+        return bounds
+
+    @staticmethod
+    def _from_unix(numerica: pd.Series) -> pd.Series:
+        # Como no pydantic: segundos desde 1970, ou milissegundos quando o valor passa de 2e10
+        milissegundos = numerica.where(numerica.abs() > 2e10, numerica * 1000)
+        # Fora do intervalo do datetime64[ns] o to_datetime estoura mesmo com errors="coerce"
+        limite = (pd.Timestamp.max - pd.Timestamp(0)) // pd.Timedelta(milliseconds=1)
+        milissegundos = milissegundos.where(milissegundos.abs() < limite)
+        return pd.to_datetime(milissegundos, unit="ms", errors="coerce")
+
+    @staticmethod
+    def _iso_simples(texto: np.ndarray) -> np.ndarray:
+        """Textos com forma AAAA-MM-DD, AAAA-MM-DD hh:mm ou AAAA-MM-DD hh:mm:ss (separados por espaço ou T).
+
+        Checa o tamanho, os dígitos e os separadores de cada posição, o que recusa campos sem zeros à
+        esquerda; os intervalos de dia, mês e hora ficam para o parser ISO 8601 do pandas.
+        """
+        tamanho = np.char.str_len(texto)
+        # Códigos unicode dos 19 primeiros caracteres, sem cópia; textos mais curtos terminam em zeros
+        largura = min(texto.dtype.itemsize // 4, 19)
+        codigos = texto.view(np.uint32).reshape(len(texto), -1)[:, :largura]
+
+        # Primeira posição que deveria ser dígito e não é; a forma vale até ali
+        molde = np.array([c == "d" for c in "dddd-dd-dd dd:dd:dd"[:largura]])
+        falha = ((codigos - ord("0")) >= 10) & molde
+        valida_ate = np.where(falha.any(axis=1), falha.argmax(axis=1), largura)
+
+        def caractere(posicao, *opcoes):
+            if posicao >= largura:
+                return np.zeros(len(texto), dtype=bool)
+            return np.isin(codigos[:, posicao], [ord(opcao) for opcao in opcoes])
+
+        data = caractere(4, "-") & caractere(7, "-") & (valida_ate >= np.minimum(tamanho, 19))
+        hora = caractere(10, "T", " ") & caractere(13, ":")
+        segundo = caractere(16, ":")
+        return data & ((tamanho == 10) | (hora & ((tamanho == 16) | (segundo & (tamanho == 19)))))
+
+    @staticmethod
+    def parse_datetime(serie: pd.Series) -> pd.Series:
+        """Converte a coluna pelas regras do campo datetime do pydantic; NaT onde o valor é inválido.
+
+        Aceita objetos date/datetime, textos ISO 8601 completos (AAAA-MM-DD com zeros, hora opcional
+        hh:mm[:ss[.f]] e fuso opcional) e timestamps unix (números ou textos só com dígitos, em segundos
+        ou milissegundos); booleanos, datas parciais (2024-01) ou sem zeros (2024-1-1) são recusados.
+        Diferenças: o resultado não tem fuso, então textos e datetimes com fuso ficam com a hora local
+        escrita (o fuso é descartado, sem conversão) e timestamps unix ficam em UTC; valores fora do
+        datetime64 do pandas (antes de 1677 ou depois de 2262) são recusados.
+        """
+        if pd.api.types.is_datetime64_any_dtype(serie):
+            return serie.dt.tz_localize(None) if serie.dt.tz is not None else serie
+        if pd.api.types.is_bool_dtype(serie):
+            return pd.Series(pd.NaT, index=serie.index, dtype="datetime64[ns]")
+        if pd.api.types.is_numeric_dtype(serie):
+            return OrdersValidator._from_unix(serie.astype("float64"))
+
+        # Montada por posição: cada forma de valor converte só as suas linhas
+        convertida = np.full(len(serie), np.datetime64("NaT"), dtype="datetime64[ns]")
+        preenchidos = serie.notna().to_numpy()
+        if pd.api.types.infer_dtype(serie, skipna=True) == "string":
+            textos = preenchidos
+        else:
+            textos = preenchidos & serie.astype(object).map(type).eq(str).to_numpy()
+        if textos.any():
+            posicoes = np.flatnonzero(textos)
+            valores = serie.iloc[posicoes].reset_index(drop=True)
+            # Formas mais comuns pelo parser do pandas; o resto passa pelas expressões regulares, mais lentas
+            simples = OrdersValidator._iso_simples(valores.to_numpy().astype("U"))
+            convertida[posicoes[simples]] = pd.to_datetime(valores[simples], format="ISO8601", errors="coerce").to_numpy()
+            # Textos só com dígitos são timestamps unix, como no pydantic (2024 é 1970-01-01 00:33:44)
+            unix = np.zeros(len(valores), dtype=bool)
+            unix[~simples] = valores[~simples].str.fullmatch(UNIX_TEXT).to_numpy(dtype=bool)
+            if unix.any():
+                convertida[posicoes[unix]] = OrdersValidator._from_unix(pd.to_numeric(valores[unix])).to_numpy()
+            partes = valores[~simples & ~unix].str.extract(ISO_DATETIME)
+            partes = partes[partes["data"].notna()]
+            if len(partes):
+                segundo = partes["segundo"].fillna("00")
+                texto = (
+                    partes["data"] + " " + partes["hora"].fillna("00:00") + ":" + segundo + "." + partes["fracao"].fillna("0")
+                )
+                # Formato exato: dia, mês ou hora fora do intervalo (2024-02-30, 24:00) viram NaT; o %S aceita 60
+                texto = texto.where(segundo < "60")
+                convertida[posicoes[partes.index]] = pd.to_datetime(texto, format="%Y-%m-%d %H:%M:%S.%f", errors="coerce").to_numpy()
+
+        outros = preenchidos & ~textos
+        if outros.any():
+            posicoes = np.flatnonzero(outros)
+            valores = serie.iloc[posicoes]
+            datas = valores.map(lambda v: isinstance(v, date)).to_numpy()
+            if datas.any():
+                # datetime com fuso fica com a hora local, como os textos
+                locais = valores[datas].map(lambda v: v.replace(tzinfo=None) if isinstance(v, datetime) else v)
+                convertida[posicoes[datas]] = pd.to_datetime(locais, errors="coerce").to_numpy()
+            numeros = ~datas & ~valores.map(type).eq(bool).to_numpy()
+            if numeros.any():
+                numerica = pd.to_numeric(valores[numeros], errors="coerce").astype("float64")
+                convertida[posicoes[numeros]] = OrdersValidator._from_unix(numerica).to_numpy()
+        return pd.Series(convertida, index=serie.index, name=serie.name)
+
+    @staticmethod
+    def _check_datetime(serie: pd.Series) -> list:
+        if pd.api.types.is_datetime64_any_dtype(serie):
+            return []
+        convertida = OrdersValidator.parse_datetime(serie)
+        return [(serie.notna() & convertida.isna(), "data inválida")]
+
+    @staticmethod
+    def _check_str(serie: pd.Series) -> list:
+        try:
+            # Em colunas object, .str.len() retorna NaN para valores que não são texto
+            return [(serie.notna() & serie.str.len().isna(), "deve ser texto")]
+        except AttributeError:
+            # O pandas recusa o acessor .str quando a coluna não tem nenhum texto
+            return [(serie.notna(), "deve ser texto")]
+
+    @staticmethod
+    def _check_int(serie: pd.Series, bounds: dict) -> list:
+        numerica = pd.to_numeric(serie, errors="coerce")
+        nao_numerica = serie.notna() & numerica.isna()
+        nao_inteira = numerica.notna() & (np.isinf(numerica) | (numerica % 1 != 0))
+        checks = [(nao_numerica | nao_inteira, "deve ser inteiro")]
+
+        comparacoes = {
+            "gt": (lambda s, v: s <= v, "deve ser maior que {}"),
+            "ge": (lambda s, v: s < v, "deve ser maior ou igual a {}"),
+            "lt": (lambda s, v: s >= v, "deve ser menor que {}"),
+            "le": (lambda s, v: s > v, "deve ser menor ou igual a {}"),
+        }
+        validos = numerica.notna() & ~nao_inteira
+        for bound, value in bounds.items():
+            falha, mensagem = comparacoes[bound]
+            checks.append((validos & falha(numerica, value), mensagem.format(value)))
+        return checks
+
+    def validate(self, df: pd.DataFrame, max_errors: int | None = None) -> ValidationErrors:
+        """Retorna as falhas por linha, numeradas como no Excel (índice + 2).
+
+        Com max_errors, só as falhas das primeiras max_errors linhas inválidas são mantidas.
+        """
+        mensagens = []
+        linhas, campos, regras = [], [], []
+
+        for nome, field in self.model.model_fields.items():
+            if nome not in df.columns:
+                if field.is_required():
+                    mensagens.append(f"Coluna obrigatória ausente no Excel: {nome}")
+                continue
+
+            serie = df[nome]
+            checks = [(serie.isna(), "valor ausente")]
+            if field.annotation is datetime:
+                checks += self._check_datetime(serie)
+            elif field.annotation is str:
+                checks += self._check_str(serie)
+            elif field.annotation is int:
+                checks += self._check_int(serie, self._field_rules(field))
+
+            for mask, regra in checks:
+                posicoes = np.flatnonzero(mask.to_numpy(dtype=bool))
+                linhas.append(posicoes)
+                # Coluna e regra entram como códigos de categoria, sem um texto por falha
+                campos.append(np.full(len(posicoes), nome, dtype=object))
+                regras.append(np.full(len(posicoes), regra, dtype=object))
+
+        errors = ValidationErrors(messages=mensagens)
+        if not linhas or not sum(len(posicoes) for posicoes in linhas):
+            return errors
+
+        posicoes = np.concatenate(linhas)
+        falhas = pd.DataFrame({
+            "linha": np.asarray(df.index)[posicoes] + 2,
+            "coluna": pd.Categorical(np.concatenate(campos)),
+            "regra": pd.Categorical(np.concatenate(regras)),
+        }).sort_values("linha", kind="stable")
+        errors.extend(ValidationErrors(falhas))
+        if max_errors is not None and errors.rows > max_errors:
+            errors.truncate(max_errors)
+        return errors
+
+    def validate_strict(self, df: pd.DataFrame) -> list:
+        """Validação linha a linha pelo pydantic. Lenta, mantida para testes de paridade."""
+        errors = []
+        for index, row in df.iterrows():
+            try:
+                _ = self.model(**row.to_dict())
+            except Exception as e:
+                errors.append(f"Erro na linha {index + 2}: {e}")
+        return errors
@@ -0,0 +1,37 @@
+from datetime import date
+
+import pytest
+
+from compute_backends import backend_parity
+from history_store import HistoryStore
+from synthetic import forecast_dates, generate_history, generate_top_forecast
+
+pytest.importorskip("duckdb")
+
+INICIO, FIM, ENTREGA = date(2024, 1, 1), date(2024, 4, 20), date(2024, 4, 21)
+
+
+@pytest.fixture(scope="module")
+def historico():
+    return generate_history(n_regions=6, n_days=120, seed=3)
+
+
+def assert_parity(relatorio):
+    divergentes = relatorio[relatorio["diferenca"].notna()]
+    assert divergentes.empty, divergentes.to_string()
+
+
+def test_duckdb_matches_pandas_on_dataframe(historico):
+    assert_parity(backend_parity(historico, INICIO, FIM, ENTREGA, incluir_mes_seguinte=True))
+
+
+def test_duckdb_matches_pandas_on_history_store(historico, tmp_path):
+    store = HistoryStore(str(tmp_path / "historico"))
+    store.append(historico)
+    assert_parity(backend_parity(store, INICIO, FIM, ENTREGA))
+
+
+def test_duckdb_matches_pandas_with_top_forecast(historico):
+    datas = forecast_dates(ENTREGA, 45)
+    previsao = generate_top_forecast(datas, sorted(historico["modal"].astype(str).unique()))
+    assert_parity(backend_parity(historico, INICIO, FIM, ENTREGA, incluir_mes_seguinte=True, top_forecasting=previsao))
@@ -0,0 +1,65 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from backend import DateUtils
+from compute_backends import FORECAST_KEYS
+from pipelines import run_baseline
+from sketches import approximate_baseline
+from synthetic import generate_history
+
+INICIO, FIM, ENTREGA = date(2024, 1, 1), date(2024, 7, 10), date(2024, 7, 11)
+
+
+@pytest.fixture(scope="module")
+def historico():
+    return generate_history(n_regions=8, n_days=200, seed=3)
+
+
+@pytest.fixture(scope="module")
+def exato(historico):
+    return run_baseline(historico.copy(), INICIO, FIM, ENTREGA)
+
+
+def ordenar(baseline: pd.DataFrame) -> pd.DataFrame:
+    chaves = baseline.assign(**{col: baseline[col].astype(str) for col in FORECAST_KEYS})
+    return chaves.sort_values(FORECAST_KEYS).reset_index(drop=True)
+
+
+def celulas_fora_do_limite(exato: pd.DataFrame, aproximado: pd.DataFrame, relative_accuracy: float) -> pd.DataFrame:
+    """Células (chave, data) com erro relativo acima de relative_accuracy.
+
+    Os dois baselines arredondam orders para inteiros, o que soma até 1 pedido de diferença além do erro
+    das medianas.
+    """
+    exato, aproximado = ordenar(exato), ordenar(aproximado)
+    assert exato[FORECAST_KEYS].equals(aproximado[FORECAST_KEYS])
+    datas = [col for col in exato.columns if col not in FORECAST_KEYS]
+    esperado = exato[datas].to_numpy(dtype="float64")
+    obtido = aproximado[datas].to_numpy(dtype="float64")
+    fora = np.abs(obtido - esperado) > relative_accuracy * np.abs(esperado) + 1
+    linhas, colunas = np.nonzero(fora)
+    return pd.DataFrame({
+        "linha": linhas,
+        "data": np.array(datas, dtype=object)[colunas],
+        "esperado": esperado[linhas, colunas],
+        "obtido": obtido[linhas, colunas],
+    })
+
+
+@pytest.mark.parametrize("relative_accuracy", [0.05, 0.01])
+def test_approximate_baseline_within_relative_accuracy(historico, exato, relative_accuracy):
+    dias_previsao = DateUtils.generate_dates_until_end_of_month(ENTREGA)
+    aproximado = approximate_baseline(historico.copy(), INICIO, FIM, dias_previsao, relative_accuracy)
+    fora = celulas_fora_do_limite(exato, aproximado, relative_accuracy)
+    assert fora.empty, fora.head(10).to_string()
+
+
+def test_bound_rejects_larger_error(exato):
+    # O limite não é folgado demais: um erro de 2% passa de uma precisão de 1%
+    datas = [col for col in exato.columns if col not in FORECAST_KEYS]
+    inflado = exato.copy()
+    inflado[datas] = (exato[datas] * 1.02).round(0) + 1
+    assert not celulas_fora_do_limite(exato, inflado, 0.01).empty